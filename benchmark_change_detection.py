@@ -0,0 +1,76 @@
+import logging
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from pie.core import ChangeDetector
+from pie.domain import MediaFileSummary, ScannedFile, ScannedFileType
+from pie.util import MiscUtils
+
+
+def create_files(file_count: int, touched_percent: float, shuffle: bool) -> Tuple[List[ScannedFile], List[MediaFileSummary]]:
+    # Every scanned file is indexed, touched_percent of them with a newer modification time. The index is read in its own order when shuffled.
+    base_time = datetime(2020, 1, 1)
+    touched_every = max(1, round(100 / touched_percent)) if touched_percent > 0 else 0
+    scanned_files = []
+    media_files = []
+    for file_num in range(file_count):
+        dir_path = "/library/{}/{}".format(file_num // 100000, file_num // 100)
+        file_path = "{}/img{}.jpg".format(dir_path, file_num)
+        file_time = base_time + timedelta(seconds=file_num)
+        indexed_time = file_time - timedelta(seconds=1) if touched_every and file_num % touched_every == 0 else file_time
+        scanned_files.append(ScannedFile(dir_path, file_path, "JPG", ScannedFileType.IMAGE, False, file_time, file_time, None, size=1000 + file_num))
+        media_files.append(MediaFileSummary(file_path, ScannedFileType.IMAGE.name, file_time, indexed_time, "{:040x}".format(file_num), MiscUtils.HASH_ALGORITHM_SHA1,
+                                            file_time, None, 1000 + file_num, None))
+    if shuffle:
+        random.Random(file_count).shuffle(media_files)
+    return (scanned_files, media_files)
+
+
+def detect_file_by_file(scanned_files: List[ScannedFile], media_files: List[MediaFileSummary], hash_algorithm: str) -> Tuple[List[int], List[int]]:
+    # The lookup IndexingHelper used before: a path lookup in the index for every scanned file and the checks of needs_hashing. Its per file
+    # log line is left out, as ChangeDetector.detect does not log per file, so that only the lookups are compared.
+    media_files_by_path = {media_file.file_path: media_file for media_file in media_files}
+    (touched, unchanged) = ([], [])
+    for (scanned_file_index, scanned_file) in enumerate(scanned_files):
+        media_file = media_files_by_path.get(scanned_file.file_path)
+        if media_file is None:
+            continue
+        if (scanned_file.creation_time != media_file.creation_time or scanned_file.last_modification_time != media_file.last_modification_time
+                or (media_file.original_file_hash_algorithm or MiscUtils.HASH_ALGORITHM_SHA1) != hash_algorithm):
+            touched.append(scanned_file_index)
+        else:
+            scanned_file.already_indexed = True
+            unchanged.append(scanned_file_index)
+    return (touched, unchanged)
+
+
+if __name__ == "__main__":
+    # Compares the per file index lookup with ChangeDetector.detect on synthetic libraries, where every file is indexed and a few were touched.
+    # Neither is timed with logging, the summary line of ChangeDetector.detect is below the WARNING level.
+    # Usage: python benchmark_change_detection.py [--files N,N,...] [--touched-percent N] [--shuffle true|false]
+    logging.basicConfig(level=logging.WARNING, format='[%(name)s] %(levelname)5s: %(message)s')
+    args = sys.argv[1:]
+    options = {"--files": "1000000,5000000", "--touched-percent": "1", "--shuffle": "false"}
+    while args:
+        if args[0] not in options or len(args) < 2:
+            sys.exit("Usage: python benchmark_change_detection.py [--files N,N,...] [--touched-percent N] [--shuffle true|false]")
+        options[args[0]] = args[1]
+        args = args[2:]
+
+    for file_count in [int(file_count) for file_count in options["--files"].split(",")]:
+        print("Creating {} scanned and indexed files".format(file_count))
+        (scanned_files, media_files) = create_files(file_count, float(options["--touched-percent"]), options["--shuffle"].lower() == "true")
+        start_time = time.time()
+        (expected_touched, expected_unchanged) = detect_file_by_file(scanned_files, media_files, MiscUtils.HASH_ALGORITHM_SHA1)
+        file_by_file_seconds = time.time() - start_time
+        print("{:<16} {:>9} files {:>9} touched {:>9.2f}s".format("File by file", file_count, len(expected_touched), file_by_file_seconds))
+        start_time = time.time()
+        change_set = ChangeDetector.detect(scanned_files, media_files, MiscUtils.HASH_ALGORITHM_SHA1)
+        seconds = time.time() - start_time
+        same_changes = "same changes" if (change_set.touched, change_set.unchanged) == (expected_touched, expected_unchanged) else "DIFFERENT CHANGES"
+        print("{:<16} {:>9} files {:>9} touched {:>9.2f}s {:>6.2f}x  {}".format("ChangeDetector", file_count, len(change_set.touched), seconds,
+                                                                               file_by_file_seconds / max(seconds, 1e-9), same_changes))
+        del scanned_files, media_files, change_set
@@ -0,0 +1,30 @@
+import logging
+import sys
+
+from pie.core import ConversionScheduler, IndexDB
+
+if __name__ == "__main__":
+    # Compares the makespan of the conversion orders on the conversions recorded in application logs, using the time each one took.
+    # Usage: python benchmark_conversion_order.py <application log> [<application log> ...] [--workers N]
+    logging.basicConfig(level=logging.INFO, format='[%(name)s] %(levelname)5s: %(message)s')
+    args = sys.argv[1:]
+    worker_count = None
+    if "--workers" in args:
+        worker_count_index = args.index("--workers")
+        worker_count = int(args[worker_count_index + 1])
+        del args[worker_count_index:worker_count_index + 2]
+    if not args:
+        sys.exit("Usage: python benchmark_conversion_order.py <application log> [<application log> ...] [--workers N]")
+
+    with IndexDB() as indexDB:
+        if worker_count is None:
+            worker_count = indexDB.get_settings().conversion_workers
+        recorded_jobs = ConversionScheduler.load_recorded_jobs(args, indexDB)
+    if not recorded_jobs:
+        sys.exit("No recorded conversions of indexed files found")
+
+    total_seconds = sum(seconds for (_, seconds) in recorded_jobs)
+    print("{} conversions, {:.1f}s in total, {} workers, {:.1f}s lower bound".format(len(recorded_jobs), total_seconds, worker_count,
+                                                                                  max(total_seconds / max(1, worker_count), max(seconds for (_, seconds) in recorded_jobs))))
+    for (policy, makespan) in sorted(ConversionScheduler.compare_policies(recorded_jobs, worker_count).items(), key=lambda item: item[1]):
+        print("{:<16} {:>10.1f}s".format(policy, makespan))
@@ -0,0 +1,91 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from pie.core import IndexingHelper
+from pie.domain import IndexingTask, ScannedFile, ScannedFileType, Settings
+
+
+def create_tree(root_dir: str, dir_count: int, files_per_dir: int):
+    # Nested a few levels deep, with a video of the same name next to every 10th image so that same name filtering is compared too
+    for dir_num in range(dir_count):
+        dir_path = os.path.join(root_dir, "d{}".format(dir_num % 10), "d{}".format(dir_num % 100), "d{}".format(dir_num))
+        os.makedirs(dir_path, exist_ok=True)
+        for file_num in range(files_per_dir):
+            file_names = ["img{}.jpg".format(file_num)] + (["img{}.mp4".format(file_num)] if file_num % 10 == 0 else [])
+            for file_name in file_names:
+                with open(os.path.join(dir_path, file_name), "wb") as file:
+                    file.write(b"\0")
+
+
+def walk_with_os_walk(settings: Settings) -> List[str]:
+    # The walker IndexingHelper used before: a single threaded os.walk, then a stat for the creation time and another for the modification time
+    file_paths = []
+    for (dir_path, _, file_names) in os.walk(settings.monitored_dir):
+        scanned_files_by_name: Dict[str, List[ScannedFile]] = {}
+        for file_name in file_names:
+            (file_name_without_extension, extension) = os.path.splitext(file_name)
+            extension = extension.replace(".", "").upper()
+            (scanned_file_type, is_raw) = ScannedFileType.get_type(settings.image_extensions, settings.image_raw_extensions, settings.video_extensions, settings.video_raw_extensions, extension)
+            if ScannedFileType.UNKNOWN != scanned_file_type:
+                file_path = os.path.join(dir_path, file_name)
+                creation_time = datetime.fromtimestamp(os.path.getctime(file_path))
+                last_modification_time = datetime.fromtimestamp(os.path.getmtime(file_path))
+                scanned_files_by_name.setdefault(file_name_without_extension, []).append(
+                    ScannedFile(dir_path, file_path, extension, scanned_file_type, is_raw, creation_time, last_modification_time, None))
+        for files in scanned_files_by_name.values():
+            file_paths.extend(file.file_path for file in files if not (settings.skip_same_name_video and len(files) > 1 and ScannedFileType.VIDEO == file.file_type))
+    return file_paths
+
+
+def walk_with_indexing_helper(settings: Settings) -> List[str]:
+    indexing_task = IndexingTask()
+    indexing_task.settings = settings
+    (scanned_files, _) = IndexingHelper(indexing_task, None, threading.Event()).scan_dirs()
+    return [scanned_file.file_path for scanned_file in scanned_files]
+
+
+if __name__ == "__main__":
+    # Compares the os.walk walker with the concurrent os.scandir walker of IndexingHelper, on a synthetic tree or on an existing directory.
+    # Usage: python benchmark_dir_scan.py [--dir <directory to scan>] [--dirs N] [--files-per-dir N] [--threads N,N,...]
+    logging.basicConfig(level=logging.WARNING, format='[%(name)s] %(levelname)5s: %(message)s')  # Every scanned file is logged at INFO
+    args = sys.argv[1:]
+    options = {"--dir": None, "--dirs": "2000", "--files-per-dir": "20", "--threads": "1,4,8,16"}
+    while args:
+        if args[0] not in options or len(args) < 2:
+            sys.exit("Usage: python benchmark_dir_scan.py [--dir <directory to scan>] [--dirs N] [--files-per-dir N] [--threads N,N,...]")
+        options[args[0]] = args[1]
+        args = args[2:]
+
+    temp_dir = None
+    settings = Settings()
+    if options["--dir"] is not None:
+        settings.monitored_dir = options["--dir"]
+    else:
+        temp_dir = tempfile.mkdtemp()
+        settings.monitored_dir = temp_dir
+        print("Creating {} directories of {} files in {}".format(options["--dirs"], options["--files-per-dir"], temp_dir))
+        create_tree(temp_dir, int(options["--dirs"]), int(options["--files-per-dir"]))
+    try:
+        # Run once first, so that every walker finds the directory entries in the same cache state
+        walk_with_os_walk(settings)
+        start_time = time.time()
+        expected_file_paths = walk_with_os_walk(settings)
+        os_walk_seconds = time.time() - start_time
+        print("{:<22} {:>9} files {:>9.2f}s".format("os.walk", len(expected_file_paths), os_walk_seconds))
+        for thread_count in [int(thread_count) for thread_count in options["--threads"].split(",")]:
+            settings.scan_threads = thread_count
+            start_time = time.time()
+            file_paths = walk_with_indexing_helper(settings)
+            seconds = time.time() - start_time
+            same_files = "same files" if file_paths == expected_file_paths else "DIFFERENT FILES"
+            print("{:<22} {:>9} files {:>9.2f}s {:>6.2f}x  {}".format("scandir {} threads".format(thread_count), len(file_paths), seconds, os_walk_seconds / max(seconds, 1e-9), same_files))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,63 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+from pie.util import MiscUtils
+
+HASH_ALGORITHMS = [MiscUtils.HASH_ALGORITHM_SHA1, MiscUtils.HASH_ALGORITHM_BLAKE2B, MiscUtils.HASH_ALGORITHM_XXH3, MiscUtils.HASH_ALGORITHM_SAMPLED]
+
+
+def create_files(dir_path: str, large_file_count: int, large_file_mb: int, small_file_count: int, small_file_kb: int) -> List[str]:
+    # Random content, like compressed media, written in 1MB blocks
+    file_paths = []
+    for (file_count, file_size, prefix) in ((large_file_count, large_file_mb * 1048576, "large"), (small_file_count, small_file_kb * 1024, "small")):
+        for file_num in range(file_count):
+            file_path = os.path.join(dir_path, "{}{}.bin".format(prefix, file_num))
+            with open(file_path, "wb") as file:
+                for block_start in range(0, file_size, 1048576):
+                    file.write(os.urandom(min(1048576, file_size - block_start)))
+            file_paths.append(file_path)
+    return file_paths
+
+
+if __name__ == "__main__":
+    # Measures the hashing throughput of every hash algorithm on a mix of large and small files, or on the files of an existing directory.
+    # Files just written are in the page cache, so that the CPU cost is measured. Use --dir on the library disk to include reading it.
+    # Usage: python benchmark_hash_modes.py [--dir <directory>] [--large-files N] [--large-file-mb N] [--small-files N] [--small-file-kb N]
+    logging.basicConfig(level=logging.INFO, format='[%(name)s] %(levelname)5s: %(message)s')
+    usage = "Usage: python benchmark_hash_modes.py [--dir <directory>] [--large-files N] [--large-file-mb N] [--small-files N] [--small-file-kb N]"
+    args = sys.argv[1:]
+    options = {"--dir": None, "--large-files": "4", "--large-file-mb": "256", "--small-files": "500", "--small-file-kb": "256"}
+    while args:
+        if args[0] not in options or len(args) < 2:
+            sys.exit(usage)
+        options[args[0]] = args[1]
+        args = args[2:]
+
+    temp_dir = None
+    if options["--dir"] is not None:
+        file_paths = [os.path.join(dir_path, file_name) for (dir_path, _, file_names) in os.walk(options["--dir"]) for file_name in file_names]
+    else:
+        temp_dir = tempfile.mkdtemp()
+        print("Creating {} files of {}MB and {} files of {}KB in {}".format(options["--large-files"], options["--large-file-mb"], options["--small-files"], options["--small-file-kb"], temp_dir))
+        file_paths = create_files(temp_dir, int(options["--large-files"]), int(options["--large-file-mb"]), int(options["--small-files"]), int(options["--small-file-kb"]))
+    try:
+        total_mb = sum(os.path.getsize(file_path) for file_path in file_paths) / 1048576
+        print("{} files, {:.0f}MB".format(len(file_paths), total_mb))
+        for configured_algorithm in HASH_ALGORITHMS:
+            algorithm = MiscUtils.get_hash_algorithm(configured_algorithm)
+            if algorithm != configured_algorithm:
+                continue  # Not available, the fallback is measured on its own
+            start_time = time.time()
+            for file_path in file_paths:
+                MiscUtils.generate_hash(file_path, algorithm)
+            seconds = max(time.time() - start_time, 1e-9)
+            # The sampled mode reads only part of the large files, its MB/s is of the files covered, not of the bytes read
+            print("{:<10} {:>9.2f}s {:>10.0f} MB/s {:>10.0f} files/s".format(algorithm, seconds, total_mb / seconds, len(file_paths) / seconds))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,120 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing import Lock, Manager, Process, Queue
+
+from pie.core import IndexDB, IndexDBWriter
+from pie.domain import MediaFile, ScannedFileType
+from pie.util import MiscUtils, ParentQueue, PyProcessPool
+
+ROWS_PER_TASK = 25  # Files per indexing task, as with the default indexing_batch_size
+
+
+def create_media_file(row_num: int) -> MediaFile:
+    media_file = MediaFile()
+    media_file.parent_dir_path = "/library/{}".format(row_num // 100)
+    media_file.file_path = "/library/{}/img{}.jpg".format(row_num // 100, row_num)
+    media_file.extension = "JPG"
+    media_file.file_type = ScannedFileType.IMAGE.name
+    media_file.is_raw = False
+    media_file.mime = "image/jpeg"
+    media_file.original_size = 5000000 + row_num
+    media_file.creation_time = media_file.last_modification_time = media_file.index_time = datetime.now()
+    media_file.original_file_hash = "{:040x}".format(row_num)
+    media_file.capture_date = datetime(2020, 1, 1)
+    (media_file.width, media_file.height) = (6000, 4000)
+    (media_file.camera_make, media_file.camera_model) = ("Canon", "Canon EOS R5")
+    return media_file
+
+
+def insert_rows_one_by_one(row_nums: range, db_write_lock: Lock):
+    # How workers wrote before the IndexDBWriter: their own IndexDB, one commit per row, serialized through a Manager lock
+    indexDB = IndexDB()
+    for row_num in row_nums:
+        media_file = create_media_file(row_num)
+        with db_write_lock:
+            indexDB.insert_media_file(media_file)
+    indexDB.disconnect_db()
+
+
+def init_writer_worker() -> IndexDB:
+    return IndexDB.create_instance(ParentQueue())
+
+
+def insert_rows_through_writer(row_nums: range, indexDB: IndexDB, task_id: str):
+    for row_num in row_nums:
+        indexDB.insert_media_file(create_media_file(row_num))
+
+
+def benchmark_one_by_one(row_count: int, worker_count: int) -> float:
+    db_write_lock = Manager().Lock()
+    processes = [Process(target=insert_rows_one_by_one, args=(range(worker_num, row_count, worker_count), db_write_lock)) for worker_num in range(worker_count)]
+    start_time = time.time()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return time.time() - start_time
+
+
+def benchmark_writer(row_count: int, worker_count: int, log_queue: Queue) -> float:
+    with IndexDBWriter() as db_writer:
+        pool = PyProcessPool(pool_name="BenchmarkWorker", process_count=worker_count, log_queue=log_queue, target=insert_rows_through_writer,
+                             initializer=init_writer_worker, terminator=IndexDB.destroy_instance, message_handler=db_writer.queue.put)
+        pool.wait_until_ready()  # Worker startup is not part of the write time, as the workers of the app stay warm
+        start_time = time.time()
+        for row_start in range(0, row_count, ROWS_PER_TASK):
+            pool.put((range(row_start, min(row_count, row_start + ROWS_PER_TASK)),))
+        pool.close()
+        pool.wait_and_get_results()
+        db_writer.flush()
+        return time.time() - start_time
+
+
+def count_rows() -> int:
+    with IndexDB() as indexDB:
+        return len(indexDB.get_media_file_summaries_by_path())
+
+
+if __name__ == "__main__":
+    # Measures the rows written per second by worker processes inserting synthetic media files, each committing its own rows under a lock
+    # as before, and through the IndexDBWriter. Each run writes to a new IndexDB in a temporary directory.
+    # Usage: python benchmark_index_db_writer.py [--rows N] [--workers N]
+    multiprocessing.set_start_method('spawn')
+    logging.basicConfig(level=logging.WARNING, format='[%(name)s] %(levelname)5s: %(message)s')
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.WARNING)  # Also for the records of the workers, which log at every level
+    args = sys.argv[1:]
+    options = {"--rows": "100000", "--workers": str(MiscUtils.get_default_worker_count())}
+    while args:
+        if args[0] not in options or len(args) < 2:
+            sys.exit("Usage: python benchmark_index_db_writer.py [--rows N] [--workers N]")
+        options[args[0]] = args[1]
+        args = args[2:]
+    (row_count, worker_count) = (int(options["--rows"]), int(options["--workers"]))
+
+    log_queue = Manager().Queue()
+    logger_thread = threading.Thread(target=MiscUtils.logger_thread_exec, args=(log_queue,))
+    logger_thread.start()
+    cwd = os.getcwd()
+    try:
+        for (name, benchmark) in (("One by one", lambda: benchmark_one_by_one(row_count, worker_count)),
+                                  ("IndexDBWriter", lambda: benchmark_writer(row_count, worker_count, log_queue))):
+            temp_dir = tempfile.mkdtemp()
+            os.chdir(temp_dir)  # The IndexDB is kept under app_data in the working directory, which the workers inherit
+            try:
+                IndexDB().disconnect_db()  # Creates the schema before the workers start
+                seconds = benchmark()
+                print("{:<14} {:>9} rows {:>9.2f}s {:>10.0f} rows/s".format(name, count_rows(), seconds, row_count / max(seconds, 1e-9)))
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    finally:
+        log_queue.put(None)
+        logger_thread.join()
@@ -1,4 +1,14 @@
+from pie.core.change_detector import ChangeDetector, ChangeSet
+from pie.core.conversion_scheduler import ConversionScheduler
 from pie.core.exif_helper import ExifHelper
+from pie.core.exif_tool_daemon import ExifToolDaemon
+from pie.core.hash_cache import HashCache
 from pie.core.index_db import IndexDB
+from pie.core.index_db_writer import IndexDBWriter
 from pie.core.indexing_helper import IndexingHelper
+from pie.core.indexing_pipeline import IndexingPipeline
 from pie.core.media_processor import MediaProcessor
+from pie.core.native_exif_reader import NativeExifReader
+from pie.core.output_path_allocator import OutputPathAllocator
+from pie.core.resource_budget import ResourceBudget
+from pie.core.worker_pool_service import WorkerLane, WorkerPoolService
@@ -0,0 +1,45 @@
+import logging
+from logging import Logger
+from typing import List
+
+from pie.domain import MediaFileSummary, ScannedFile
+from pie.util import MiscUtils
+
+
+class ChangeSet:
+    """Result of comparing a scan with the index. Entries are positions in the compared scanned file and media file lists."""
+
+    def __init__(self, touched: List[int], unchanged: List[int], media_file_indices: List[int]):
+        self.touched = touched  # Scanned files whose stat or hash algorithm differs from the index, they have to be hashed
+        self.unchanged = unchanged  # Scanned files matching the index
+        self.media_file_indices = media_file_indices  # Media file position for each scanned file, -1 when not indexed
+
+
+class ChangeDetector:
+    __logger: Logger = logging.getLogger('ChangeDetector')
+
+    @staticmethod
+    def is_touched(scanned_file: ScannedFile, media_file: MediaFileSummary) -> bool:
+        return (scanned_file.creation_time != media_file.creation_time or scanned_file.last_modification_time != media_file.last_modification_time
+                or (scanned_file.size is not None and media_file.original_size is not None and scanned_file.size != media_file.original_size))
+
+    @staticmethod
+    def is_hashed_with(media_file: MediaFileSummary, hash_algorithm: str) -> bool:
+        return (media_file.original_file_hash_algorithm or MiscUtils.HASH_ALGORITHM_SHA1) == hash_algorithm
+
+    @staticmethod
+    def detect(scanned_files: List[ScannedFile], media_files: List[MediaFileSummary], hash_algorithm: str, verify: bool = False) -> ChangeSet:
+        # A single merge pass over both sides. Unlike columnar (NumPy) comparisons, no column has to be built from the file objects first.
+        media_file_indices_by_path = {media_file.file_path: media_file_index for (media_file_index, media_file) in enumerate(media_files)}
+        media_file_indices = [media_file_indices_by_path.get(scanned_file.file_path, -1) for scanned_file in scanned_files]
+        (touched, unchanged) = ([], [])
+        for (scanned_file_index, (scanned_file, media_file_index)) in enumerate(zip(scanned_files, media_file_indices)):
+            if media_file_index < 0:
+                continue  # Not indexed yet
+            media_file = media_files[media_file_index]
+            if verify or ChangeDetector.is_touched(scanned_file, media_file) or not ChangeDetector.is_hashed_with(media_file, hash_algorithm):
+                touched.append(scanned_file_index)
+            else:
+                unchanged.append(scanned_file_index)
+        ChangeDetector.__logger.info("Detected changes: %s touched, %s unchanged, %s not indexed", len(touched), len(unchanged), len(scanned_files) - len(touched) - len(unchanged))
+        return ChangeSet(touched, unchanged, media_file_indices)
@@ -0,0 +1,101 @@
+import heapq
+import logging
+import os
+import re
+from logging import Logger
+from typing import Dict, Iterable, List, Tuple
+
+from pie.domain import MediaFileSummary, ScannedFileType
+
+from .index_db import IndexDB
+
+
+class ConversionScheduler:
+    """Orders the conversions of a run and spreads the videos over the GPUs.
+
+    Policies, selected with Settings.conversion_order:
+    - "Capture Date": oldest first, the order the IndexDB returns the files in.
+    - "Longest First": longest processing time first, so that long videos do not start last and keep one worker busy after all the
+      others are done. The time is estimated from video_duration, or from original_size.
+    - "Newest First": the most recent files are available first.
+    - "Directory Order": the files of a directory one after the other, so that the disk reads ahead.
+    Output names are allocated before the conversions are ordered, so that the policy never changes them. The streaming pipeline
+    orders the conversions of each flush window, see MediaProcessor.queue_conversion.
+    """
+    __logger: Logger = logging.getLogger('ConversionScheduler')
+    CAPTURE_DATE = "Capture Date"
+    LONGEST_FIRST = "Longest First"
+    NEWEST_FIRST = "Newest First"
+    DIRECTORY_ORDER = "Directory Order"
+    POLICIES = (CAPTURE_DATE, LONGEST_FIRST, NEWEST_FIRST, DIRECTORY_ORDER)
+    # Rough seconds of one worker, only used to compare conversions with each other
+    __IMAGE_BASE_SECONDS = 0.3
+    __IMAGE_SECONDS_PER_MB = 0.05
+    __VIDEO_SECONDS_PER_SECOND = 1.0
+    __VIDEO_SECONDS_PER_MB = 0.5  # For videos without a known duration
+    __CONVERTED_LOG_PATTERN = re.compile(r"Converted \S+: (.+?) -> .+ \([\d.]+%\) \(([\d.]+)s\)$")
+
+    def __init__(self, gpu_count: int = 0):
+        self.__gpu_seconds: List[float] = [0.0] * gpu_count
+
+    @staticmethod
+    def estimate_seconds(media_file: MediaFileSummary) -> float:
+        size_mb = (media_file.original_size or 0) / 1048576
+        if ScannedFileType.VIDEO.name == media_file.file_type:
+            if media_file.video_duration:
+                return media_file.video_duration / 1000 * ConversionScheduler.__VIDEO_SECONDS_PER_SECOND
+            return size_mb * ConversionScheduler.__VIDEO_SECONDS_PER_MB
+        return ConversionScheduler.__IMAGE_BASE_SECONDS + size_mb * ConversionScheduler.__IMAGE_SECONDS_PER_MB
+
+    @staticmethod
+    def order(media_files: List[MediaFileSummary], policy: str) -> List[MediaFileSummary]:
+        """Returns the media files in the order of the policy. Media files are expected in capture date order."""
+        if policy == ConversionScheduler.CAPTURE_DATE:
+            return list(media_files)
+        elif policy == ConversionScheduler.LONGEST_FIRST:
+            return sorted(media_files, key=ConversionScheduler.estimate_seconds, reverse=True)
+        elif policy == ConversionScheduler.NEWEST_FIRST:
+            # Files without a capture date go last, the others keep the order of their file paths for the same capture date
+            dated_media_files = [media_file for media_file in media_files if media_file.capture_date]
+            undated_media_files = [media_file for media_file in media_files if not media_file.capture_date]
+            return sorted(dated_media_files, key=lambda media_file: media_file.capture_date, reverse=True) + undated_media_files
+        elif policy == ConversionScheduler.DIRECTORY_ORDER:
+            return sorted(media_files, key=lambda media_file: os.path.split(media_file.file_path))
+        else:
+            raise RuntimeError("Conversion order '{}' is not supported".format(policy))
+
+    def assign_gpu(self, media_file: MediaFileSummary) -> int:
+        """Returns the GPU with the least estimated work assigned so far and adds the media file to it."""
+        target_gpu = min(range(len(self.__gpu_seconds)), key=self.__gpu_seconds.__getitem__)
+        self.__gpu_seconds[target_gpu] += ConversionScheduler.estimate_seconds(media_file)
+        return target_gpu
+
+    @staticmethod
+    def simulate_makespan(job_seconds: Iterable[float], worker_count: int) -> float:
+        """Returns the seconds until the last job is done when each job in turn goes to the first free worker, as in the pools."""
+        worker_free_times = [0.0] * max(1, worker_count)
+        for seconds in job_seconds:
+            heapq.heappush(worker_free_times, heapq.heappop(worker_free_times) + seconds)
+        return max(worker_free_times)
+
+    @staticmethod
+    def compare_policies(recorded_jobs: List[Tuple[MediaFileSummary, float]], worker_count: int) -> Dict[str, float]:
+        """Simulates the recorded conversions, with the seconds they took, in the order of each policy and returns the makespans."""
+        seconds_by_path = {media_file.file_path: seconds for (media_file, seconds) in recorded_jobs}
+        media_files = sorted((media_file for (media_file, _) in recorded_jobs), key=lambda media_file: (media_file.capture_date is not None, media_file.capture_date, media_file.file_path))
+        return {policy: ConversionScheduler.simulate_makespan((seconds_by_path[media_file.file_path] for media_file in ConversionScheduler.order(media_files, policy)), worker_count)
+                for policy in ConversionScheduler.POLICIES}
+
+    @staticmethod
+    def load_recorded_jobs(log_file_paths: List[str], indexDB: IndexDB) -> List[Tuple[MediaFileSummary, float]]:
+        """Reads the conversions from application logs, with the seconds they took, for the files still in the IndexDB. The last conversion of a file is kept."""
+        seconds_by_path = {}
+        for log_file_path in log_file_paths:
+            with open(log_file_path, encoding="utf-8", errors="replace") as log_file:
+                for line in log_file:
+                    match = ConversionScheduler.__CONVERTED_LOG_PATTERN.search(line.rstrip("\r\n"))
+                    if match:
+                        seconds_by_path[match.group(1)] = float(match.group(2))
+        recorded_jobs = [(media_file, seconds_by_path[media_file.file_path]) for media_file in indexDB.iter_media_file_summaries() if media_file.file_path in seconds_by_path]
+        ConversionScheduler.__logger.info("Found %s recorded conversions, %s of them for indexed files", len(seconds_by_path), len(recorded_jobs))
+        return recorded_jobs
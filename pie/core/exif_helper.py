@@ -3,23 +3,50 @@ import logging
 import mimetypes
 import os
 import re
-import subprocess
 from datetime import datetime
+from typing import List
 
 from dateutil.parser import parse
 from dateutil.tz import UTC
 
 from pie.domain import MediaFile, ScannedFile, ScannedFileType
-from pie.util import MiscUtils
+from pie.util import MiscUtils, SubprocessSupervisor
+
+from .exif_tool_daemon import ExifToolDaemon
+from .native_exif_reader import NativeExifReader
 
 
 class ExifHelper:
     __logger = logging.getLogger('ExifHelper')
+    __exiftool_daemon: ExifToolDaemon = None
+    # Only the tags read by create_media_file are requested from exiftool
+    __EXIF_TAGS = ["Error", "FileType", "MIMEType", "DefaultCropSize", "ImageWidth", "ImageHeight", "ExifImageWidth", "ExifImageHeight",
+                   "DateTimeOriginal", "MediaCreateDate", "TrackCreateDate", "Make", "Model", "LensModel", "LensType", "LensInfo",
+                   "GPSAltitude", "GPSAltitudeRef", "GPSLatitude", "GPSLongitude", "Orientation", "CameraOrientation",
+                   "Duration", "MediaDuration", "TrackDuration", "Rotation"]
+
+    @staticmethod
+    def start_exiftool_daemon(path_exiftool: str):
+        ExifHelper.stop_exiftool_daemon()
+        try:
+            daemon = ExifToolDaemon(path_exiftool)
+            daemon.start()
+            ExifHelper.__exiftool_daemon = daemon
+        except:
+            ExifHelper.__logger.exception("Failed to start exiftool daemon. Falling back to one exiftool process per file.")
 
     @staticmethod
-    def create_media_file(path_exiftool: str, index_time: datetime, scanned_file: ScannedFile, existing_media_file: MediaFile) -> MediaFile:
+    def stop_exiftool_daemon():
+        if ExifHelper.__exiftool_daemon is not None:
+            ExifHelper.__exiftool_daemon.stop()
+            ExifHelper.__exiftool_daemon = None
+
+    @staticmethod
+    def create_media_file(path_exiftool: str, index_time: datetime, scanned_file: ScannedFile, existing_media_file: MediaFile, exif: dict = None,
+                          hash_algorithm: str = MiscUtils.HASH_ALGORITHM_SHA1, timeout_factor: float = 1.0) -> MediaFile:
         file_path = scanned_file.file_path
-        exif = ExifHelper.__get_exif_dict(path_exiftool, file_path)
+        if exif is None:
+            exif = ExifHelper.get_exif_dicts(path_exiftool, [scanned_file], timeout_factor=timeout_factor)[0]
         error_str = ExifHelper.__get_exif(exif, "Error")
         exif_file_type_str = ExifHelper.__get_exif(exif, "FileType")
         if error_str:
@@ -39,8 +66,11 @@ class ExifHelper:
         media_file.original_size = os.path.getsize(file_path)
         media_file.creation_time = scanned_file.creation_time
         media_file.last_modification_time = scanned_file.last_modification_time
-        media_file.original_file_hash = scanned_file.hash if (scanned_file.hash is not None) else MiscUtils.generate_hash(file_path)
+        media_file.original_file_hash = scanned_file.hash if (scanned_file.hash is not None) else MiscUtils.generate_hash(file_path, hash_algorithm)
+        media_file.original_file_hash_algorithm = hash_algorithm
         media_file.converted_file_hash = None
+        media_file.converted_file_size = None
+        media_file.converted_file_mtime_ns = None
         media_file.conversion_settings_hash = None
         media_file.index_time = index_time
         ExifHelper.__append_dimentions(media_file, exif)
@@ -60,30 +90,52 @@ class ExifHelper:
         return media_file
 
     @staticmethod
-    def __get_exif_dict(path_exiftool: str, file_path: str):
-        json = ExifHelper.__get_json_from_exiftool(path_exiftool, file_path)[0]
-        exif = {}
-        for key, value in json.items():
-            key_parts = key.split(":")
-            modified_key = key_parts[1] if len(key_parts) > 1 else key_parts[0]
-            exif[modified_key] = value
-        return exif
+    def get_exif_dicts(path_exiftool: str, scanned_files: List[ScannedFile], fast: bool = False, use_native_reader: bool = False, timeout_factor: float = 1.0) -> List[dict]:
+        """Read the tags used by create_media_file for all files using a single exiftool call.
 
-    @staticmethod
-    def __get_json_from_exiftool(path_exiftool: str, filename: str):
-        """ Return a json value of the exif
+        Returns one dict per scanned file (in the same order). The dict is empty if exiftool didn't return anything for the file.
+        With use_native_reader, plain JPEG / TIFF / HEIC headers are parsed in-process and only the remaining files go to exiftool.
+        The exiftool timeout follows the size of the files, scaled by timeout_factor.
+        """
+        exif_dicts: List[dict] = [None] * len(scanned_files)
+        if use_native_reader:
+            for file_num, scanned_file in enumerate(scanned_files):
+                if not scanned_file.is_raw and scanned_file.extension in NativeExifReader.SUPPORTED_EXTENSIONS:
+                    exif_dicts[file_num] = NativeExifReader.read_exif(scanned_file.file_path)
+        exiftool_file_nums = [file_num for file_num, exif in enumerate(exif_dicts) if exif is None]
+        if len(exiftool_file_nums) == 0:
+            return exif_dicts
 
-        Get a filename and return a JSON object
+        file_paths = [os.path.abspath(scanned_files[file_num].file_path) for file_num in exiftool_file_nums]
+        args = ['-j']
+        if fast:
+            args.append('-fast2')
+        args.extend('-' + tag for tag in ExifHelper.__EXIF_TAGS)
+        args.extend(file_paths)
+        exif_by_path = {}
+        timeout = SubprocessSupervisor.get_timeout(SubprocessSupervisor.EXIFTOOL, sum(map(os.path.getsize, file_paths)), timeout_factor)
+        for json_entry in ExifHelper.__get_json_from_exiftool(path_exiftool, args, timeout) or []:
+            exif = {}
+            for key, value in json_entry.items():
+                key_parts = key.split(":")
+                modified_key = key_parts[1] if len(key_parts) > 1 else key_parts[0]
+                exif[modified_key] = value
+            exif_by_path[ExifHelper.__normalize_path(exif.get('SourceFile', ''))] = exif
+        for file_num, file_path in zip(exiftool_file_nums, file_paths):
+            exif_dicts[file_num] = exif_by_path.get(ExifHelper.__normalize_path(file_path), {})
+        return exif_dicts
 
-        Arguments:
-            filename {string} -- your filename
+    @staticmethod
+    def __normalize_path(file_path: str) -> str:
+        return os.path.normcase(os.path.normpath(file_path))
 
-        Returns:
-            [JSON] -- Return a JSON object
-        """
-        #Process this function
-        filename = os.path.abspath(filename)
-        output = ExifHelper.__run_exiftool_command_line([path_exiftool, '-G', '-j', '-sort', filename])
+    @staticmethod
+    def __get_json_from_exiftool(path_exiftool: str, args: List[str], timeout: float = None):
+        daemon = ExifHelper.__exiftool_daemon
+        if daemon is not None and daemon.path_exiftool == path_exiftool:
+            output = daemon.execute(args, timeout)
+        else:
+            output = ExifHelper.__run_exiftool_command_line([path_exiftool] + args, timeout)
         if output:
             #convert bytes to string
             output = output.decode('utf-8').rstrip('\r\n')
@@ -92,23 +144,18 @@ class ExifHelper:
             return output
 
     @staticmethod
-    def __run_exiftool_command_line(cmd):
+    def __run_exiftool_command_line(cmd, timeout: float = None):
         """Handle the command line call
 
         keyword arguments:
         cmd = a list
+        timeout = seconds after which exiftool is killed and RuntimeError is raised
 
         return
-        0 if error
-        or a string for the command line output
+        a string for the command line output
         """
-        try:
-            output = subprocess.Popen(cmd, **MiscUtils.subprocess_args())
-            output = output.stdout.read()
-            return output.strip()
-
-        except subprocess.CalledProcessError:
-            return 0
+        # exiftool exits with 1 when some of the files could not be read, the output still has the others
+        return SubprocessSupervisor.run(SubprocessSupervisor.EXIFTOOL, cmd, "EXIF read failed", timeout, check=False).stdout.strip()
 
     @staticmethod
     def __get_mime(file_path: str, exif: dict):
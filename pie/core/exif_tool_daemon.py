@@ -0,0 +1,121 @@
+import logging
+import queue
+import subprocess
+import threading
+import time
+from logging import Logger
+from typing import List
+
+from pie.util import MiscUtils, SubprocessSupervisor
+
+
+class ExifToolDaemon:
+    """Long-lived exiftool process running in ``-stay_open True -@ -`` mode.
+
+    Arguments for each request are streamed over stdin and the output is read until the
+    ``{ready<N>}`` marker that exiftool prints after every ``-execute<N>``. The process is
+    restarted automatically if it exits. A request that does not complete within its timeout,
+    or when the stop event of the SubprocessSupervisor is set, kills the process and raises
+    RuntimeError, as the tools run by the SubprocessSupervisor do. The next request starts it again.
+    """
+    __logger: Logger = logging.getLogger('ExifToolDaemon')
+    __READY_MARKER_FORMAT = "{{ready{}}}"
+    __POLL_SECONDS = 0.2
+
+    def __init__(self, path_exiftool: str, max_restarts: int = 3):
+        self.path_exiftool = path_exiftool
+        self.__max_restarts = max_restarts
+        self.__process: subprocess.Popen = None
+        self.__stdout_lines: queue.Queue = None
+        self.__execute_num = 0
+
+    def start(self):
+        if self.is_running():
+            return
+        self.__process = subprocess.Popen([self.path_exiftool, "-stay_open", "True", "-@", "-", "-common_args", "-charset", "filename=utf8"], **MiscUtils.subprocess_args())
+        self.__stdout_lines = queue.Queue()
+        threading.Thread(target=ExifToolDaemon.__read_lines, args=(self.__process.stdout, self.__stdout_lines), daemon=True).start()
+        threading.Thread(target=ExifToolDaemon.__drain_stderr, args=(self.__process.stderr,), daemon=True).start()
+        ExifToolDaemon.__logger.debug("Started exiftool daemon with PID %s", self.__process.pid)
+
+    def stop(self, graceful: bool = True):
+        if self.__process is None:
+            return
+        process = self.__process
+        self.__process = None
+        try:
+            if graceful and process.poll() is None:
+                process.stdin.write(b"-stay_open\nFalse\n")
+                process.stdin.flush()
+                process.wait(timeout=10)
+        except:
+            ExifToolDaemon.__logger.debug("Failed to stop exiftool daemon gracefully, killing it")
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        ExifToolDaemon.__logger.debug("Stopped exiftool daemon with PID %s", process.pid)
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_running(self) -> bool:
+        return self.__process is not None and self.__process.poll() is None
+
+    def execute(self, args: List[str], timeout: float = None) -> bytes:
+        """Returns the output of exiftool for the arguments. Raises RuntimeError if it does not complete within the timeout or is stopped."""
+        attempt = 0
+        while True:
+            try:
+                self.start()
+                return self.__execute_once(args, timeout)
+            except (OSError, EOFError):
+                attempt += 1
+                if attempt > self.__max_restarts:
+                    raise
+                ExifToolDaemon.__logger.warning("exiftool daemon failed, restarting (attempt %s/%s)", attempt, self.__max_restarts, exc_info=True)
+                self.stop(graceful=False)
+
+    def __execute_once(self, args: List[str], timeout: float = None) -> bytes:
+        self.__execute_num += 1
+        ready_marker = ExifToolDaemon.__READY_MARKER_FORMAT.format(self.__execute_num).encode()
+        request = "\n".join(args + ["-execute{}".format(self.__execute_num)]) + "\n"
+        start_time = time.time()
+        deadline = start_time + timeout if timeout is not None else None
+        self.__process.stdin.write(request.encode('utf-8'))
+        self.__process.stdin.flush()
+
+        output_lines = []
+        error = None
+        while True:
+            try:
+                line = self.__stdout_lines.get(timeout=ExifToolDaemon.__POLL_SECONDS)
+            except queue.Empty:
+                if SubprocessSupervisor.is_stopped():
+                    error = "EXIF read failed: Stopped"
+                elif deadline is not None and time.time() > deadline:
+                    error = "EXIF read failed: Timed out after {:.0f}s".format(timeout)
+                else:
+                    continue
+                break
+            if line is None:
+                raise EOFError("exiftool exited unexpectedly")
+            if line.rstrip(b"\r\n") == ready_marker:
+                break
+            output_lines.append(line)
+        SubprocessSupervisor.record(SubprocessSupervisor.EXIFTOOL, time.time() - start_time, error is not None)
+        if error is not None:
+            self.stop(graceful=False)
+            raise RuntimeError("{}: Arguments: {}".format(error, subprocess.list2cmdline(args)))
+        return b"".join(output_lines).strip()
+
+    @staticmethod
+    def __read_lines(stream, lines: queue.Queue):
+        for line in iter(stream.readline, b""):
+            lines.put(line)
+        lines.put(None)
+
+    @staticmethod
+    def __drain_stderr(stream):
+        for line in iter(stream.readline, b""):
+            ExifToolDaemon.__logger.debug("exiftool: %s", line.decode('utf-8', errors='replace').rstrip())
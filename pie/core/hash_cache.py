@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+from logging import Logger
+from typing import Dict, Optional, Tuple
+
+from pie.domain import FileHash
+from pie.util import MiscUtils
+
+from .index_db import IndexDB
+
+
+class HashCache:
+    """Original file hashes keyed by the (device, inode, size, mtime_ns) stat fingerprint and the hash algorithm.
+
+    A file whose fingerprint is unchanged is not read again, even if its ctime moved because of permission or xattr updates.
+    In verify mode the cache is ignored and every file is hashed in full, refreshing the cached entries.
+    """
+    __logger: Logger = logging.getLogger('HashCache')
+
+    def __init__(self, indexDB: IndexDB, verify: bool = False):
+        self.__verify = verify
+        self.__file_hashes: Dict[Tuple[int, int, int, int, str], FileHash] = {} if verify else indexDB.get_file_hashes()
+        self.__new_file_hashes: Dict[Tuple[int, int, int, int, str], FileHash] = {}
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()  # get_hash is called from the hashing threads
+
+    @property
+    def verify(self) -> bool:
+        return self.__verify
+
+    @staticmethod
+    def get_fingerprint(file_stat: os.stat_result) -> Tuple[int, int, int, int]:
+        return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+    @staticmethod
+    def create_file_hash(file_path: str, fingerprint: Tuple[int, int, int, int], hash_algorithm: str, file_hash: str) -> Optional[FileHash]:
+        # Only cache the hash if the file did not change while it was being read
+        if HashCache.get_fingerprint(os.stat(file_path)) != fingerprint:
+            HashCache.__logger.warning("File changed while hashing, not caching: %s", file_path)
+            return None
+        (device, inode, size, modification_time_ns) = fingerprint
+        return FileHash(device=device, inode=inode, size=size, modification_time_ns=modification_time_ns, hash_algorithm=hash_algorithm, file_path=file_path, hash=file_hash)
+
+    @staticmethod
+    def hash_file(file_path: str, hash_algorithm: str, fingerprint: Tuple[int, int, int, int] = None) -> Tuple[str, Optional[FileHash]]:
+        """Hashes a file and returns the FileHash to cache, stamped with the fingerprint taken just before reading it. There is no FileHash
+        if the fingerprint taken after reading it differs, as the hash may then belong to neither version of the file."""
+        if fingerprint is None:
+            fingerprint = HashCache.get_fingerprint(os.stat(file_path))
+        file_hash = MiscUtils.generate_hash(file_path, hash_algorithm)
+        return (file_hash, HashCache.create_file_hash(file_path, fingerprint, hash_algorithm, file_hash))
+
+    def get_hash(self, file_path: str, hash_algorithm: str) -> str:
+        fingerprint = HashCache.get_fingerprint(os.stat(file_path))
+        cache_key = fingerprint + (hash_algorithm,)
+        with self.__lock:
+            cached_file_hash = self.__file_hashes.get(cache_key)
+            if cached_file_hash is not None:
+                self.__hits += 1
+                return cached_file_hash.hash
+            self.__misses += 1
+        (file_hash, new_file_hash) = HashCache.hash_file(file_path, hash_algorithm, fingerprint)
+        if new_file_hash is not None:
+            with self.__lock:
+                self.__file_hashes[cache_key] = new_file_hash
+                self.__new_file_hashes[cache_key] = new_file_hash
+        return file_hash
+
+    def save(self, indexDB: IndexDB):
+        indexDB.save_file_hashes(self.__new_file_hashes.values())
+        HashCache.__logger.info("Hash cache: %s hits, %s files hashed, %s entries saved", self.__hits, self.__misses, len(self.__new_file_hashes))
+        self.__new_file_hashes = {}
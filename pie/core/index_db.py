@@ -2,27 +2,83 @@ import json
 import logging
 import os
 from logging import Logger
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, delete, event, func, inspect, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session, sessionmaker
 
 from pie.common import DB_BASE
-from pie.domain import MediaFile, Settings
-from pie.util import MiscUtils
+from pie.domain import FileHash, MediaFile, MediaFileSummary, ScannedDir, ScannedDirFile, ScannedFile, ScannedFileType, Settings
+from pie.util import MiscUtils, ParentQueue
 
 
 class IndexDB:
     __logger: Logger = logging.getLogger('IndexDB')
+    __QUERY_CHUNK_SIZE = 500
+    __YIELD_PER_ROWS = 5000
+    UPSERT_MEDIA_FILE = "upsert_media_file"
+    UPDATE_MEDIA_FILE = "update_media_file"
+    UPSERT_FILE_HASH = "upsert_file_hash"
+    __BUSY_TIMEOUT_SECONDS = 30
+    # WAL lets readers, like the preferences window, run alongside the IndexDBWriter. NORMAL is durable in WAL mode except on power loss.
+    __CONNECTION_PRAGMAS = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA cache_size=-65536", "PRAGMA mmap_size=268435456", "PRAGMA temp_store=MEMORY"]
+    __MEDIA_FILE_INDEXED_COLUMNS = ["output_rel_file_path", "capture_date", "original_file_hash", "scan_generation"]
 
-    def __init__(self):
+    def __init__(self, write_queue: ParentQueue = None):
         # For in-memory, use: 'sqlite:///:memory:'
         db_file = 'sqlite:///' + os.path.join(MiscUtils.get_app_data_dir(), "index.db")
-        self.__engine = create_engine(db_file, echo=False)
+        self.__engine = create_engine(db_file, echo=False, connect_args={"timeout": IndexDB.__BUSY_TIMEOUT_SECONDS})
+        event.listen(self.__engine, "connect", IndexDB.__configure_connection)
         DB_BASE.metadata.create_all(self.__engine)
-        self.__session: Session = sessionmaker(bind=self.__engine)()
+        self.__migrate_schema()
+        # With a write queue, media file and hash writes are sent to the IndexDBWriter and this instance only reads
+        self.__write_queue = write_queue
+        self.__session: Session = sessionmaker(bind=self.__engine, autoflush=write_queue is None)()
         IndexDB.__logger.info("Connected to IndexDB")
 
+    @staticmethod
+    def __configure_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in IndexDB.__CONNECTION_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def __migrate_schema(self):
+        # create_all only creates missing tables. Changes to existing tables are applied once each, tracked using the SQLite user_version.
+        # Appended to only, as the position of a migration is its schema version
+        migrations = [self.__add_missing_columns, self.__create_media_file_indexes, self.__add_scan_generation, self.__add_missing_columns]
+        with self.__engine.connect() as connection:
+            schema_version = connection.execute(text("PRAGMA user_version")).scalar()
+        for (migration_version, migration) in enumerate(migrations[schema_version:], start=schema_version + 1):
+            migration()
+            with self.__engine.begin() as connection:
+                connection.execute(text("PRAGMA user_version = {}".format(migration_version)))
+            IndexDB.__logger.info("IndexDB schema migrated to version %s", migration_version)
+
+    def __create_media_file_indexes(self):
+        with self.__engine.begin() as connection:
+            for column_name in IndexDB.__MEDIA_FILE_INDEXED_COLUMNS:  # Same names as the indexes created by create_all for new databases
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_media_files_{0} ON media_files ({0})".format(column_name)))
+
+    def __add_scan_generation(self):
+        self.__add_missing_columns()
+        self.__create_media_file_indexes()
+
+    def __add_missing_columns(self):
+        # create_all only creates missing tables, columns added to existing models have to be added to existing databases
+        inspector = inspect(self.__engine)
+        for table in DB_BASE.metadata.sorted_tables:
+            existing_column_names = set(column["name"] for column in inspector.get_columns(table.name))
+            for column in table.columns:
+                if column.name not in existing_column_names:
+                    try:
+                        with self.__engine.begin() as connection:
+                            connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}".format(table.name, column.name, column.type.compile(self.__engine.dialect))))
+                        IndexDB.__logger.info("Added column %s.%s", table.name, column.name)
+                    except:
+                        IndexDB.__logger.exception("Failed to add column %s.%s", table.name, column.name)
+
     def __enter__(self):
         return self
 
@@ -37,34 +93,193 @@ class IndexDB:
     def clear_indexed_files(self):
         session = self.__session
         session.query(MediaFile).delete()
+        session.query(ScannedDir).delete()
+        session.query(ScannedDirFile).delete()
+        session.query(FileHash).delete()
         session.commit()
         IndexDB.__logger.info("Indexed file IndexDB collection cleared")
 
     def insert_media_file(self, media_file: MediaFile):
+        if self.__write_queue is not None:
+            self.__write_queue.put((IndexDB.UPSERT_MEDIA_FILE, media_file.to_dict()))
+            return
         session = self.__session
         session.add(media_file)
         session.commit()
 
+    def update_media_file(self, media_file: MediaFile, column_names: List[str]):
+        values = {column_name: getattr(media_file, column_name) for column_name in column_names}
+        values["file_path"] = media_file.file_path
+        if self.__write_queue is not None:
+            self.__write_queue.put((IndexDB.UPDATE_MEDIA_FILE, values))
+        else:
+            self.write_batch([(IndexDB.UPDATE_MEDIA_FILE, values)])
+
+    def write_batch(self, writes: List[Tuple[str, dict]]):
+        """Applies queued writes in order using a single transaction. Consecutive writes of the same kind and columns are executed together."""
+        with self.__engine.begin() as connection:
+            write_num = 0
+            while write_num < len(writes):
+                (write_kind, values) = writes[write_num]
+                column_names = values.keys()
+                rows = []
+                while write_num < len(writes) and writes[write_num][0] == write_kind and writes[write_num][1].keys() == column_names:
+                    rows.append(writes[write_num][1])
+                    write_num += 1
+                if write_kind == IndexDB.UPDATE_MEDIA_FILE:  # Bind parameter names of an UPDATE cannot match column names
+                    rows = [{"_" + column_name: value for (column_name, value) in row.items()} for row in rows]
+                connection.execute(IndexDB.__get_write_statement(write_kind, column_names), rows)
+        self.__session.expire_all()
+
+    @staticmethod
+    def __get_write_statement(write_kind: str, column_names: Iterable[str]):
+        if write_kind == IndexDB.UPDATE_MEDIA_FILE:
+            return (update(MediaFile.__table__).where(MediaFile.__table__.c.file_path == bindparam("_file_path"))
+                    .values({column_name: bindparam("_" + column_name) for column_name in column_names if column_name != "file_path"}))
+        table = MediaFile.__table__ if write_kind == IndexDB.UPSERT_MEDIA_FILE else FileHash.__table__
+        statement = insert(table)
+        primary_key_names = [column.name for column in table.primary_key.columns]
+        return statement.on_conflict_do_update(index_elements=primary_key_names,
+                                               set_={column_name: statement.excluded[column_name] for column_name in column_names if column_name not in primary_key_names})
+
     def get_by_file_path(self, file_path_to_query: str):
         return self.__session.query(MediaFile).filter_by(file_path=file_path_to_query).first()
 
     def get_by_output_rel_path(self, output_rel_path_to_query: str):
         return self.__session.query(MediaFile).filter_by(output_rel_file_path=output_rel_path_to_query).first()
 
-    def delete_media_file(self, media_file: MediaFile):
-        session = self.__session
-        session.delete(media_file)
-        session.commit()
-
     def get_all_media_file_ordered(self) -> List[MediaFile]:
         # Sort entries like: None -> 2003 -> 2004 -> 2019 -> ect
         return self.__session.query(MediaFile).order_by(MediaFile.capture_date)
 
-    def get_all_media_files_by_path(self) -> Dict[str, MediaFile]:
-        media_files_by_path: Dict[str, MediaFile] = {}
-        for media_file in self.get_all_media_file_ordered():
-            media_files_by_path[media_file.file_path] = media_file
-        return media_files_by_path
+    def iter_media_file_summaries(self, order_by_capture_date: bool = False) -> Iterator[MediaFileSummary]:
+        # Plain records read in chunks without the ORM identity map. They are not tied to the session, so they can be read from other threads.
+        media_files_table = MediaFile.__table__
+        statement = select(*[media_files_table.c[column_name] for column_name in MediaFileSummary.__slots__])
+        if order_by_capture_date:
+            statement = statement.order_by(media_files_table.c.capture_date, media_files_table.c.file_path)  # File path breaks ties, so that output names are allocated in a stable order
+        with self.__engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            for rows in result.partitions(IndexDB.__YIELD_PER_ROWS):
+                for row in rows:
+                    yield MediaFileSummary(*row)
+
+    def get_media_file_summaries_by_path(self) -> Dict[str, MediaFileSummary]:
+        return {media_file.file_path: media_file for media_file in self.iter_media_file_summaries()}
+
+    def get_output_rel_file_paths(self, output_rel_dir_path: str) -> List[Tuple[str, bool]]:
+        # Output paths under a directory relative to an output directory, with whether the file has a capture date to tell the output directories apart
+        media_files_table = MediaFile.__table__
+        output_rel_file_path_column = media_files_table.c.output_rel_file_path
+        statement = select(output_rel_file_path_column, media_files_table.c.capture_date.isnot(None))
+        if output_rel_dir_path:
+            prefix = os.path.join(output_rel_dir_path, "")
+            statement = statement.where(output_rel_file_path_column >= prefix, output_rel_file_path_column < prefix + "\U0010ffff")  # A range, so that the index is used
+        else:
+            statement = statement.where(output_rel_file_path_column.isnot(None))
+        with self.__engine.connect() as connection:
+            return [(output_rel_file_path, has_capture_date) for (output_rel_file_path, has_capture_date) in connection.execute(statement)]
+
+    def delete_media_files(self, file_paths: List[str]):
+        with self.__engine.begin() as connection:
+            for chunk_start in range(0, len(file_paths), IndexDB.__QUERY_CHUNK_SIZE):
+                file_paths_chunk = file_paths[chunk_start:chunk_start + IndexDB.__QUERY_CHUNK_SIZE]
+                connection.execute(delete(FileHash.__table__).where(FileHash.__table__.c.file_path.in_(file_paths_chunk)))
+                connection.execute(delete(MediaFile.__table__).where(MediaFile.__table__.c.file_path.in_(file_paths_chunk)))
+        self.__session.expire_all()
+
+    def sweep_unscanned_media_files(self, scanned_file_paths: Iterable[str]) -> List[MediaFileSummary]:
+        """Stamps a new scan generation on the media files found by the scan, then deletes the older ones in a single transaction.
+        Returns the deleted media files, so that their output files can be removed."""
+        media_files_table = MediaFile.__table__
+        with self.__engine.begin() as connection:
+            scan_generation = connection.execute(select(func.coalesce(func.max(media_files_table.c.scan_generation), 0))).scalar() + 1
+            connection.execute(text("CREATE TEMP TABLE IF NOT EXISTS scanned_file_paths (file_path VARCHAR PRIMARY KEY)"))
+            connection.execute(text("DELETE FROM temp.scanned_file_paths"))
+            file_path_rows = [{"file_path": file_path} for file_path in scanned_file_paths]
+            if file_path_rows:
+                connection.execute(text("INSERT OR IGNORE INTO temp.scanned_file_paths (file_path) VALUES (:file_path)"), file_path_rows)
+            connection.execute(text("UPDATE media_files SET scan_generation = :scan_generation WHERE file_path IN (SELECT file_path FROM temp.scanned_file_paths)"),
+                               {"scan_generation": scan_generation})
+            connection.execute(text("DROP TABLE temp.scanned_file_paths"))
+            is_stale = or_(media_files_table.c.scan_generation.is_(None), media_files_table.c.scan_generation < scan_generation)
+            stale_media_files = [MediaFileSummary(*row) for row in connection.execute(
+                select(*[media_files_table.c[column_name] for column_name in MediaFileSummary.__slots__]).where(is_stale))]
+            connection.execute(delete(FileHash.__table__).where(FileHash.__table__.c.file_path.in_(select(media_files_table.c.file_path).where(is_stale))))
+            connection.execute(delete(media_files_table).where(is_stale))
+        self.__session.expire_all()
+        IndexDB.__logger.info("Scan generation %s: found %s files, %s stale media files deleted", scan_generation, len(file_path_rows), len(stale_media_files))
+        return stale_media_files
+
+    def get_scanned_dirs(self) -> Dict[str, ScannedDir]:
+        scanned_dirs: Dict[str, ScannedDir] = {}
+        for scanned_dir in self.__session.query(ScannedDir):
+            scanned_dirs[scanned_dir.dir_path] = scanned_dir
+        return scanned_dirs
+
+    def get_scanned_dir_files_by_dir(self) -> Dict[str, List[ScannedFile]]:
+        # Read without the ORM, the journal holds an entry for every file in the library
+        scanned_dir_files_table = ScannedDirFile.__table__
+        statement = select(scanned_dir_files_table.c.parent_dir_path, scanned_dir_files_table.c.file_path, scanned_dir_files_table.c.extension, scanned_dir_files_table.c.file_type,
+                           scanned_dir_files_table.c.is_raw, scanned_dir_files_table.c.creation_time, scanned_dir_files_table.c.last_modification_time, scanned_dir_files_table.c.size)
+        scanned_dir_files_by_dir: Dict[str, List[ScannedFile]] = {}
+        with self.__engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            for rows in result.partitions(IndexDB.__YIELD_PER_ROWS):
+                for (parent_dir_path, file_path, extension, file_type, is_raw, creation_time, last_modification_time, size) in rows:
+                    scanned_dir_files_by_dir.setdefault(parent_dir_path, []).append(ScannedFile(parent_dir_path, file_path, extension, ScannedFileType[file_type], is_raw,
+                                                                                                creation_time, last_modification_time, None, size=size))
+        return scanned_dir_files_by_dir
+
+    def clear_scan_journal(self):
+        session = self.__session
+        session.query(ScannedDir).delete()
+        session.query(ScannedDirFile).delete()
+        session.commit()
+
+    def save_scan_journal(self, dir_paths_to_remove: Set[str], scanned_dirs: Iterable[ScannedDir], scanned_files: Iterable[ScannedFile]):
+        session = self.__session
+        dir_paths_to_remove = list(dir_paths_to_remove)
+        for chunk_start in range(0, len(dir_paths_to_remove), IndexDB.__QUERY_CHUNK_SIZE):
+            dir_paths_chunk = dir_paths_to_remove[chunk_start:chunk_start + IndexDB.__QUERY_CHUNK_SIZE]
+            session.query(ScannedDir).filter(ScannedDir.dir_path.in_(dir_paths_chunk)).delete(synchronize_session=False)
+            session.query(ScannedDirFile).filter(ScannedDirFile.parent_dir_path.in_(dir_paths_chunk)).delete(synchronize_session=False)
+        session.bulk_save_objects(scanned_dirs)
+        rows = []
+        for scanned_file in scanned_files:  # Inserted in chunks, instead of creating an ORM object for every file
+            rows.append({"file_path": scanned_file.file_path, "parent_dir_path": scanned_file.parent_dir_path, "extension": scanned_file.extension,
+                         "file_type": scanned_file.file_type.name, "is_raw": scanned_file.is_raw, "creation_time": scanned_file.creation_time,
+                         "last_modification_time": scanned_file.last_modification_time, "size": scanned_file.size})
+            if len(rows) == IndexDB.__YIELD_PER_ROWS:
+                session.execute(insert(ScannedDirFile.__table__), rows)
+                rows = []
+        if rows:
+            session.execute(insert(ScannedDirFile.__table__), rows)
+        session.commit()
+        session.expire_all()
+
+    def get_file_hashes(self) -> Dict[Tuple[int, int, int, int, str], FileHash]:
+        file_hashes: Dict[Tuple[int, int, int, int, str], FileHash] = {}
+        for file_hash in self.__session.query(FileHash):
+            file_hashes[(file_hash.device, file_hash.inode, file_hash.size, file_hash.modification_time_ns, file_hash.hash_algorithm)] = file_hash
+        return file_hashes
+
+    def save_file_hashes(self, file_hashes: Iterable[FileHash]):
+        if self.__write_queue is not None:
+            for file_hash in file_hashes:
+                self.__write_queue.put((IndexDB.UPSERT_FILE_HASH, {column.name: getattr(file_hash, column.name) for column in FileHash.__table__.columns}))
+            return
+        session = self.__session
+        for file_hash in file_hashes:
+            session.merge(file_hash)
+        session.commit()
+
+    def reset_session(self):
+        # Ends the read transaction and drops the objects loaded so far, including their unsaved changes, so that later reads see the rows written since
+        self.__session.close()
+
+    def save_media_files(self):
+        self.__session.commit()  # Flushes changes made to media files loaded through this IndexDB
 
     def get_settings(self):
         settings_path = MiscUtils.get_settings_path()
@@ -100,8 +315,8 @@ class IndexDB:
         IndexDB.__logger.info("Settings cleared")
 
     @staticmethod
-    def create_instance():
-        return IndexDB()
+    def create_instance(write_queue: ParentQueue = None):
+        return IndexDB(write_queue)
 
     @staticmethod
     def destroy_instance(instance):
@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+from logging import Logger
+from typing import Dict, List, Tuple
+
+from .index_db import IndexDB
+
+
+class IndexDBWriter:
+    """Applies the IndexDB writes of worker processes from a single thread in the parent process.
+
+    Workers get a ParentQueue through IndexDB.create_instance and never write to SQLite themselves. Their writes travel through
+    the result pipe of the worker ahead of the acknowledgement of their task, and the pool queues them here as it reads them, so
+    a write is always queued before any task that depends on it is handed to another worker. Queued writes are applied in
+    order, in batched transactions. No lock is shared with the workers, so a worker killed while writing cannot block the others.
+
+    When a batch fails, its writes are applied again one by one so that one bad row does not drop the others. flush() returns the
+    number of writes that failed since the previous flush.
+    """
+    __logger: Logger = logging.getLogger('IndexDBWriter')
+    __MAX_BATCH_SIZE = 1000
+    __FLUSH = "flush"
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.__flush_count = 0
+        self.__flushed_count = 0
+        self.__failed_counts_by_flush: Dict[int, int] = {}
+        self.__failed_count = 0  # Since the last flush
+        self.__flush_condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__write_loop, name="IndexDBWriter", daemon=True)
+        self.__written_count = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def start(self):
+        self.__thread.start()
+
+    def flush(self) -> int:
+        # Waits for everything queued before this call, including the writes read from workers which already exited, to be committed
+        with self.__flush_condition:
+            self.__flush_count += 1
+            flush_num = self.__flush_count
+        self.queue.put((IndexDBWriter.__FLUSH, flush_num))
+        with self.__flush_condition:
+            self.__flush_condition.wait_for(lambda: self.__flushed_count >= flush_num or not self.__thread.is_alive())
+            return self.__failed_counts_by_flush.pop(flush_num, 0)
+
+    def stop(self):
+        self.flush()
+        self.queue.put(None)
+        self.__thread.join()
+        IndexDBWriter.__logger.info("IndexDBWriter stopped after writing %s rows", self.__written_count)
+
+    def __write_loop(self):
+        with IndexDB() as indexDB:
+            while True:
+                writes: List[Tuple[str, dict]] = []
+                write = self.queue.get()
+                while write is not None and write[0] != IndexDBWriter.__FLUSH:
+                    writes.append(write)
+                    if len(writes) >= IndexDBWriter.__MAX_BATCH_SIZE or self.queue.empty():
+                        break
+                    write = self.queue.get()
+                if writes:
+                    self.__write(indexDB, writes)
+                if write is None:
+                    break
+                if write[0] == IndexDBWriter.__FLUSH:
+                    with self.__flush_condition:
+                        self.__flushed_count = write[1]
+                        self.__failed_counts_by_flush[write[1]] = self.__failed_count
+                        self.__failed_count = 0
+                        self.__flush_condition.notify_all()
+
+    def __write(self, indexDB: IndexDB, writes: List[Tuple[str, dict]]):
+        try:
+            indexDB.write_batch(writes)
+            self.__written_count += len(writes)
+            return
+        except:
+            IndexDBWriter.__logger.exception("Failed to write a batch of %s rows to IndexDB. Writing them one by one.", len(writes))
+        for write in writes:
+            try:
+                indexDB.write_batch([write])
+                self.__written_count += 1
+            except:
+                IndexDBWriter.__logger.exception("Failed to write %s of %s to IndexDB", write[0], write[1].get("file_path"))
+                self.__failed_count += 1
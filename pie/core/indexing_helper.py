@@ -1,28 +1,41 @@
 import glob
+import hashlib
+import json
 import logging
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from logging import Logger
-from multiprocessing import Event, Lock, Manager, Queue
+from multiprocessing import Event, Queue
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Iterator, List, Set, Tuple
 
-from pie.domain import IndexingTask, MediaFile, ScannedFile, ScannedFileType
-from pie.util import MiscUtils, PyProcessPool
+from pie.domain import IndexingTask, MediaFile, MediaFileSummary, ScannedDir, ScannedFile, ScannedFileType
+from pie.util import MiscUtils
 
+from .change_detector import ChangeDetector
 from .exif_helper import ExifHelper
+from .hash_cache import HashCache
 from .index_db import IndexDB
+from .worker_pool_service import WorkerLane, WorkerPoolService
 
 
 class IndexingHelper:
     __logger: Logger = logging.getLogger('IndexingHelper')
+    __JOURNAL_MTIME_GRANULARITY_NS = 2000000000  # FAT / SMB shares only keep 2 second timestamps
 
-    def __init__(self, indexing_task: IndexingTask, log_queue: Queue, indexing_stop_event: Event):
+    def __init__(self, indexing_task: IndexingTask, log_queue: Queue, indexing_stop_event: Event, worker_pool_service: WorkerPoolService = None):
         self.__indexing_task = indexing_task
+        self.__worker_pool_service = worker_pool_service  # A temporary one is started when indexing if not given
         self.__image_extensions: Set[str] = IndexingHelper.parse_file_type_extension_str(self.__indexing_task.settings.image_extensions)
         self.__image_raw_extensions: Set[str] = IndexingHelper.parse_file_type_extension_str(self.__indexing_task.settings.image_raw_extensions)
         self.__video_extensions: Set[str] = IndexingHelper.parse_file_type_extension_str(self.__indexing_task.settings.video_extensions)
         self.__video_raw_extensions: Set[str] = IndexingHelper.parse_file_type_extension_str(self.__indexing_task.settings.video_raw_extensions)
+        self.__hash_algorithm: str = MiscUtils.get_hash_algorithm(self.__indexing_task.settings.hash_algorithm)
+        self.__rehashed_media_files: List[Tuple[MediaFileSummary, str]] = []
+        self.__unscanned_dir_paths: List[str] = []  # Directories the last scan could not list
         self.__log_queue = log_queue
         self.__indexing_stop_event = indexing_stop_event
 
@@ -37,53 +50,96 @@ class IndexingHelper:
 
     def lookup_already_indexed_files(self, indexDB: IndexDB, scanned_files: List[ScannedFile]):
         IndexingHelper.__logger.info("BEGIN:: IndexDB lookup for indexed files")
-        total_scanned_files = len(scanned_files)
-        media_files_by_path = indexDB.get_all_media_files_by_path()
-        for scanned_file_num, scanned_file in enumerate(scanned_files, start=1):
-            if self.__indexing_stop_event.is_set():
-                break
-            if scanned_file.file_path in media_files_by_path:
-                media_file = media_files_by_path[scanned_file.file_path]
+        media_files: List[MediaFileSummary] = list(indexDB.iter_media_file_summaries())
+        hash_cache = HashCache(indexDB, self.__indexing_task.settings.verify_file_hashes)
+        change_set = ChangeDetector.detect(scanned_files, media_files, self.__hash_algorithm, hash_cache.verify)
+        for scanned_file_index in change_set.unchanged:
+            scanned_files[scanned_file_index].already_indexed = True
+        # Only touched files need a lookup, the others are settled by the change set
+        total_touched_files = len(change_set.touched)
+        with self.create_hashing_executor() as executor:
+            for touched_file_num, scanned_file_index in enumerate(change_set.touched, start=1):
+                if self.__indexing_stop_event.is_set():
+                    break
+                media_file = media_files[change_set.media_file_indices[scanned_file_index]]
+                executor.submit(self.lookup_indexed_file, scanned_files[scanned_file_index], media_file, hash_cache, "{}/{}".format(touched_file_num, total_touched_files))
+        hash_cache.save(indexDB)
+        self.save_rehashed_media_files(indexDB)
+        IndexingHelper.__logger.info("END:: IndexDB lookup for indexed files")
+
+    def create_hashing_executor(self) -> ThreadPoolExecutor:
+        # hashlib releases the GIL, so threads are enough to keep several reads in flight
+        return ThreadPoolExecutor(max_workers=max(1, self.__indexing_task.settings.hashing_threads), thread_name_prefix="ChangeDetector")
+
+    def needs_hashing(self, scanned_file: ScannedFile, media_file: MediaFileSummary, hash_cache: HashCache) -> bool:
+        return media_file is not None and (hash_cache.verify or ChangeDetector.is_touched(scanned_file, media_file)
+                                           or not ChangeDetector.is_hashed_with(media_file, self.__hash_algorithm))
+
+    def lookup_indexed_file(self, scanned_file: ScannedFile, media_file: MediaFileSummary, hash_cache: HashCache, lookup_id: str):
+        if self.__indexing_stop_event.is_set():
+            return
+        try:
+            if media_file is not None:
                 scanned_file.already_indexed = True
-                if (scanned_file.creation_time != media_file.creation_time or scanned_file.last_modification_time != media_file.last_modification_time):
-                    scanned_file.hash = MiscUtils.generate_hash(scanned_file.file_path)
-                    if scanned_file.hash != media_file.original_file_hash:
+                stored_hash_algorithm = media_file.original_file_hash_algorithm or MiscUtils.HASH_ALGORITHM_SHA1
+                if hash_cache.verify or ChangeDetector.is_touched(scanned_file, media_file):
+                    if hash_cache.get_hash(scanned_file.file_path, stored_hash_algorithm) != media_file.original_file_hash:
                         scanned_file.needs_reindex = True
-            IndexingHelper.__logger.info("Searched Index %s/%s: %s (AlreadyIndexed = %s, NeedsReindex= %s)", scanned_file_num, total_scanned_files,
+                if scanned_file.needs_reindex or stored_hash_algorithm != self.__hash_algorithm:
+                    scanned_file.hash = hash_cache.get_hash(scanned_file.file_path, self.__hash_algorithm)
+                    if not scanned_file.needs_reindex:  # Unchanged file hashed with another algorithm, replace the hash instead of reindexing
+                        IndexingHelper.__logger.info("Rehashed %s: %s (%s -> %s)", lookup_id, scanned_file.file_path, stored_hash_algorithm, self.__hash_algorithm)
+                        self.__rehashed_media_files.append((media_file, scanned_file.hash))
+            IndexingHelper.__logger.info("Searched Index %s: %s (AlreadyIndexed = %s, NeedsReindex= %s)", lookup_id,
                                          scanned_file.file_path, scanned_file.already_indexed, scanned_file.needs_reindex)
-        IndexingHelper.__logger.info("END:: IndexDB lookup for indexed files")
+        except:
+            IndexingHelper.__logger.exception("Search Index Failed %s: %s", lookup_id, scanned_file.file_path)
+
+    def save_rehashed_media_files(self, indexDB: IndexDB):
+        # Written on the thread owning the IndexDB rather than on the hashing threads
+        (rehashed_media_files, self.__rehashed_media_files) = (self.__rehashed_media_files, [])
+        if rehashed_media_files:
+            indexDB.write_batch([(IndexDB.UPDATE_MEDIA_FILE, {"file_path": media_file.file_path, "original_file_hash": original_file_hash,
+                                                              "original_file_hash_algorithm": self.__hash_algorithm})
+                                 for (media_file, original_file_hash) in rehashed_media_files])
 
     def remove_slate_files(self, indexDB: IndexDB, scanned_files: List[ScannedFile]):
         IndexingHelper.__logger.info("BEGIN:: Deletion of slate files")
-        media_files: List[MediaFile] = indexDB.get_all_media_file_ordered()
-        scanned_files_by_path = self.get_scanned_files_by_path(scanned_files)
-        if (not media_files or media_files.count() == 0):
-            IndexingHelper.__logger.info("No media files found in IndexDB")
-        else:
-            for media_file in media_files:
-                if self.__indexing_stop_event.is_set():
-                    break
-                if not media_file.file_path in scanned_files_by_path:
-                    self.__remove_stale_file(indexDB, media_file)
+        if not self.__indexing_stop_event.is_set():
+            scanned_file_paths = [scanned_file.file_path for scanned_file in scanned_files]
+            if self.__unscanned_dir_paths:
+                # The files indexed under a directory that could not be listed may still exist, so they are kept as if they were scanned
+                dir_path_prefixes = tuple(os.path.join(dir_path, "") for dir_path in self.__unscanned_dir_paths)
+                scanned_file_paths.extend(file_path for file_path in indexDB.get_media_file_summaries_by_path() if file_path.startswith(dir_path_prefixes))
+            slate_media_files = indexDB.sweep_unscanned_media_files(scanned_file_paths)
+            self.__remove_output_files(slate_media_files)
         IndexingHelper.__logger.info("END:: Deletion of slate files")
 
-    def __remove_stale_file(self, indexDB: IndexDB, media_file: MediaFile):
+    def __remove_output_files(self, media_files: List[MediaFileSummary]):
+        # Removals are independent and mostly wait on the file system, so they are spread over threads
+        if media_files:
+            with ThreadPoolExecutor(max_workers=max(1, self.__indexing_task.settings.scan_threads), thread_name_prefix="OutputRemover") as executor:
+                for _ in executor.map(self.__remove_output_file, media_files):
+                    pass
+
+    def __remove_output_file(self, media_file: MediaFileSummary):
         output_file = None
         if media_file.output_rel_file_path:
             out_dir = self.__indexing_task.settings.output_dir if media_file.capture_date else self.__indexing_task.settings.unknown_output_dir
             output_file = os.path.join(out_dir, media_file.output_rel_file_path)
         IndexingHelper.__logger.info("Deleting slate entry %s and its output file %s", media_file.file_path, output_file)
-        if output_file is not None and os.path.exists(output_file):
-            os.remove(output_file)
-        indexDB.delete_media_file(media_file)
+        try:
+            if output_file is not None and os.path.exists(output_file):
+                os.remove(output_file)
+        except:
+            IndexingHelper.__logger.exception("Failed to delete output file %s", output_file)
 
     def remove_deleted_files(self, indexDB: IndexDB, deleted_files: List[str]):
-        media_files_by_path = indexDB.get_all_media_files_by_path()
-        for deleted_file in deleted_files:
-            if self.__indexing_stop_event.is_set():
-                break
-            if deleted_file in media_files_by_path:
-                self.__remove_stale_file(indexDB, media_files_by_path[deleted_file])
+        media_files_by_path = indexDB.get_media_file_summaries_by_path()
+        deleted_media_files: List[MediaFileSummary] = [media_files_by_path[deleted_file] for deleted_file in deleted_files if deleted_file in media_files_by_path]
+        if not self.__indexing_stop_event.is_set():
+            indexDB.delete_media_files([media_file.file_path for media_file in deleted_media_files])
+            self.__remove_output_files(deleted_media_files)
 
     def get_scanned_files_by_path(self, scanned_files: List[ScannedFile]) -> Dict[str, ScannedFile]:
         scanned_files_by_path: Dict[str, ScannedFile] = {}
@@ -91,23 +147,142 @@ class IndexingHelper:
             scanned_files_by_path[scanned_file.file_path] = scanned_file
         return scanned_files_by_path
 
-    def scan_dirs(self) -> Tuple[List[ScannedFile], List[str]]:
+    def scan_dirs(self, indexDB: IndexDB = None) -> Tuple[List[ScannedFile], List[str]]:
+        return (list(self.iter_scanned_files(indexDB)), None)
+
+    def iter_scanned_files(self, indexDB: IndexDB = None) -> Iterator[ScannedFile]:
+        """Yields scanned files directory by directory as the walk progresses. The scan journal is saved once the generator is exhausted."""
         IndexingHelper.__logger.info("BEGIN:: Dir scan")
-        scanned_files = self.__scan_dir_recursive(self.__indexing_task.settings.monitored_dir)
+        self.__unscanned_dir_paths = []
+        self.__journal_fingerprints: Dict[str, Tuple[int, int]] = {}
+        self.__journal_files_by_dir: Dict[str, List[ScannedFile]] = {}
+        use_scan_journal = indexDB is not None and self.__indexing_task.settings.use_scan_journal
+        if use_scan_journal:
+            scan_settings_hash = self.__get_scan_settings_hash()
+            journal_dirs = indexDB.get_scanned_dirs()
+            for dir_path, scanned_dir in journal_dirs.items():
+                if scanned_dir.scan_settings_hash == scan_settings_hash and scanned_dir.modification_time_ns is not None:
+                    self.__journal_fingerprints[dir_path] = (scanned_dir.modification_time_ns, scanned_dir.entry_count)
+            self.__journal_files_by_dir = indexDB.get_scanned_dir_files_by_dir()
+        elif indexDB is not None:
+            indexDB.clear_scan_journal()  # Outdated once files are scanned without it, it is rebuilt when turned on again
+        scanned_dirs: List[Tuple[str, Tuple[int, int], List[ScannedFile]]] = []
+        yield from self.__scan_dir_recursive(self.__indexing_task.settings.monitored_dir, scanned_dirs)
+        if use_scan_journal and not self.__indexing_stop_event.is_set():
+            self.__save_scan_journal(indexDB, scan_settings_hash, set(journal_dirs.keys()), scanned_dirs)
         IndexingHelper.__logger.info("END:: Dir scan")
-        return (scanned_files, None)
 
-    def __scan_dir_recursive(self, dir_path):
+    def __get_scan_settings_hash(self) -> str:
+        settings = self.__indexing_task.settings
+        scan_settings = [settings.image_extensions, settings.image_raw_extensions, settings.video_extensions, settings.video_raw_extensions,
+                         settings.skip_same_name_video, settings.skip_same_name_raw, settings.dirs_to_exclude]
+        return hashlib.sha1(json.dumps(scan_settings).encode()).hexdigest()
+
+    def __save_scan_journal(self, indexDB: IndexDB, scan_settings_hash: str, journal_dir_paths: Set[str], scanned_dirs: List[Tuple[str, Tuple[int, int], List[ScannedFile]]]):
+        dir_paths_to_remove = set(journal_dir_paths)
+        new_scanned_dirs: List[ScannedDir] = []
+        new_scanned_dir_files: List[ScannedFile] = []
+        trusted_modification_time_ns = time.time_ns() - IndexingHelper.__JOURNAL_MTIME_GRANULARITY_NS
+        for (dir_path, dir_fingerprint, dir_scanned_files) in scanned_dirs:
+            if dir_scanned_files is None:
+                dir_paths_to_remove.discard(dir_path)  # Reused from the journal, keep the existing entries
+                continue
+            (modification_time_ns, entry_count) = dir_fingerprint
+            if modification_time_ns is not None and modification_time_ns > trusted_modification_time_ns:
+                modification_time_ns = None  # Modified too recently to rule out a same-timestamp change, list it again next time
+            new_scanned_dirs.append(ScannedDir(dir_path=dir_path, modification_time_ns=modification_time_ns, entry_count=entry_count, scan_settings_hash=scan_settings_hash))
+            new_scanned_dir_files.extend(dir_scanned_files)
+        indexDB.save_scan_journal(dir_paths_to_remove, new_scanned_dirs, new_scanned_dir_files)
+        IndexingHelper.__logger.info("Scan journal updated: %s of %s directories changed", len(new_scanned_dirs), len(scanned_dirs))
+
+    def __scan_dir_recursive(self, dir_path, scanned_dirs: List[Tuple[str, Tuple[int, int], List[ScannedFile]]]) -> Iterator[ScannedFile]:
         IndexingHelper.__logger.info("BEGIN:: Scanning DIR: %s", dir_path)
-        scanned_files = []
-        for dir_path, _, file_names in os.walk(dir_path):
-            if self.__indexing_stop_event.is_set():
-                break
-            self.__scan_dir(dir_path, file_names, scanned_files)
+        scan_threads = max(1, self.__indexing_task.settings.scan_threads)
+        max_listings = 4 * scan_threads  # Directories listed ahead of the walk, so that the listings of a large tree are not all held at once
+        with ThreadPoolExecutor(max_workers=scan_threads, thread_name_prefix="DirScanner") as executor:
+            # Directories are listed concurrently but consumed in the same top-down order as os.walk. Each entry is [dir_path, listing_future].
+            dirs_to_consume: List[List] = [[dir_path, None]]
+            listing_count = 0
+            try:
+                while dirs_to_consume:
+                    if self.__indexing_stop_event.is_set():
+                        break
+                    for dir_to_consume in reversed(dirs_to_consume[-max_listings:]):  # The next directories of the walk are at the end
+                        if listing_count >= max_listings:
+                            break
+                        if dir_to_consume[1] is None:
+                            dir_to_consume[1] = executor.submit(self.__list_dir, dir_to_consume[0])
+                            listing_count += 1
+                    (next_dir_path, listing_future) = dirs_to_consume.pop()
+                    listing_count -= 1
+                    try:
+                        (file_names, file_stats, sub_dir_paths, dir_fingerprint, unchanged) = listing_future.result()
+                    except OSError as e:
+                        # Left out of the scan journal and of the sweep, so that it is listed again next time and its indexed files are kept
+                        IndexingHelper.__logger.warning("Unable to list directory %s, the files indexed under it are kept: %s", next_dir_path, e)
+                        self.__unscanned_dir_paths.append(next_dir_path)
+                        continue
+                    dir_scanned_files: List[ScannedFile] = []
+                    if unchanged:
+                        dir_scanned_files = self.__journal_files_by_dir.get(next_dir_path, [])
+                        for scanned_file in dir_scanned_files:
+                            IndexingHelper.__logger.info("File Scanned: %s", scanned_file.file_path)
+                        scanned_dirs.append((next_dir_path, dir_fingerprint, None))
+                    else:
+                        self.__scan_dir(next_dir_path, file_names, dir_scanned_files, file_stats)
+                        scanned_dirs.append((next_dir_path, dir_fingerprint, dir_scanned_files))
+                    dirs_to_consume.extend([sub_dir_path, None] for sub_dir_path in reversed(sub_dir_paths))
+                    yield from dir_scanned_files
+            finally:
+                for (_, listing_future) in dirs_to_consume:
+                    if listing_future is not None:
+                        listing_future.cancel()  # When stopped or closed early, only the listings already running are waited for
         IndexingHelper.__logger.info("END:: Scanning DIR: %s", dir_path)
-        return scanned_files
 
-    def __scan_dir(self, dir_path, file_names, scanned_files):
+    def __list_dir(self, dir_path: str) -> Tuple[List[str], Dict[str, os.stat_result], List[str], Tuple[int, int], bool]:
+        # Errors other than a deleted directory are raised, as a directory left out of the scan would have its files removed from the index
+        file_names: List[str] = []
+        file_entries: List[os.DirEntry] = []
+        file_stats: Dict[str, os.stat_result] = {}
+        sub_dir_paths: List[str] = []
+        modification_time_ns = None
+        if self.__indexing_stop_event.is_set():
+            return (file_names, file_stats, sub_dir_paths, (modification_time_ns, 0), False)
+        try:
+            modification_time_ns = os.stat(dir_path).st_mtime_ns  # Taken before listing so that concurrent changes are picked up next time
+            with os.scandir(dir_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    try:
+                        is_dir = dir_entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not dir_entry.is_symlink():  # Same as os.walk(followlinks=False)
+                            sub_dir_paths.append(dir_entry.path)
+                        continue
+                    file_names.append(dir_entry.name)
+                    file_entries.append(dir_entry)
+        except FileNotFoundError:
+            IndexingHelper.__logger.info("Directory deleted while scanning: %s", dir_path)
+            return ([], {}, [], (None, 0), False)
+
+        dir_fingerprint = (modification_time_ns, len(file_names) + len(sub_dir_paths))
+        if self.__journal_fingerprints.get(dir_path) == dir_fingerprint:
+            return (file_names, file_stats, sub_dir_paths, dir_fingerprint, True)
+        for file_entry in file_entries:
+            if self.__get_file_type(file_entry.name)[0] != ScannedFileType.UNKNOWN:
+                # Only a deleted file is left out. Other errors abort the scan, as a file left out of it would be removed from the index along with its output file.
+                try:
+                    file_stats[file_entry.name] = file_entry.stat()
+                except FileNotFoundError:
+                    IndexingHelper.__logger.info("File deleted while scanning: %s", file_entry.path)
+        return (file_names, file_stats, sub_dir_paths, dir_fingerprint, False)
+
+    def __get_file_type(self, file_name: str) -> Tuple[ScannedFileType, bool]:
+        extension = os.path.splitext(file_name)[1].replace(".", "").upper()
+        return ScannedFileType.get_type(self.__image_extensions, self.__image_raw_extensions, self.__video_extensions, self.__video_raw_extensions, extension)
+
+    def __scan_dir(self, dir_path, file_names, scanned_files, file_stats: Dict[str, os.stat_result] = None):
         if self.exclude_dir_from_scan(dir_path):
             IndexingHelper.__logger.info("Skipping Directory Scan: %s", dir_path)
         else:
@@ -119,9 +294,15 @@ class IndexingHelper:
                 (scanned_file_type, is_raw) = ScannedFileType.get_type(self.__image_extensions, self.__image_raw_extensions, self.__video_extensions, self.__video_raw_extensions, extension)
                 file_path = os.path.join(dir_path, file_name)
                 if ScannedFileType.UNKNOWN != scanned_file_type:
-                    creation_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    last_modification_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    scanned_file = ScannedFile(dir_path, file_path, extension, scanned_file_type, is_raw, creation_time, last_modification_time, None)
+                    if file_stats is None:
+                        file_stat = os.stat(file_path)
+                    elif file_name in file_stats:
+                        file_stat = file_stats[file_name]
+                    else:
+                        continue  # Deleted after the directory was listed
+                    creation_time = datetime.fromtimestamp(file_stat.st_ctime)
+                    last_modification_time = datetime.fromtimestamp(file_stat.st_mtime)
+                    scanned_file = ScannedFile(dir_path, file_path, extension, scanned_file_type, is_raw, creation_time, last_modification_time, None, size=file_stat.st_size)
                     if file_name_without_extension not in scanned_files_by_name:
                         scanned_files_by_name[file_name_without_extension] = []
                     scanned_files_by_name[file_name_without_extension].append(scanned_file)
@@ -138,16 +319,31 @@ class IndexingHelper:
                         IndexingHelper.__logger.info("File Scanned: %s", file.file_path)
                         scanned_files.append(file)
 
+    def expand_changed_paths(self, indexDB: IndexDB, changed_paths: Set[str]) -> Set[str]:
+        file_paths: Set[str] = set()
+        indexed_file_paths = None
+        for changed_path in changed_paths:
+            if os.path.isdir(changed_path):
+                for (dir_path, _, file_names) in os.walk(changed_path):
+                    file_paths.update(os.path.join(dir_path, file_name) for file_name in file_names)
+            else:
+                file_paths.add(changed_path)
+                if not os.path.exists(changed_path):  # Could have been a directory, so also pick up indexed files under it
+                    if indexed_file_paths is None:
+                        indexed_file_paths = indexDB.get_media_file_summaries_by_path().keys()
+                    dir_path_prefix = os.path.join(changed_path, "")
+                    file_paths.update(file_path for file_path in indexed_file_paths if file_path.startswith(dir_path_prefix))
+        return file_paths
+
     def scan_files(self, fileNames: Set[str]) -> Tuple[List[ScannedFile], List[str]]:
-        filePathsToScan: List[str] = []
+        filePathsToScan: Set[str] = set()
         deletedFiles: List[str] = []
         for filePath in fileNames:
             filePathWithoutExtension = os.path.splitext(filePath)[0]
-            matchingFiles = glob.glob(filePathWithoutExtension + "*")
-            if len(matchingFiles) == 0:
+            matchingFiles = [matchingFile for matchingFile in glob.glob(glob.escape(filePathWithoutExtension) + "*") if os.path.isfile(matchingFile)]
+            if not os.path.exists(filePath):
                 deletedFiles.append(filePath)
-            else:
-                filePathsToScan.extend(matchingFiles)
+            filePathsToScan.update(matchingFiles)  # Same name files are scanned together so that same name filtering still applies
 
         fileNamesByDir: Dict[str, List[str]] = {}
         for filePath in filePathsToScan:
@@ -167,18 +363,49 @@ class IndexingHelper:
 
     def create_media_files(self, scanned_files: List[ScannedFile]) -> List[str]:
         IndexingHelper.__logger.info("BEGIN:: Media file creation and indexing")
-        pool = PyProcessPool(pool_name="IndexingWorker", process_count=self.__indexing_task.settings.indexing_workers, log_queue=self.__log_queue,
-                             target=IndexingHelper.indexing_process_exec, initializer=IndexDB.create_instance, terminator=IndexDB.destroy_instance, stop_event=self.__indexing_stop_event)
-        db_write_lock: Lock = Manager().Lock()  # pylint: disable=maybe-no-member
-        tasks = list(map(lambda scanned_file: (self.__indexing_task.indexing_time, self.__indexing_task.settings.output_dir,
-                                               self.__indexing_task.settings.unknown_output_dir, self.__indexing_task.settings.path_exiftool, scanned_file, db_write_lock), scanned_files))
-        saved_file_paths = pool.submit_and_wait(tasks)
+        files_to_index: List[ScannedFile] = []
+        for scanned_file in scanned_files:
+            if (not scanned_file.already_indexed or scanned_file.needs_reindex):
+                files_to_index.append(scanned_file)
+            else:
+                IndexingHelper.__logger.info("Indexing Skipped: %s", scanned_file.file_path)
+        batch_size = max(1, self.__indexing_task.settings.indexing_batch_size)
+        total_batches = math.ceil(len(files_to_index) / batch_size)
+        worker_pool_service = self.__worker_pool_service or WorkerPoolService(self.__log_queue)
+        try:
+            indexing_lane = self.get_indexing_lane(worker_pool_service)
+            for batch_num, batch_start in enumerate(range(0, len(files_to_index), batch_size), start=1):
+                indexing_lane.put(self.get_indexing_task_args(files_to_index[batch_start:batch_start + batch_size]), "{}/{}".format(batch_num, total_batches))
+            saved_file_paths = [media_file_values["file_path"] for batch_result in indexing_lane.iter_results(self.__indexing_stop_event) for media_file_values in batch_result]
+            failed_write_count = worker_pool_service.flush_writes()
+            if failed_write_count > 0:
+                IndexingHelper.__logger.error("%s IndexDB writes failed, see the errors logged by IndexDBWriter", failed_write_count)
+        finally:
+            if worker_pool_service is not self.__worker_pool_service:
+                worker_pool_service.shutdown()
         IndexingHelper.__logger.info("END:: Media file creation and indexing")
         return saved_file_paths
 
+    def get_indexing_lane(self, worker_pool_service: WorkerPoolService) -> WorkerLane:
+        return worker_pool_service.get_lane(WorkerPoolService.INDEXING_LANE, IndexingHelper.indexing_process_exec, self.__indexing_task.settings)
+
+    def get_indexing_task_args(self, scanned_files: List[ScannedFile]) -> Tuple:
+        # The run settings travel with every batch, as workers outlive a single indexing run
+        settings = self.__indexing_task.settings
+        indexing_run_args = (self.__indexing_task.indexing_time, settings.output_dir, settings.unknown_output_dir, settings.path_exiftool,
+                             settings.exiftool_fast_scan, settings.native_exif_reader, self.__hash_algorithm, settings.subprocess_timeout_factor)
+        return (indexing_run_args, scanned_files)
+
     @staticmethod
-    def indexing_process_exec(indexing_time: datetime, output_dir: str, unknown_output_dir: str, path_exiftool: str, scanned_file: ScannedFile, db_write_lock: Lock, indexDB: IndexDB, task_id: str):
-        if (not scanned_file.already_indexed or scanned_file.needs_reindex):
+    def indexing_process_exec(indexing_run_args: Tuple, scanned_files: List[ScannedFile], indexDB: IndexDB, task_id: str) -> List[dict]:
+        (indexing_time, output_dir, unknown_output_dir, path_exiftool, exiftool_fast_scan, native_exif_reader, hash_algorithm, timeout_factor) = indexing_run_args
+        try:
+            exif_dicts = ExifHelper.get_exif_dicts(path_exiftool, scanned_files, exiftool_fast_scan, native_exif_reader, timeout_factor)
+        except:
+            logging.exception("Batch EXIF extraction failed %s. Retrying files individually.", task_id)
+            exif_dicts = [None] * len(scanned_files)
+        indexed_media_files = []
+        for scanned_file, exif in zip(scanned_files, exif_dicts):
             try:
                 existing_media_file = None
                 if scanned_file.needs_reindex:
@@ -189,16 +416,21 @@ class IndexingHelper:
                         if os.path.exists(existing_output_file):
                             logging.info("Deleting old output file %s for %s", existing_output_file, existing_media_file.file_path)
                             os.remove(existing_output_file)
-                media_file = ExifHelper.create_media_file(path_exiftool, indexing_time, scanned_file, existing_media_file)
+                file_hash = None
+                if scanned_file.hash is None:
+                    # A hash from the lookup was cached by the parent, under the fingerprints it took around reading the file. One computed here is
+                    # only cached under fingerprints taken around this read, so that a file rewritten since the scan is not cached with an old hash.
+                    (scanned_file.hash, file_hash) = HashCache.hash_file(scanned_file.file_path, hash_algorithm)
+                media_file = ExifHelper.create_media_file(path_exiftool, indexing_time, scanned_file, existing_media_file, exif, hash_algorithm, timeout_factor)
                 if media_file:
-                    with db_write_lock:
-                        indexDB.insert_media_file(media_file)
+                    indexDB.insert_media_file(media_file)
+                    if file_hash is not None:
+                        indexDB.save_file_hashes([file_hash])
+                    indexed_media_files.append(media_file.to_dict())
                 logging.info("Indexed Successfully %s: %s", task_id, scanned_file.file_path)
-                return scanned_file.file_path
             except:
                 logging.exception("Indexing Failed %s: %s", task_id, scanned_file.file_path)
-        else:
-            logging.info("Indexing Skipped %s: %s", task_id, scanned_file.file_path)
+        return indexed_media_files
 
     def exclude_dir_from_scan(self, dir_path: str):
         for dir_to_exclude in self.__indexing_task.settings.dirs_to_exclude:
@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from logging import Logger
+from multiprocessing import Event, Queue
+from typing import List, Set
+
+from pie.domain import IndexingTask, MediaFileSummary, ScannedFile
+
+from .hash_cache import HashCache
+from .index_db import IndexDB
+from .indexing_helper import IndexingHelper
+from .media_processor import MediaProcessor
+from .worker_pool_service import WorkerPoolService
+
+
+class IndexingPipeline:
+    """Runs the scan, lookup, indexing and conversion steps concurrently.
+
+    Files are looked up as the directory walk discovers them, queued for indexing in batches and queued for conversion as soon
+    as they are indexed. Conversions are submitted in the order of the conversion policy each time no indexed file arrives for a
+    moment, or when pipeline_queue_size of them are waiting. The pool task queues are bounded so that the scan cannot run
+    arbitrarily far ahead of the workers.
+    """
+    __logger: Logger = logging.getLogger('IndexingPipeline')
+    __RESULT_POLL_SECONDS = 0.5
+
+    def __init__(self, indexing_task: IndexingTask, log_queue: Queue, indexing_stop_event: Event, worker_pool_service: WorkerPoolService = None):
+        self.__indexing_task = indexing_task
+        self.__log_queue = log_queue
+        self.__indexing_stop_event = indexing_stop_event
+        self.__worker_pool_service = worker_pool_service  # A temporary one is started for each run if not given
+        self.__submit_lock = threading.Lock()
+        self.__scan_finished = threading.Event()
+
+    def run(self, indexDB: IndexDB):
+        IndexingPipeline.__logger.info("BEGIN:: Streaming indexing pipeline")
+        settings = self.__indexing_task.settings
+        worker_pool_service = self.__worker_pool_service or WorkerPoolService(self.__log_queue)
+        self.__indexing_helper = IndexingHelper(self.__indexing_task, self.__log_queue, self.__indexing_stop_event, worker_pool_service)
+        self.__media_processor = MediaProcessor(self.__indexing_task, self.__log_queue, self.__indexing_stop_event, worker_pool_service)
+        self.__batch_size = max(1, settings.indexing_batch_size)
+        media_files_by_path = indexDB.get_media_file_summaries_by_path()
+        hash_cache = HashCache(indexDB, settings.verify_file_hashes)
+
+        self.__scan_finished.clear()
+        self.__media_processor.start_conversion(indexDB)
+        self.__indexing_lane = self.__indexing_helper.get_indexing_lane(worker_pool_service)
+        self.__files_being_indexed: Set[str] = set()
+        self.__files_to_index: List[ScannedFile] = []
+        forwarder = threading.Thread(target=self.__forward_indexed_files, name="IndexedFileForwarder")
+        forwarder.start()
+        try:
+            scanned_files: List[ScannedFile] = []
+            # Bounds the files waiting for a hashing thread so that the scan does not run ahead of the disk
+            pending_hashes = threading.BoundedSemaphore(4 * max(1, settings.hashing_threads))
+            with self.__indexing_helper.create_hashing_executor() as executor:
+                for scanned_file in self.__indexing_helper.iter_scanned_files(indexDB):
+                    if self.__indexing_stop_event.is_set():
+                        break
+                    scanned_files.append(scanned_file)
+                    media_file = media_files_by_path.get(scanned_file.file_path)
+                    lookup_id = "#{}".format(len(scanned_files))
+                    if self.__indexing_helper.needs_hashing(scanned_file, media_file, hash_cache):
+                        pending_hashes.acquire()
+                        executor.submit(self.__lookup_and_route, scanned_file, media_file, hash_cache, lookup_id).add_done_callback(lambda _: pending_hashes.release())
+                    else:
+                        self.__lookup_and_route(scanned_file, media_file, hash_cache, lookup_id)
+            with self.__submit_lock:
+                if self.__files_to_index and not self.__indexing_stop_event.is_set():
+                    self.__indexing_lane.put(self.__indexing_helper.get_indexing_task_args(self.__files_to_index))
+                    self.__files_to_index = []
+            hash_cache.save(indexDB)
+            self.__indexing_helper.save_rehashed_media_files(indexDB)
+            if not self.__indexing_stop_event.is_set():  # Stale entries can only be identified once the scan is complete
+                self.__indexing_helper.remove_slate_files(indexDB, scanned_files)
+        finally:
+            self.__scan_finished.set()
+            forwarder.join()
+            self.__media_processor.finish_conversion()
+            IndexingPipeline.__logger.info("Worker pool stats: %s", worker_pool_service.get_pool_stats())
+            if worker_pool_service is not self.__worker_pool_service:
+                worker_pool_service.shutdown()
+        IndexingPipeline.__logger.info("END:: Streaming indexing pipeline")
+
+    def __lookup_and_route(self, scanned_file: ScannedFile, media_file: MediaFileSummary, hash_cache: HashCache, lookup_id: str):
+        self.__indexing_helper.lookup_indexed_file(scanned_file, media_file, hash_cache, lookup_id)
+        if self.__indexing_stop_event.is_set():
+            return
+        with self.__submit_lock:  # Called from both the scanning and the hashing threads
+            if (not scanned_file.already_indexed or scanned_file.needs_reindex):
+                self.__files_being_indexed.add(scanned_file.file_path)
+                self.__files_to_index.append(scanned_file)
+                if len(self.__files_to_index) >= self.__batch_size:
+                    self.__indexing_lane.put(self.__indexing_helper.get_indexing_task_args(self.__files_to_index))
+                    self.__files_to_index = []
+            else:
+                IndexingPipeline.__logger.info("Indexing Skipped: %s", scanned_file.file_path)
+                self.__media_processor.queue_conversion(media_file)
+
+    def __forward_indexed_files(self):
+        # Runs until the scan is finished and every indexing batch put so far was acknowledged. The workers stay up for later runs.
+        while True:
+            if self.__indexing_stop_event.is_set():
+                self.__indexing_lane.cancel_pending_tasks()  # Also unblocks a scan waiting on the bounded task queue
+            try:
+                indexed_media_files = self.__indexing_lane.get_result(IndexingPipeline.__RESULT_POLL_SECONDS)
+            except queue.Empty:
+                self.__media_processor.flush_conversions()
+                if self.__scan_finished.is_set() and self.__indexing_lane.pending_task_count == 0:
+                    break
+                continue
+            for media_file_values in indexed_media_files:
+                with self.__submit_lock:
+                    if media_file_values["file_path"] in self.__files_being_indexed and not self.__indexing_stop_event.is_set():
+                        self.__files_being_indexed.discard(media_file_values["file_path"])
+                        self.__media_processor.queue_conversion(MediaFileSummary.from_dict(media_file_values), media_file_values)
@@ -1,86 +1,141 @@
 import logging
 import math
 import os
+import threading
 import time
-from datetime import datetime
-from multiprocessing import Event, Lock, Manager, Queue
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Event, Queue
+from typing import List, Tuple
 
-from pie.domain import IndexingTask, MediaFile, ScannedFileType, Settings
-from pie.util import MiscUtils, PyProcessPool
+from pie.domain import IndexingTask, MediaFile, MediaFileSummary, ScannedFileType, Settings
+from pie.util import MiscUtils, SubprocessSupervisor
 
+from .conversion_scheduler import ConversionScheduler
 from .index_db import IndexDB
+from .output_path_allocator import OutputPathAllocator
+from .resource_budget import ResourceBudget
+from .worker_pool_service import WorkerPoolService
 
 
 class MediaProcessor:
     __logger = logging.getLogger('MediaProcessor')
+    __CONVERTED_FILE_COLUMNS = ["converted_file_hash", "converted_file_hash_algorithm", "converted_file_size", "converted_file_mtime_ns", "conversion_settings_hash"]
 
-    def __init__(self, indexing_task: IndexingTask, log_queue: Queue, indexing_stop_event: Event):
+    def __init__(self, indexing_task: IndexingTask, log_queue: Queue, indexing_stop_event: Event, worker_pool_service: WorkerPoolService = None):
         self.__indexing_task = indexing_task
+        self.__worker_pool_service = worker_pool_service  # A temporary one is started for each conversion if not given
         self.__log_queue = log_queue
         self.__indexing_stop_event = indexing_stop_event
 
     def save_processed_files(self, indexDB: IndexDB, file_paths_to_process: List[str] = None):
         MediaProcessor.__logger.info("BEGIN:: Media file conversion")
-        media_files_from_db = indexDB.get_all_media_file_ordered()
+        media_files_from_db = indexDB.iter_media_file_summaries(order_by_capture_date=True)
         if file_paths_to_process is not None:
             file_path_set = set(file_paths_to_process)
-            media_files: List[MediaFile] = list(filter(lambda x: x.file_path in file_path_set, media_files_from_db))
+            media_files: List[MediaFileSummary] = list(filter(lambda x: x.file_path in file_path_set, media_files_from_db))
         else:
-            media_files: List[MediaFile] = list(media_files_from_db)
+            media_files: List[MediaFileSummary] = list(media_files_from_db)
 
         if (not media_files or len(media_files) == 0):
             MediaProcessor.__logger.info("No media files to process")
         else:
-            manager = Manager()
-            save_file_path_computation_lock = manager.Lock() # pylint: disable=maybe-no-member
-
-            if self.__indexing_task.settings.gpu_count == 0:
-                self.start_cpu_pool(save_file_path_computation_lock, media_files).wait_and_get_results()
-            else:
-                image_media_files = []
-                video_media_files = []
-                for media_file in media_files:
-                    media_file: MediaFile = media_file
-                    if media_file.file_type == ScannedFileType.IMAGE.name:
-                        image_media_files.append(media_file)
-                    if media_file.file_type == ScannedFileType.VIDEO.name:
-                        video_media_files.append(media_file)
-                cpu_pool = self.start_cpu_pool(save_file_path_computation_lock, image_media_files)
-                gpu_pool = self.start_gpu_pool(save_file_path_computation_lock, video_media_files)
-                cpu_pool.wait_and_get_results()
-                gpu_pool.wait_and_get_results()
+            self.start_conversion(indexDB)
+            try:
+                media_files = ConversionScheduler.order(self.allocate_output_paths(media_files), self.__indexing_task.settings.conversion_order)
+                total_media_files = len(media_files)
+                for media_file_num, media_file in enumerate(media_files, start=1):
+                    self.submit_conversion(media_file, task_id="{}/{}".format(media_file_num, total_media_files))
+            finally:
+                self.finish_conversion()
         MediaProcessor.__logger.info("END:: Media file conversion")
 
-    def start_gpu_pool(self, save_file_path_computation_lock: Lock, media_files: List[MediaFile]):
-        process_count = self.__indexing_task.settings.gpu_count * self.__indexing_task.settings.gpu_workers
-        pool = PyProcessPool(pool_name="GPUConversionWorker", process_count=process_count, log_queue=self.__log_queue, target=MediaProcessor.conversion_process_exec,
-                             initializer=IndexDB.create_instance, terminator=IndexDB.destroy_instance, stop_event=self.__indexing_stop_event)
-        tasks = []
-        for media_file_index, media_file in enumerate(media_files, start=0):
-            target_gpu = media_file_index % self.__indexing_task.settings.gpu_count
-            tasks.append([media_file.file_path, target_gpu, save_file_path_computation_lock])
-        pool.submit(tasks)
-        return pool
-
-    def start_cpu_pool(self, save_file_path_computation_lock: Lock, media_files: List[MediaFile]):
-        pool = PyProcessPool(pool_name="CPUConversionWorker", process_count=self.__indexing_task.settings.conversion_workers, log_queue=self.__log_queue,
-                             target=MediaProcessor.conversion_process_exec, initializer=IndexDB.create_instance, terminator=IndexDB.destroy_instance, stop_event=self.__indexing_stop_event)
-        tasks = list(map(lambda media_file: (media_file.file_path, -1, save_file_path_computation_lock), media_files))
-        pool.submit(tasks)
-        return pool
+    def start_conversion(self, indexDB: IndexDB):
+        settings = self.__indexing_task.settings
+        self.__owned_worker_pool_service = None
+        if self.__worker_pool_service is None:
+            self.__owned_worker_pool_service = WorkerPoolService(self.__log_queue)
+        worker_pool_service = self.__worker_pool_service or self.__owned_worker_pool_service
+        self.__output_path_allocator = OutputPathAllocator(indexDB, settings)
+        self.__conversion_scheduler = ConversionScheduler(settings.gpu_count)
+        self.__cpu_lane = worker_pool_service.get_lane(WorkerPoolService.CPU_CONVERSION_LANE, MediaProcessor.conversion_process_exec, settings)
+        self.__gpu_lane = worker_pool_service.get_lane(WorkerPoolService.GPU_CONVERSION_LANE, MediaProcessor.conversion_process_exec, settings) if settings.gpu_count > 0 else None
+        self.__queued_conversions: List[Tuple[MediaFileSummary, dict]] = []
+        self.__queued_conversions_lock = threading.Lock()
+        self.__max_queued_conversions = max(1, settings.pipeline_queue_size)
+
+    def queue_conversion(self, media_file: MediaFileSummary, media_file_values: dict = None):
+        # For the streaming pipeline. The conversions queued between two flushes are submitted together, in the order of the conversion policy.
+        with self.__queued_conversions_lock:
+            self.__queued_conversions.append((media_file, media_file_values))
+            window_full = len(self.__queued_conversions) >= self.__max_queued_conversions
+        if window_full:
+            self.flush_conversions()
+
+    def submit_conversion(self, media_file: MediaFileSummary, media_file_values: dict = None, task_id: str = None):
+        # Newly indexed files are passed as values, as the IndexDBWriter may not have committed them yet. Other files are read by the worker.
+        try:
+            output_rel_file_path = self.__output_path_allocator.allocate(media_file)
+        except:
+            MediaProcessor.__logger.exception("Failed to allocate an output path for %s", media_file.file_path)
+            return
+        if self.__gpu_lane is None or media_file.file_type == ScannedFileType.IMAGE.name:
+            self.__cpu_lane.put((media_file.file_path, media_file_values, output_rel_file_path, -1), task_id)
+        elif media_file.file_type == ScannedFileType.VIDEO.name:
+            target_gpu = self.__conversion_scheduler.assign_gpu(media_file)
+            self.__gpu_lane.put((media_file.file_path, media_file_values, output_rel_file_path, target_gpu), task_id)
+
+    def allocate_output_paths(self, media_files: List[MediaFileSummary]) -> List[MediaFileSummary]:
+        # Names are allocated in the order of the given media files, before the conversions are reordered. Files that fail are left out.
+        allocated_media_files = []
+        for media_file in media_files:
+            try:
+                media_file.output_rel_file_path = self.__output_path_allocator.allocate(media_file)
+                allocated_media_files.append(media_file)
+            except:
+                MediaProcessor.__logger.exception("Failed to allocate an output path for %s", media_file.file_path)
+        return allocated_media_files
+
+    def flush_conversions(self):
+        # Submits the queued conversions and sends the conversions waiting for their chunk to fill up, for when no more are submitted for a while
+        with self.__queued_conversions_lock:
+            (queued_conversions, self.__queued_conversions) = (self.__queued_conversions, [])
+        if queued_conversions:
+            values_by_path = {media_file.file_path: media_file_values for (media_file, media_file_values) in queued_conversions}
+            # Sorted as the IndexDB returns them for the phased pipeline, so that colliding output names get the same suffixes whatever order the files were indexed in
+            media_files = sorted((media_file for (media_file, _) in queued_conversions), key=lambda media_file: (media_file.capture_date is not None, media_file.capture_date, media_file.file_path))
+            for media_file in ConversionScheduler.order(self.allocate_output_paths(media_files), self.__indexing_task.settings.conversion_order):
+                self.submit_conversion(media_file, values_by_path[media_file.file_path])
+        for lane in (self.__cpu_lane, self.__gpu_lane):
+            if lane is not None:
+                lane.flush()
+
+    def finish_conversion(self):
+        # Waits for the submitted conversions only, the workers stay up for the next run
+        worker_pool_service = self.__worker_pool_service or self.__owned_worker_pool_service
+        try:
+            if not self.__indexing_stop_event.is_set():
+                self.flush_conversions()
+            for lane in (self.__cpu_lane, self.__gpu_lane):
+                if lane is not None:
+                    lane.wait_for_tasks(self.__indexing_stop_event)
+            failed_write_count = worker_pool_service.flush_writes()
+            if failed_write_count > 0:
+                MediaProcessor.__logger.error("%s IndexDB writes failed, see the errors logged by IndexDBWriter", failed_write_count)
+        finally:
+            if self.__owned_worker_pool_service is not None:
+                self.__owned_worker_pool_service.shutdown()
 
     @staticmethod
-    def conversion_process_exec(media_file_path: str, target_gpu: int, save_file_path_computation_lock: Lock, indexDB: IndexDB, task_id: str):
+    def conversion_process_exec(media_file_path: str, media_file_values: dict, output_rel_file_path: str, target_gpu: int, indexDB: IndexDB, task_id: str):
         settings: Settings = indexDB.get_settings()
-        media_file: MediaFile = indexDB.get_by_file_path(media_file_path)
+        media_file: MediaFile = MediaFile.from_dict(media_file_values) if media_file_values is not None else indexDB.get_by_file_path(media_file_path)
         conversion_settings_hash: str = settings.generate_image_settings_hash() if(ScannedFileType.IMAGE.name == media_file.file_type) else settings.generate_video_settings_hash()
+        hash_algorithm: str = MiscUtils.get_hash_algorithm(settings.hash_algorithm)
         processing_start_time = time.time()
         original_file_path = media_file.file_path
         save_file_path = "UNKNOWN"
         try:
-            with save_file_path_computation_lock:
-                save_file_path = MediaProcessor.get_save_file_path(indexDB, media_file, settings)
+            save_file_path = MediaProcessor.get_save_file_path(indexDB, media_file, output_rel_file_path, settings)
 
             skip_conversion: bool = False
             if (not media_file.capture_date and not settings.convert_unknown):  # No captureDate and conversion not requested for unknown
@@ -91,20 +146,27 @@ class MediaProcessor:
             else:
                 os.makedirs(os.path.dirname(save_file_path), exist_ok=True)
                 if (not settings.overwrite_output_files and os.path.exists(save_file_path)
-                        and media_file.converted_file_hash == MiscUtils.generate_hash(save_file_path)  # Converted file hash is None if the original file is re-indexed
+                        and media_file.converted_file_hash is not None  # Converted file hash is None if the original file is re-indexed
                         and media_file.conversion_settings_hash == conversion_settings_hash):  # Settings hash is None if the original file is re-indexed
-                    skip_conversion = True
+                    fingerprint_outdated = media_file.converted_file_size is None or media_file.converted_file_hash_algorithm != hash_algorithm
+                    skip_conversion = MediaProcessor.is_converted_file_unchanged(media_file, save_file_path, hash_algorithm)
+                    if skip_conversion and fingerprint_outdated:
+                        indexDB.update_media_file(media_file, MediaProcessor.__CONVERTED_FILE_COLUMNS)
+                        logging.info("Updated Converted File Fingerprint %s: %s", task_id, save_file_path)
 
             if not skip_conversion:
-                if ScannedFileType.IMAGE.name == media_file.file_type:
-                    MediaProcessor.convert_image_file(settings, media_file, original_file_path, save_file_path)
-                if ScannedFileType.VIDEO.name == media_file.file_type:
-                    MediaProcessor.convert_video_file(settings, media_file, original_file_path, save_file_path, target_gpu)
+                (threads, memory_mb) = ResourceBudget.estimate(media_file, settings, target_gpu)
+                with ResourceBudget.reserve(threads, memory_mb):
+                    if ScannedFileType.IMAGE.name == media_file.file_type:
+                        MediaProcessor.convert_image_file(settings, media_file, original_file_path, save_file_path, threads, memory_mb)
+                    if ScannedFileType.VIDEO.name == media_file.file_type:
+                        MediaProcessor.convert_video_file(settings, media_file, original_file_path, save_file_path, target_gpu, threads)
                 MediaProcessor.copy_exif_to_file(settings, original_file_path, save_file_path, media_file)
-                media_file.converted_file_hash = MiscUtils.generate_hash(save_file_path)
+                media_file.converted_file_hash = MiscUtils.generate_hash(save_file_path, hash_algorithm)
+                media_file.converted_file_hash_algorithm = hash_algorithm
+                MediaProcessor.set_converted_file_fingerprint(media_file, os.stat(save_file_path))
                 media_file.conversion_settings_hash = conversion_settings_hash
-                with save_file_path_computation_lock:
-                    indexDB.insert_media_file(media_file)
+                indexDB.update_media_file(media_file, MediaProcessor.__CONVERTED_FILE_COLUMNS)
                 logging.info("Converted %s: %s -> %s (%s%%) (%ss)", task_id, original_file_path, save_file_path,
                              round(os.path.getsize(save_file_path) / media_file.original_size * 100, 2), round(time.time() - processing_start_time, 2))
             else:
@@ -118,7 +180,7 @@ class MediaProcessor:
             logging.exception("Failed Processing %s: %s -> %s (%ss)", task_id, original_file_path, save_file_path, round(time.time() - processing_start_time, 2))
 
     @staticmethod
-    def convert_image_file(settings: Settings, media_file: MediaFile, original_file_path: str, save_file_path: str):
+    def convert_image_file(settings: Settings, media_file: MediaFile, original_file_path: str, save_file_path: str, threads: int = 0, memory_mb: int = 0):
         # Sample: magick convert -resize 320x480 -quality 75 inputFile.cr2 outputfile.jpg
         args = [settings.path_magick, "convert", "-quality", str(settings.image_compression_quality), "{}[0]".format(original_file_path), save_file_path]
 
@@ -126,10 +188,16 @@ class MediaProcessor:
         if new_dimentions:
             args.insert(2, "-resize")
             args.insert(3, "{}x{}".format(new_dimentions['height'], new_dimentions['width']))
-        MiscUtils.exec_subprocess(args, "Image conversion failed")
+        if threads > 0:
+            args[2:2] = ["-limit", "thread", str(threads)]
+        if memory_mb > 0:
+            # Pixels beyond the memory limit are cached in a memory mapped file and then on disk, instead of running out of memory
+            args[2:2] = ["-limit", "memory", "{}MiB".format(memory_mb), "-limit", "map", "{}MiB".format(memory_mb * 2)]
+        SubprocessSupervisor.run(SubprocessSupervisor.MAGICK, args, "Image conversion failed",
+                                 SubprocessSupervisor.get_timeout(SubprocessSupervisor.MAGICK, media_file.original_size, settings.subprocess_timeout_factor))
 
     @staticmethod
-    def convert_video_file(settings: Settings, media_file: MediaFile, original_file_path: str, new_file_path: str, target_gpu: int):
+    def convert_video_file(settings: Settings, media_file: MediaFile, original_file_path: str, new_file_path: str, target_gpu: int, threads: int = 0):
         new_dimentions = MediaProcessor.get_new_dimentions(media_file.height, media_file.width, settings.video_max_dimension)
         audio_bitrate_arg = str(settings.video_audio_bitrate) + "k"
 
@@ -141,6 +209,9 @@ class MediaProcessor:
             if new_dimentions:
                 args.insert(14, "-vf")
                 args.insert(15, "scale={}:{}".format(new_dimentions['width'], new_dimentions['height']))
+            if threads > 0:
+                args[-2:-2] = ["-x265-params", "pools={}".format(threads)]  # Size of the x265 thread pool
+                args[1:1] = ["-threads", str(threads)]  # Decoder threads
         else:
             # GPU Sample: ffmpeg -noautorotate -vsync 0 -hwaccel cuda -hwaccel_device 0 -hwaccel_output_format cuda -i input -c:v hevc_nvenc -preset medium -rc vbr -cq 38 -gpu 0 -c:a aac -ac 2 -b:a 128k -tag:v hvc1 -vf scale_cuda=2560:1440 -y output.mp4
             args = [settings.path_ffmpeg, "-noautorotate", "-vsync", "0", "-hwaccel", "cuda", "-hwaccel_device", str(target_gpu),
@@ -150,7 +221,8 @@ class MediaProcessor:
             if new_dimentions:
                 args.insert(30, "-vf")
                 args.insert(31, "scale_cuda={}:{}".format(new_dimentions['width'], new_dimentions['height']))
-        MiscUtils.exec_subprocess(args, "Video conversion failed")
+        SubprocessSupervisor.run(SubprocessSupervisor.FFMPEG, args, "Video conversion failed",
+                                 SubprocessSupervisor.get_timeout(SubprocessSupervisor.FFMPEG, media_file.original_size, settings.subprocess_timeout_factor))
 
     @staticmethod
     def copy_exif_to_file(settings: Settings, original_file_path: str, new_file_path: str, media_file: MediaFile):
@@ -160,7 +232,8 @@ class MediaProcessor:
         if ScannedFileType.IMAGE.name == media_file.file_type and media_file.extension in ["HEIC", "HEIF"]:
             args.insert(4, "-x")
             args.insert(5, "Orientation")
-        MiscUtils.exec_subprocess(args, "EXIF copy failed")
+        SubprocessSupervisor.run(SubprocessSupervisor.EXIFTOOL, args, "EXIF copy failed",
+                                 SubprocessSupervisor.get_timeout(SubprocessSupervisor.EXIFTOOL, media_file.original_size, settings.subprocess_timeout_factor))
 
     @staticmethod
     def get_new_dimentions(original_height: int, original_width: int, max_dimention: int):
@@ -175,70 +248,69 @@ class MediaProcessor:
         return {'height': math.floor(new_height), 'width': math.floor(new_width)}
 
     @staticmethod
-    def get_save_file_path(indexDB: IndexDB, media_file: MediaFile, settings: Settings):
-        capture_date: datetime = media_file.capture_date
-        out_dir = settings.output_dir if capture_date else settings.unknown_output_dir
-        if media_file.output_rel_file_path:
-            return os.path.join(out_dir, media_file.output_rel_file_path)
-
-        save_dir_path = MediaProcessor.get_save_dir_path(media_file, settings)
-        file_extension = MediaProcessor.get_save_file_extension(media_file)
-        save_file_path = MediaProcessor.get_output_file_path(media_file, save_dir_path, file_extension, settings)
-        media_file.output_rel_file_path = os.path.relpath(save_file_path, out_dir)
-        indexDB.insert_media_file(media_file)
-        return save_file_path
-
-    @staticmethod
-    def get_save_dir_path(media_file: MediaFile, settings: Settings):
-        if media_file.capture_date:
-            output_dir_path_type = settings.output_dir_path_type
-            output_dir = settings.output_dir
+    def is_converted_file_unchanged(media_file: MediaFile, save_file_path: str, hash_algorithm: str) -> bool:
+        """Compares the output with the size and mtime recorded at conversion time, without reading it.
+        Outputs converted before these were recorded, or hashed with another algorithm, are verified by hash once and updated in place."""
+        save_file_stat = os.stat(save_file_path)
+        if media_file.converted_file_size is not None:
+            if (save_file_stat.st_size, save_file_stat.st_mtime_ns) != (media_file.converted_file_size, media_file.converted_file_mtime_ns):
+                return False
         else:
-            output_dir_path_type = settings.unknown_output_dir_path_type
-            output_dir = settings.unknown_output_dir
-
-        if output_dir_path_type == "Use Original Paths":
-            parent_dir_rel_path = os.path.relpath(media_file.parent_dir_path, settings.monitored_dir) if media_file.parent_dir_path != settings.monitored_dir else ''
-            save_dir_path = os.path.join(output_dir, parent_dir_rel_path)
-        elif output_dir_path_type == "Sort by Date":
-            date_path = os.path.join(str(media_file.capture_date.year), str(media_file.capture_date.month), str(media_file.capture_date.day))
-            save_dir_path = os.path.join(output_dir, date_path)
-        else:
-            raise RuntimeError("Output file path type '{}' is not supported", output_dir_path_type)
-        return save_dir_path
+            stored_hash_algorithm = media_file.converted_file_hash_algorithm or MiscUtils.HASH_ALGORITHM_SHA1
+            if media_file.converted_file_hash != MiscUtils.generate_hash(save_file_path, stored_hash_algorithm):
+                return False
+            MediaProcessor.set_converted_file_fingerprint(media_file, save_file_stat)
+            media_file.converted_file_hash_algorithm = stored_hash_algorithm
+        if media_file.converted_file_hash_algorithm != hash_algorithm:
+            media_file.converted_file_hash = MiscUtils.generate_hash(save_file_path, hash_algorithm)
+            media_file.converted_file_hash_algorithm = hash_algorithm
+        return True
 
     @staticmethod
-    def get_save_file_extension(media_file: MediaFile):
-        if ScannedFileType.IMAGE.name == media_file.file_type:
-            file_extension = ".JPG"
-        elif ScannedFileType.VIDEO.name == media_file.file_type:
-            file_extension = ".MP4"
-        else:
-            raise RuntimeError("Media file type '{}' is not supported", media_file.file_type)
-        return file_extension
+    def set_converted_file_fingerprint(media_file: MediaFile, save_file_stat: os.stat_result):
+        media_file.converted_file_size = save_file_stat.st_size
+        media_file.converted_file_mtime_ns = save_file_stat.st_mtime_ns
 
-    @staticmethod
-    def get_output_file_path(media_file: MediaFile, save_dir_path: str, file_extension: str, settings: Settings):
-        output_dir_path_type = settings.output_dir_path_type if media_file.capture_date else settings.unknown_output_dir_path_type
-        if output_dir_path_type == "Use Original Paths":
-            original_file_name = os.path.basename(media_file.file_path)
-            file_name_tuple = os.path.splitext(original_file_name)
-            file_name = file_name_tuple[0]
-        elif output_dir_path_type == "Sort by Date":
-            file_name = media_file.capture_date.strftime("%H%M%S")
-        else:
-            raise RuntimeError("Output file path type '{}' is not supported", output_dir_path_type)
+    def verify_converted_files(self, indexDB: IndexDB) -> List[str]:
+        MediaProcessor.__logger.info("BEGIN:: Converted file verification")
+        media_files: List[MediaFile] = [media_file for media_file in indexDB.get_all_media_file_ordered() if media_file.converted_file_hash and media_file.output_rel_file_path]
+        total_media_files = len(media_files)
+        mismatched_media_files: List[MediaFile] = []
+        with ThreadPoolExecutor(max_workers=max(1, self.__indexing_task.settings.hashing_threads), thread_name_prefix="OutputVerifier") as executor:
+            verification_futures = {}
+            for media_file in media_files:
+                out_dir = self.__indexing_task.settings.output_dir if media_file.capture_date else self.__indexing_task.settings.unknown_output_dir
+                save_file_path = os.path.join(out_dir, media_file.output_rel_file_path)
+                verification_futures[executor.submit(self.__verify_converted_file, save_file_path, media_file.converted_file_hash,
+                                                     media_file.converted_file_hash_algorithm or MiscUtils.HASH_ALGORITHM_SHA1)] = (media_file, save_file_path)
+            for verified_file_num, verification_future in enumerate(as_completed(verification_futures), start=1):
+                (media_file, save_file_path) = verification_futures[verification_future]
+                if verification_future.result():
+                    MediaProcessor.__logger.info("Verified %s/%s: %s", verified_file_num, total_media_files, save_file_path)
+                else:
+                    MediaProcessor.__logger.warning("Verification Failed %s/%s: %s -> %s", verified_file_num, total_media_files, media_file.file_path, save_file_path)
+                    mismatched_media_files.append(media_file)
+        for media_file in mismatched_media_files:  # Converted again by the next processing run
+            media_file.converted_file_hash = None
+            media_file.converted_file_size = None
+            media_file.converted_file_mtime_ns = None
+        indexDB.save_media_files()
+        MediaProcessor.__logger.info("Verified %s converted files, %s missing or mismatched", total_media_files, len(mismatched_media_files))
+        MediaProcessor.__logger.info("END:: Converted file verification")
+        return [media_file.file_path for media_file in mismatched_media_files]
 
-        ideal_save_path = os.path.join(save_dir_path, file_name + file_extension)
-        if not os.path.isfile(ideal_save_path):
-            save_file_path = ideal_save_path
-        else:
-            files = sorted(filter(lambda k: k.startswith(file_name) and k.endswith(file_extension), os.listdir(save_dir_path)), reverse=True)
-            # We know that there is atleast 1 file; but we would have applied the counter only if there were 2 or more
-            if len(files) > 1:
-                # TODO this will not work when path contains symbols like '.' , '_'. May also fail due to parallel processing. Best to use DB and find out a good filename.
-                next = int(files[0].rsplit(".")[0].rsplit("_")[-1]) + 1
-            else:
-                next = 1
-            save_file_path = os.path.join(save_dir_path, file_name + "_" + format(next, '05d') + file_extension)
-        return save_file_path
+    def __verify_converted_file(self, save_file_path: str, converted_file_hash: str, hash_algorithm: str) -> bool:
+        if self.__indexing_stop_event.is_set():
+            return True
+        try:
+            return MiscUtils.generate_hash(save_file_path, hash_algorithm) == converted_file_hash
+        except OSError:
+            return False
+
+    @staticmethod
+    def get_save_file_path(indexDB: IndexDB, media_file: MediaFile, output_rel_file_path: str, settings: Settings):
+        # The output path is allocated by the parent process, it is saved with the media file the first time it is used
+        if media_file.output_rel_file_path != output_rel_file_path:
+            media_file.output_rel_file_path = output_rel_file_path
+            indexDB.update_media_file(media_file, ["output_rel_file_path"])
+        return os.path.join(OutputPathAllocator.get_out_dir(media_file, settings), output_rel_file_path)
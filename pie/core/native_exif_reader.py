@@ -0,0 +1,408 @@
+import logging
+import math
+import struct
+from logging import Logger
+from typing import Dict, List, Tuple
+
+
+class NativeExifReader:
+    """In-process reader for the EXIF header of JPEG, TIFF and HEIC files.
+
+    Produces a dict with the same keys and value formats that ExifHelper reads from exiftool's JSON output. Returns None
+    whenever the layout isn't understood so that the caller can fall back to exiftool.
+    """
+    __logger: Logger = logging.getLogger('NativeExifReader')
+
+    SUPPORTED_EXTENSIONS = {"JPG", "JPEG", "TIF", "TIFF", "HEIC", "HEIF"}
+
+    __JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+    __HEIC_BRANDS = {b"heic", b"heix", b"heim", b"heis"}
+    __TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8}
+    __ORIENTATIONS = {
+        1: "Horizontal (normal)",
+        2: "Mirror horizontal",
+        3: "Rotate 180",
+        4: "Mirror vertical",
+        5: "Mirror horizontal and rotate 270 CW",
+        6: "Rotate 90 CW",
+        7: "Mirror horizontal and rotate 90 CW",
+        8: "Rotate 270 CW"
+    }
+    __TIFF_READ_SIZE = 1048576  # IFDs outside the first 1MB are left to exiftool
+
+    __TAG_IMAGE_WIDTH = 0x0100
+    __TAG_IMAGE_HEIGHT = 0x0101
+    __TAG_MAKE = 0x010F
+    __TAG_MODEL = 0x0110
+    __TAG_ORIENTATION = 0x0112
+    __TAG_EXIF_IFD = 0x8769
+    __TAG_GPS_IFD = 0x8825
+    __TAG_DATE_TIME_ORIGINAL = 0x9003
+    __TAG_MAKER_NOTE = 0x927C
+    __TAG_EXIF_IMAGE_WIDTH = 0xA002
+    __TAG_EXIF_IMAGE_HEIGHT = 0xA003
+    __TAG_LENS_INFO = 0xA432
+    __TAG_LENS_MODEL = 0xA434
+    __TAG_GPS_LATITUDE_REF = 0x0001
+    __TAG_GPS_LATITUDE = 0x0002
+    __TAG_GPS_LONGITUDE_REF = 0x0003
+    __TAG_GPS_LONGITUDE = 0x0004
+    __TAG_GPS_ALTITUDE_REF = 0x0005
+    __TAG_GPS_ALTITUDE = 0x0006
+
+    @staticmethod
+    def read_exif(file_path: str) -> Dict:
+        try:
+            with open(file_path, "rb") as file:
+                header = file.read(12)
+                if header[:2] == b"\xFF\xD8":
+                    return NativeExifReader.__read_jpeg(file)
+                if header[:4] in (b"II*\x00", b"MM\x00*"):
+                    return NativeExifReader.__read_tiff_file(file)
+                if header[4:8] == b"ftyp" and header[8:12] in NativeExifReader.__HEIC_BRANDS:
+                    return NativeExifReader.__read_heic(file)
+        except:
+            NativeExifReader.__logger.debug("Failed to read EXIF natively from %s", file_path, exc_info=True)
+        return None
+
+    @staticmethod
+    def __read_jpeg(file) -> Dict:
+        exif = None
+        width = height = None
+        file.seek(2)
+        while True:
+            marker = file.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            marker_type = marker[1]
+            if marker_type == 0xFF:  # Fill byte
+                file.seek(-1, 1)
+                continue
+            if marker_type in (0xD9, 0xDA):  # End of image / Start of scan
+                break
+            segment_length = struct.unpack(">H", file.read(2))[0]
+            segment_start = file.tell()
+            if marker_type == 0xE1 and exif is None:
+                segment = file.read(segment_length - 2)
+                if segment[:6] == b"Exif\x00\x00":
+                    exif = NativeExifReader.__read_tiff(segment[6:])
+            elif marker_type in NativeExifReader.__JPEG_SOF_MARKERS:
+                (height, width) = struct.unpack(">xHH", file.read(5))
+            file.seek(segment_start + segment_length - 2)
+        if width is None or exif is None:
+            return None
+        exif.update({"FileType": "JPEG", "MIMEType": "image/jpeg", "ImageWidth": width, "ImageHeight": height})
+        return exif
+
+    @staticmethod
+    def __read_tiff_file(file) -> Dict:
+        file.seek(0)
+        exif = NativeExifReader.__read_tiff(file.read(NativeExifReader.__TIFF_READ_SIZE))
+        if exif is None or "ImageWidth" not in exif:
+            return None
+        exif.update({"FileType": "TIFF", "MIMEType": "image/tiff"})
+        return exif
+
+    @staticmethod
+    def __read_heic(file) -> Dict:
+        file.seek(0, 2)
+        file_size = file.tell()
+        meta = None
+        for (box_type, box_start, box_end) in NativeExifReader.__iter_file_boxes(file, 0, file_size):
+            if box_type == b"meta":
+                file.seek(box_start)
+                meta = file.read(box_end - box_start)
+                break
+        if meta is None:
+            return None
+
+        primary_item_id = None
+        item_types: Dict[int, bytes] = {}
+        item_locations: Dict[int, List[Tuple[int, int]]] = {}
+        item_properties: Dict[int, List[int]] = {}
+        properties: List[Tuple[bytes, bytes]] = []
+        for (box_type, box_start, box_end) in NativeExifReader.__iter_boxes(meta, 4, len(meta)):
+            if box_type == b"pitm":
+                primary_item_id = struct.unpack(">H", meta[box_start + 4:box_start + 6])[0] if meta[box_start] == 0 else struct.unpack(">I", meta[box_start + 4:box_start + 8])[0]
+            elif box_type == b"iinf":
+                item_types = NativeExifReader.__read_heic_iinf(meta, box_start, box_end)
+            elif box_type == b"iloc":
+                item_locations = NativeExifReader.__read_heic_iloc(meta, box_start)
+            elif box_type == b"iprp":
+                for (child_type, child_start, child_end) in NativeExifReader.__iter_boxes(meta, box_start, box_end):
+                    if child_type == b"ipco":
+                        properties = [(property_type, meta[property_start:property_end]) for (property_type, property_start, property_end) in NativeExifReader.__iter_boxes(meta, child_start, child_end)]
+                    elif child_type == b"ipma":
+                        item_properties = NativeExifReader.__read_heic_ipma(meta, child_start)
+        if primary_item_id is None:
+            return None
+
+        exif = None
+        for item_id, item_type in item_types.items():
+            if item_type == b"Exif" and item_id in item_locations:
+                exif_data = b"".join(NativeExifReader.__read_at(file, offset, length) for (offset, length) in item_locations[item_id])
+                tiff_header_offset = struct.unpack(">I", exif_data[:4])[0]
+                exif = NativeExifReader.__read_tiff(exif_data[4 + tiff_header_offset:])
+                break
+        if exif is None:
+            return None
+
+        for property_index in item_properties.get(primary_item_id, []):
+            if property_index < 1 or property_index > len(properties):
+                continue
+            (property_type, property_data) = properties[property_index - 1]
+            if property_type == b"ispe":
+                (exif["ImageWidth"], exif["ImageHeight"]) = struct.unpack(">II", property_data[4:12])
+        if "ImageWidth" not in exif:
+            return None
+        exif.update({"FileType": "HEIC", "MIMEType": "image/heic"})
+        return exif
+
+    @staticmethod
+    def __read_heic_iinf(meta: bytes, box_start: int, box_end: int) -> Dict[int, bytes]:
+        item_types: Dict[int, bytes] = {}
+        entries_start = box_start + (6 if meta[box_start] == 0 else 8)
+        for (box_type, infe_start, _) in NativeExifReader.__iter_boxes(meta, entries_start, box_end):
+            if box_type != b"infe" or meta[infe_start] < 2:
+                continue
+            if meta[infe_start] == 2:
+                item_id = struct.unpack(">H", meta[infe_start + 4:infe_start + 6])[0]
+                item_type_start = infe_start + 8
+            else:
+                item_id = struct.unpack(">I", meta[infe_start + 4:infe_start + 8])[0]
+                item_type_start = infe_start + 10
+            item_types[item_id] = meta[item_type_start:item_type_start + 4]
+        return item_types
+
+    @staticmethod
+    def __read_heic_iloc(meta: bytes, box_start: int) -> Dict[int, List[Tuple[int, int]]]:
+        version = meta[box_start]
+        offset_size = meta[box_start + 4] >> 4
+        length_size = meta[box_start + 4] & 0x0F
+        base_offset_size = meta[box_start + 5] >> 4
+        index_size = (meta[box_start + 5] & 0x0F) if version in (1, 2) else 0
+        position = box_start + 6
+        if version < 2:
+            item_count = NativeExifReader.__read_uint(meta, position, 2)
+            position += 2
+        else:
+            item_count = NativeExifReader.__read_uint(meta, position, 4)
+            position += 4
+        item_locations: Dict[int, List[Tuple[int, int]]] = {}
+        for _ in range(item_count):
+            item_id_size = 2 if version < 2 else 4
+            item_id = NativeExifReader.__read_uint(meta, position, item_id_size)
+            position += item_id_size
+            construction_method = 0
+            if version in (1, 2):
+                construction_method = NativeExifReader.__read_uint(meta, position, 2) & 0x0F
+                position += 2
+            position += 2  # data_reference_index
+            base_offset = NativeExifReader.__read_uint(meta, position, base_offset_size)
+            position += base_offset_size
+            extent_count = NativeExifReader.__read_uint(meta, position, 2)
+            position += 2
+            extents = []
+            for _ in range(extent_count):
+                position += index_size
+                extent_offset = NativeExifReader.__read_uint(meta, position, offset_size)
+                position += offset_size
+                extent_length = NativeExifReader.__read_uint(meta, position, length_size)
+                position += length_size
+                extents.append((base_offset + extent_offset, extent_length))
+            if construction_method == 0:  # Only data stored in the file itself is supported
+                item_locations[item_id] = extents
+        return item_locations
+
+    @staticmethod
+    def __read_heic_ipma(meta: bytes, box_start: int) -> Dict[int, List[int]]:
+        version = meta[box_start]
+        large_property_index = meta[box_start + 3] & 0x01
+        entry_count = NativeExifReader.__read_uint(meta, box_start + 4, 4)
+        position = box_start + 8
+        item_properties: Dict[int, List[int]] = {}
+        for _ in range(entry_count):
+            item_id_size = 2 if version < 1 else 4
+            item_id = NativeExifReader.__read_uint(meta, position, item_id_size)
+            position += item_id_size
+            association_count = meta[position]
+            position += 1
+            property_indexes = []
+            for _ in range(association_count):
+                if large_property_index:
+                    property_indexes.append(NativeExifReader.__read_uint(meta, position, 2) & 0x7FFF)
+                    position += 2
+                else:
+                    property_indexes.append(meta[position] & 0x7F)
+                    position += 1
+            item_properties[item_id] = property_indexes
+        return item_properties
+
+    @staticmethod
+    def __iter_file_boxes(file, start: int, end: int):
+        position = start
+        while position + 8 <= end:
+            file.seek(position)
+            (box_size, box_type) = struct.unpack(">I4s", file.read(8))
+            header_size = 8
+            if box_size == 1:
+                box_size = struct.unpack(">Q", file.read(8))[0]
+                header_size = 16
+            elif box_size == 0:
+                box_size = end - position
+            if box_size < header_size:
+                return
+            yield (box_type, position + header_size, position + box_size)
+            position += box_size
+
+    @staticmethod
+    def __iter_boxes(data: bytes, start: int, end: int):
+        position = start
+        while position + 8 <= end:
+            (box_size, box_type) = struct.unpack(">I4s", data[position:position + 8])
+            header_size = 8
+            if box_size == 1:
+                box_size = struct.unpack(">Q", data[position + 8:position + 16])[0]
+                header_size = 16
+            elif box_size == 0:
+                box_size = end - position
+            if box_size < header_size:
+                return
+            yield (box_type, position + header_size, min(position + box_size, end))
+            position += box_size
+
+    @staticmethod
+    def __read_uint(data: bytes, position: int, size: int) -> int:
+        return int.from_bytes(data[position:position + size], byteorder="big") if size > 0 else 0
+
+    @staticmethod
+    def __read_at(file, offset: int, length: int) -> bytes:
+        file.seek(offset)
+        return file.read(length)
+
+    @staticmethod
+    def __read_tiff(data: bytes) -> Dict:
+        if data[:4] == b"II*\x00":
+            byte_order = "<"
+        elif data[:4] == b"MM\x00*":
+            byte_order = ">"
+        else:
+            return None
+        ifd0 = NativeExifReader.__read_ifd(data, byte_order, struct.unpack(byte_order + "I", data[4:8])[0])
+        exif_ifd = NativeExifReader.__read_ifd(data, byte_order, ifd0[NativeExifReader.__TAG_EXIF_IFD][0]) if NativeExifReader.__TAG_EXIF_IFD in ifd0 else {}
+        gps_ifd = NativeExifReader.__read_ifd(data, byte_order, ifd0[NativeExifReader.__TAG_GPS_IFD][0]) if NativeExifReader.__TAG_GPS_IFD in ifd0 else {}
+        if NativeExifReader.__TAG_DATE_TIME_ORIGINAL not in exif_ifd:
+            return None  # exiftool may still find a capture date in XMP or other metadata blocks
+        if NativeExifReader.__TAG_MAKER_NOTE in exif_ifd and NativeExifReader.__TAG_LENS_MODEL not in exif_ifd:
+            return None  # exiftool would take the lens from the maker notes, which aren't decoded here
+
+        exif = {}
+        NativeExifReader.__put(exif, "ImageWidth", NativeExifReader.__get_int(ifd0, NativeExifReader.__TAG_IMAGE_WIDTH))
+        NativeExifReader.__put(exif, "ImageHeight", NativeExifReader.__get_int(ifd0, NativeExifReader.__TAG_IMAGE_HEIGHT))
+        NativeExifReader.__put(exif, "Make", NativeExifReader.__get_str(ifd0, NativeExifReader.__TAG_MAKE))
+        NativeExifReader.__put(exif, "Model", NativeExifReader.__get_str(ifd0, NativeExifReader.__TAG_MODEL))
+        NativeExifReader.__put(exif, "Orientation", NativeExifReader.__ORIENTATIONS.get(NativeExifReader.__get_int(ifd0, NativeExifReader.__TAG_ORIENTATION)))
+        NativeExifReader.__put(exif, "ExifImageWidth", NativeExifReader.__get_int(exif_ifd, NativeExifReader.__TAG_EXIF_IMAGE_WIDTH))
+        NativeExifReader.__put(exif, "ExifImageHeight", NativeExifReader.__get_int(exif_ifd, NativeExifReader.__TAG_EXIF_IMAGE_HEIGHT))
+        NativeExifReader.__put(exif, "DateTimeOriginal", NativeExifReader.__get_str(exif_ifd, NativeExifReader.__TAG_DATE_TIME_ORIGINAL))
+        NativeExifReader.__put(exif, "LensModel", NativeExifReader.__get_str(exif_ifd, NativeExifReader.__TAG_LENS_MODEL))
+        NativeExifReader.__put(exif, "LensInfo", NativeExifReader.__format_lens_info(exif_ifd.get(NativeExifReader.__TAG_LENS_INFO)))
+        NativeExifReader.__put_gps_info(exif, gps_ifd)
+        return exif
+
+    @staticmethod
+    def __put_gps_info(exif: Dict, gps_ifd: Dict):
+        latitude_ref = NativeExifReader.__get_str(gps_ifd, NativeExifReader.__TAG_GPS_LATITUDE_REF)
+        longitude_ref = NativeExifReader.__get_str(gps_ifd, NativeExifReader.__TAG_GPS_LONGITUDE_REF)
+        NativeExifReader.__put(exif, "GPSLatitude", NativeExifReader.__format_gps_coordinate(gps_ifd.get(NativeExifReader.__TAG_GPS_LATITUDE), latitude_ref, "N", "S"))
+        NativeExifReader.__put(exif, "GPSLongitude", NativeExifReader.__format_gps_coordinate(gps_ifd.get(NativeExifReader.__TAG_GPS_LONGITUDE), longitude_ref, "E", "W"))
+        altitude = gps_ifd.get(NativeExifReader.__TAG_GPS_ALTITUDE)
+        if altitude:
+            if not math.isfinite(altitude[0]):
+                raise ValueError("Undefined GPS altitude")
+            altitude_ref_value = NativeExifReader.__get_int(gps_ifd, NativeExifReader.__TAG_GPS_ALTITUDE_REF)
+            altitude_ref = "Below Sea Level" if altitude_ref_value == 1 else "Above Sea Level"
+            # Truncated to one decimal, as by the GPSAltitude composite tag of exiftool, which assumes above sea level without a reference
+            exif["GPSAltitude"] = "{} m {}".format(NativeExifReader.__format_number(int(altitude[0] * 10) / 10), altitude_ref)
+            if altitude_ref_value is not None:
+                exif["GPSAltitudeRef"] = altitude_ref
+
+    @staticmethod
+    def __format_gps_coordinate(values: List, ref: str, positive_ref: str, negative_ref: str) -> str:
+        if not values or len(values) < 3:
+            return None
+        if not all(math.isfinite(value) for value in values[:3]):
+            raise ValueError("Undefined GPS coordinate")
+        # Converted to decimal degrees and back as by exiftool, as minutes and seconds may be stored with decimals or left out
+        decimal_degrees = values[0] + (values[1] + values[2] / 60) / 60
+        degrees = int(decimal_degrees)
+        minutes = int((decimal_degrees - degrees) * 60)
+        seconds = (decimal_degrees - degrees - minutes / 60) * 3600
+        coordinate = "{:d} deg {:d}' {:.2f}\"".format(degrees, minutes, seconds)
+        if not ref:
+            return coordinate
+        return "{} {}".format(coordinate, negative_ref if ref.upper().startswith(negative_ref) else positive_ref)
+
+    @staticmethod
+    def __format_lens_info(values: List) -> str:
+        if not values or len(values) != 4:
+            return None
+        # Same as exiftool: undefined values are shown as "?", and a maximum of zero or equal to the minimum is left out
+        (min_focal_length, max_focal_length, min_f_number, max_f_number) = [NativeExifReader.__format_number(value) if math.isfinite(value) else "?" for value in values]
+        lens_info = min_focal_length
+        if max_focal_length not in ("0", min_focal_length):
+            lens_info += "-" + max_focal_length
+        lens_info += "mm f/" + min_f_number
+        if max_f_number not in ("0", min_f_number):
+            lens_info += "-" + max_f_number
+        return lens_info
+
+    @staticmethod
+    def __format_number(value: float) -> str:
+        return "{:.15g}".format(value)  # As numbers are printed by Perl
+
+    @staticmethod
+    def __read_ifd(data: bytes, byte_order: str, ifd_offset: int) -> Dict[int, List]:
+        entries: Dict[int, List] = {}
+        entry_count = struct.unpack(byte_order + "H", data[ifd_offset:ifd_offset + 2])[0]
+        for entry_num in range(entry_count):
+            entry_offset = ifd_offset + 2 + (entry_num * 12)
+            (tag, value_type, count) = struct.unpack(byte_order + "HHI", data[entry_offset:entry_offset + 8])
+            if value_type not in NativeExifReader.__TIFF_TYPE_SIZES:
+                continue
+            value_size = NativeExifReader.__TIFF_TYPE_SIZES[value_type] * count
+            value_offset = entry_offset + 8 if value_size <= 4 else struct.unpack(byte_order + "I", data[entry_offset + 8:entry_offset + 12])[0]
+            raw_value = data[value_offset:value_offset + value_size]
+            if len(raw_value) < value_size:
+                raise ValueError("Truncated value for EXIF tag {}".format(tag))
+            entries[tag] = NativeExifReader.__decode_value(raw_value, byte_order, value_type, count)
+        return entries
+
+    @staticmethod
+    def __decode_value(raw_value: bytes, byte_order: str, value_type: int, count: int) -> List:
+        if value_type in (2, 7):  # ASCII / UNDEFINED
+            return [raw_value]
+        if value_type in (5, 10):  # RATIONAL / SRATIONAL
+            # Rounded to 10 significant digits like exiftool does. It shows a zero denominator as "inf", or "undef" for 0/0.
+            numbers = struct.unpack(byte_order + ("I" if value_type == 5 else "i") * (count * 2), raw_value)
+            return [float("{:.10g}".format(numbers[i] / numbers[i + 1])) if numbers[i + 1] else (math.inf if numbers[i] else math.nan) for i in range(0, len(numbers), 2)]
+        formats = {1: "B", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i"}
+        return list(struct.unpack(byte_order + formats[value_type] * count, raw_value))
+
+    @staticmethod
+    def __get_int(ifd: Dict, tag: int) -> int:
+        values = ifd.get(tag)
+        return int(values[0]) if values and not isinstance(values[0], bytes) else None
+
+    @staticmethod
+    def __get_str(ifd: Dict, tag: int) -> str:
+        values = ifd.get(tag)
+        if not values or not isinstance(values[0], bytes):
+            return None
+        value = values[0].split(b"\x00", 1)[0].decode("utf-8", errors="replace").rstrip()
+        return value if value else None
+
+    @staticmethod
+    def __put(exif: Dict, key: str, value):
+        if value is not None:
+            exif[key] = value
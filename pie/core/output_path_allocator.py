@@ -0,0 +1,119 @@
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Set, Tuple
+
+from pie.domain import MediaFileSummary, ScannedFileType, Settings
+
+from .index_db import IndexDB
+
+
+class OutputPathAllocator:
+    """Assigns output file names in the parent process before conversions are dispatched, so that workers do not need a lock to pick one.
+
+    The names used in an output directory are read once, from the IndexDB and from the directory itself, when the first file is
+    allocated to it. Colliding names get the next free counter suffix in the order files are allocated, so that the same files
+    always get the same names however many workers convert them.
+    """
+
+    def __init__(self, indexDB: IndexDB, settings: Settings):
+        self.__indexDB = indexDB
+        self.__settings = settings
+        self.__lock = threading.Lock()
+        self.__reserved_names_by_dir: Dict[str, Set[str]] = {}
+        self.__next_counters: Dict[Tuple[str, str, str], int] = {}
+
+    def allocate(self, media_file: MediaFileSummary) -> str:
+        """Returns the output path of the media file, relative to its output directory. A path assigned before is kept."""
+        if media_file.output_rel_file_path:
+            return media_file.output_rel_file_path
+        out_dir = OutputPathAllocator.get_out_dir(media_file, self.__settings)
+        save_dir_path = OutputPathAllocator.get_save_dir_path(media_file, self.__settings)
+        file_name = OutputPathAllocator.get_save_file_name(media_file, self.__settings)
+        file_extension = OutputPathAllocator.get_save_file_extension(media_file)
+        with self.__lock:
+            reserved_names = self.__get_reserved_names(save_dir_path)
+            save_file_name = file_name + file_extension
+            if save_file_name in reserved_names:
+                counter_key = (save_dir_path, file_name, file_extension)
+                counter = self.__next_counters.get(counter_key) or OutputPathAllocator.__get_max_counter(reserved_names, file_name, file_extension) + 1
+                save_file_name = OutputPathAllocator.__get_counter_file_name(file_name, counter, file_extension)
+                while save_file_name in reserved_names:
+                    counter += 1
+                    save_file_name = OutputPathAllocator.__get_counter_file_name(file_name, counter, file_extension)
+                self.__next_counters[counter_key] = counter + 1
+            reserved_names.add(save_file_name)
+        return os.path.relpath(os.path.join(save_dir_path, save_file_name), out_dir)
+
+    def __get_reserved_names(self, save_dir_path: str) -> Set[str]:
+        reserved_names = self.__reserved_names_by_dir.get(save_dir_path)
+        if reserved_names is None:
+            reserved_names = set(os.listdir(save_dir_path)) if os.path.isdir(save_dir_path) else set()
+            for out_dir in set([self.__settings.output_dir, self.__settings.unknown_output_dir]):
+                output_rel_dir_path = os.path.relpath(save_dir_path, out_dir)
+                if output_rel_dir_path == os.pardir or output_rel_dir_path.startswith(os.pardir + os.sep):
+                    continue
+                output_rel_dir_path = "" if output_rel_dir_path == os.curdir else output_rel_dir_path
+                for (output_rel_file_path, has_capture_date) in self.__indexDB.get_output_rel_file_paths(output_rel_dir_path):
+                    file_out_dir = self.__settings.output_dir if has_capture_date else self.__settings.unknown_output_dir
+                    output_file_path = os.path.normpath(os.path.join(file_out_dir, output_rel_file_path))
+                    if os.path.dirname(output_file_path) == save_dir_path:
+                        reserved_names.add(os.path.basename(output_file_path))
+            self.__reserved_names_by_dir[save_dir_path] = reserved_names
+        return reserved_names
+
+    @staticmethod
+    def __get_max_counter(reserved_names: Set[str], file_name: str, file_extension: str) -> int:
+        counter_pattern = re.compile(re.escape(file_name) + r"_(\d+)" + re.escape(file_extension))
+        counters = [int(match.group(1)) for match in map(counter_pattern.fullmatch, reserved_names) if match]
+        return max(counters, default=0)
+
+    @staticmethod
+    def __get_counter_file_name(file_name: str, counter: int, file_extension: str) -> str:
+        return file_name + "_" + format(counter, '05d') + file_extension
+
+    @staticmethod
+    def get_out_dir(media_file: MediaFileSummary, settings: Settings) -> str:
+        return settings.output_dir if media_file.capture_date else settings.unknown_output_dir
+
+    @staticmethod
+    def get_save_dir_path(media_file: MediaFileSummary, settings: Settings) -> str:
+        if media_file.capture_date:
+            output_dir_path_type = settings.output_dir_path_type
+            output_dir = settings.output_dir
+        else:
+            output_dir_path_type = settings.unknown_output_dir_path_type
+            output_dir = settings.unknown_output_dir
+
+        if output_dir_path_type == "Use Original Paths":
+            parent_dir_path = os.path.dirname(media_file.file_path)
+            parent_dir_rel_path = os.path.relpath(parent_dir_path, settings.monitored_dir) if parent_dir_path != settings.monitored_dir else ''
+            save_dir_path = os.path.join(output_dir, parent_dir_rel_path)
+        elif output_dir_path_type == "Sort by Date":
+            capture_date: datetime = media_file.capture_date
+            date_path = os.path.join(str(capture_date.year), str(capture_date.month), str(capture_date.day))
+            save_dir_path = os.path.join(output_dir, date_path)
+        else:
+            raise RuntimeError("Output file path type '{}' is not supported", output_dir_path_type)
+        return os.path.normpath(save_dir_path)
+
+    @staticmethod
+    def get_save_file_name(media_file: MediaFileSummary, settings: Settings) -> str:
+        output_dir_path_type = settings.output_dir_path_type if media_file.capture_date else settings.unknown_output_dir_path_type
+        if output_dir_path_type == "Use Original Paths":
+            return os.path.splitext(os.path.basename(media_file.file_path))[0]
+        elif output_dir_path_type == "Sort by Date":
+            return media_file.capture_date.strftime("%H%M%S")
+        else:
+            raise RuntimeError("Output file path type '{}' is not supported", output_dir_path_type)
+
+    @staticmethod
+    def get_save_file_extension(media_file: MediaFileSummary) -> str:
+        if ScannedFileType.IMAGE.name == media_file.file_type:
+            file_extension = ".JPG"
+        elif ScannedFileType.VIDEO.name == media_file.file_type:
+            file_extension = ".MP4"
+        else:
+            raise RuntimeError("Media file type '{}' is not supported", media_file.file_type)
+        return file_extension
@@ -0,0 +1,159 @@
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from logging import Logger
+from multiprocessing import Condition, Event, RawArray
+from typing import Iterator, Optional, Tuple
+
+from pie.domain import MediaFile, ScannedFileType, Settings
+
+try:
+    import psutil
+except ImportError:  # Optional, needed on Windows to size the memory budget and to find workers that died
+    psutil = None
+
+
+class ResourceBudget:
+    """Machine wide thread and memory budget shared by the workers of the conversion pools.
+
+    magick and ffmpeg are multithreaded themselves, so running one per core oversubscribes the CPU, and a few large RAW files decoded
+    at once can run out of memory. Each conversion reserves the threads and the memory estimated from its dimensions before its tool
+    is started, and waits while the budget is used up. The tools are told to stay within the reserved amounts.
+    """
+    __logger: Logger = logging.getLogger('ResourceBudget')
+    __WAIT_SECONDS = 0.5
+    __DEFAULT_IMAGE_MEGAPIXELS = 24  # For images without known dimensions
+    __DEFAULT_MEMORY_FRACTION = 0.75
+    __worker_budget: Optional['ResourceBudget'] = None
+    __worker_stop_event: Event = None
+
+    def __init__(self, thread_count: int, memory_mb: int):
+        self.thread_count = max(1, thread_count)
+        self.memory_mb = max(0, memory_mb)  # 0 when the physical memory is unknown, then only threads are limited
+        self.__condition = Condition()
+        # (pid, threads, memory MB) of each reservation, pid 0 for a free slot. Every reservation takes a thread, so there are never
+        # more reservations than threads. Keeping the pid lets the reservations of a worker that died be given back.
+        self.__reservations = RawArray('q', self.thread_count * 3)
+
+    @staticmethod
+    def get_budget_limits(settings: Settings) -> Tuple[int, int]:
+        """Returns the (thread count, memory MB) of the budget. Settings of 0 take the CPU count and a share of the physical memory."""
+        thread_count = settings.conversion_thread_budget if settings.conversion_thread_budget > 0 else Settings.get_default_worker_count()
+        memory_mb = settings.conversion_memory_budget_mb
+        if memory_mb <= 0:
+            memory_mb = int(ResourceBudget.get_physical_memory_mb() * ResourceBudget.__DEFAULT_MEMORY_FRACTION)
+        return (thread_count, memory_mb)
+
+    @staticmethod
+    def get_physical_memory_mb() -> int:
+        if psutil is not None:
+            return psutil.virtual_memory().total // 1048576
+        try:
+            return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 1048576
+        except (AttributeError, ValueError, OSError):
+            return 0
+
+    @staticmethod
+    def estimate(media_file: MediaFile, settings: Settings, target_gpu: int) -> Tuple[int, int]:
+        """Returns the (threads, memory MB) a conversion of the media file is expected to use."""
+        if ScannedFileType.IMAGE.name == media_file.file_type:
+            megapixels = (media_file.width or 0) * (media_file.height or 0) / 1000000 or ResourceBudget.__DEFAULT_IMAGE_MEGAPIXELS
+            # The Q16 pixel cache of ImageMagick takes 8 bytes per pixel, RAW files are demosaiced into a second full size image
+            memory_mb = 64 + megapixels * 8 * (2 if media_file.is_raw else 1)
+            threads = min(4, math.ceil(megapixels / 12))
+        elif target_gpu >= 0:
+            return (1, 512)  # Decoding and encoding run on the GPU
+        else:
+            (width, height) = (media_file.width or 1920, media_file.height or 1080)
+            source_megapixels = width * height / 1000000
+            output_megapixels = source_megapixels * min(1, settings.video_max_dimension / max(width, height)) ** 2
+            # libx265 keeps the lookahead and reference frames of every frame thread, about 80 frames of 1.5 bytes per pixel
+            memory_mb = 256 + output_megapixels * 1.5 * 80 + source_megapixels * 1.5 * 16
+            threads = min(8, max(2, math.ceil(output_megapixels * 4)))
+            if media_file.video_duration is not None and media_file.video_duration < 10000:
+                threads = 2  # Too few frames to keep more frame threads busy
+        return (max(1, threads), math.ceil(memory_mb))
+
+    def __clamp(self, threads: int, memory_mb: int) -> Tuple[int, int]:
+        # A job larger than the whole budget runs alone instead of waiting forever
+        return (min(threads, self.thread_count), min(memory_mb, self.memory_mb))
+
+    def acquire(self, threads: int, memory_mb: int, stop_event: Event = None) -> bool:
+        """Waits until the threads and memory are free and reserves them for this process. Returns False if the stop event was set while waiting."""
+        (threads, memory_mb) = self.__clamp(threads, memory_mb)
+        with self.__condition:
+            while True:
+                (free_thread_count, free_memory_mb) = self.__get_free()
+                if free_thread_count >= threads and free_memory_mb >= memory_mb:
+                    break
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self.__condition.wait(ResourceBudget.__WAIT_SECONDS)
+                self.__release_dead_processes()
+            slot = self.__find_slot(0)
+            self.__reservations[slot:slot + 3] = [os.getpid(), threads, memory_mb]
+        return True
+
+    def release(self):
+        """Gives back the reservation of this process."""
+        with self.__condition:
+            slot = self.__find_slot(os.getpid())
+            if slot is not None:
+                self.__reservations[slot:slot + 3] = [0, 0, 0]
+            self.__condition.notify_all()
+
+    def __get_free(self) -> Tuple[int, int]:
+        return (self.thread_count - sum(self.__reservations[1::3]), self.memory_mb - sum(self.__reservations[2::3]))
+
+    def __find_slot(self, pid: int) -> Optional[int]:
+        for slot in range(0, len(self.__reservations), 3):
+            if self.__reservations[slot] == pid:
+                return slot
+        return None
+
+    def __release_dead_processes(self):
+        for slot in range(0, len(self.__reservations), 3):
+            pid = self.__reservations[slot]
+            if pid != 0 and not ResourceBudget.__is_process_alive(pid):
+                ResourceBudget.__logger.warning("Releasing %s threads and %sMB reserved by process %s that exited", self.__reservations[slot + 1], self.__reservations[slot + 2], pid)
+                self.__reservations[slot:slot + 3] = [0, 0, 0]
+
+    @staticmethod
+    def __is_process_alive(pid: int) -> bool:
+        if psutil is not None:
+            return psutil.pid_exists(pid)
+        if Settings.is_platform_win():
+            return True  # os.kill would terminate the process, reservations of dead workers are only given back with psutil
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+
+    @staticmethod
+    def set_worker_budget(budget: Optional['ResourceBudget'], stop_event: Event = None):
+        """Sets the budget the conversions of this worker process reserve from. Without one, conversions run without waiting."""
+        ResourceBudget.__worker_budget = budget
+        ResourceBudget.__worker_stop_event = stop_event
+
+    @staticmethod
+    @contextmanager
+    def reserve(threads: int, memory_mb: int) -> Iterator[None]:
+        budget = ResourceBudget.__worker_budget
+        if budget is None:
+            yield
+            return
+        wait_start_time = time.time()
+        if not budget.acquire(threads, memory_mb, ResourceBudget.__worker_stop_event):
+            raise RuntimeError("Stopped while waiting for {} threads and {}MB".format(threads, memory_mb))
+        wait_seconds = time.time() - wait_start_time
+        if wait_seconds >= 1:
+            ResourceBudget.__logger.debug("Waited %.2fs for %s threads and %sMB", wait_seconds, threads, memory_mb)
+        try:
+            yield
+        finally:
+            budget.release()
@@ -0,0 +1,182 @@
+import logging
+import threading
+from logging import Logger
+from multiprocessing import Event, Queue
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pie.domain import Settings
+from pie.util import ParentQueue, PyProcessPool, SubprocessSupervisor
+
+from .exif_helper import ExifHelper
+from .index_db import IndexDB
+from .index_db_writer import IndexDBWriter
+from .resource_budget import ResourceBudget
+
+
+class WorkerLane:
+    """Submits jobs of one kind to a pool of the WorkerPoolService. Jobs name their handler, so any worker can run any kind of job."""
+
+    def __init__(self, pool: PyProcessPool, job_handler: Callable):
+        self.__pool = pool
+        self.__job_handler = job_handler
+
+    @property
+    def pending_task_count(self) -> int:
+        return self.__pool.pending_task_count
+
+    def put(self, args, task_id: str = None):
+        self.__pool.put((self.__job_handler, args), task_id)
+
+    def flush(self):
+        self.__pool.flush()
+
+    def get_result(self, timeout: float = None):
+        return self.__pool.get_result(timeout)
+
+    def iter_results(self, stop_event=None) -> Iterator:
+        return self.__pool.iter_results(stop_event)
+
+    def wait_for_tasks(self, stop_event=None) -> List:
+        return self.__pool.wait_for_tasks(stop_event)
+
+    def cancel_pending_tasks(self) -> int:
+        return self.__pool.cancel_pending_tasks()
+
+
+class WorkerPoolService:
+    """Keeps the worker processes and the IndexDBWriter running between indexing runs.
+
+    With the spawn start method every worker imports the app and connects to the IndexDB before its first task, which is only paid
+    once while the pools stay warm. A pool is restarted when the settings it was started with change. Tasks are sent in chunks of
+    dispatch_chunk_size, or of a size following the observed task time when it is 0.
+
+    Each pool has a stop event, set when its pending tasks are cancelled and cleared when a lane is taken for the next run. Workers
+    hand it to the SubprocessSupervisor, so that a stopped run also kills the magick, ffmpeg and exiftool processes already running.
+    The conversion pools share one ResourceBudget, so that the conversions of both stay within the same thread and memory limits.
+    """
+    __logger: Logger = logging.getLogger('WorkerPoolService')
+    INDEXING_LANE = "IndexingWorker"
+    CPU_CONVERSION_LANE = "CPUConversionWorker"
+    GPU_CONVERSION_LANE = "GPUConversionWorker"
+
+    def __init__(self, log_queue: Queue):
+        self.__log_queue = log_queue
+        self.__lock = threading.Lock()
+        self.__pools: Dict[str, Tuple[Tuple, PyProcessPool, Event]] = {}
+        self.__db_writer: Optional[IndexDBWriter] = None
+        self.__resource_budgets: Dict[Tuple[int, int], ResourceBudget] = {}
+
+    @staticmethod
+    def get_process_count(lane_name: str, settings: Settings) -> int:
+        if lane_name == WorkerPoolService.INDEXING_LANE:
+            return settings.indexing_workers
+        if lane_name == WorkerPoolService.CPU_CONVERSION_LANE:
+            return settings.conversion_workers
+        return settings.gpu_count * settings.gpu_workers
+
+    def get_lane(self, lane_name: str, job_handler: Callable, settings: Settings) -> WorkerLane:
+        (pool, stop_event) = self.__get_pool(lane_name, settings)
+        stop_event.clear()  # Tasks of a stopped run were cancelled before the next run takes a lane
+        return WorkerLane(pool, job_handler)
+
+    def __get_pool(self, lane_name: str, settings: Settings) -> Tuple[PyProcessPool, Event]:
+        path_exiftool = settings.path_exiftool if lane_name == WorkerPoolService.INDEXING_LANE else None  # Only indexing jobs read EXIF data through the daemon
+        budget_limits = ResourceBudget.get_budget_limits(settings) if lane_name != WorkerPoolService.INDEXING_LANE else None  # Only conversions run under the budget
+        pool_settings = (WorkerPoolService.get_process_count(lane_name, settings), path_exiftool, max(1, settings.pipeline_queue_size), max(0, settings.dispatch_chunk_size),
+                         max(0, settings.worker_max_tasks), max(0, settings.worker_task_retries), budget_limits)
+        with self.__lock:
+            if self.__db_writer is None:
+                self.__db_writer = IndexDBWriter()
+                self.__db_writer.start()
+            (started_pool_settings, pool, stop_event) = self.__pools.get(lane_name, (None, None, None))
+            if pool is not None:
+                pool.check_workers()  # Replaces the workers that were recycled or died since the pool was last used
+            if pool is not None and (started_pool_settings != pool_settings or not pool.is_alive()):
+                WorkerPoolService.__logger.info("Restarting %s pool", lane_name)
+                WorkerPoolService.__stop_pool(pool)
+                pool = None
+            if pool is None:
+                (process_count, path_exiftool, queue_size, chunk_size, max_tasks_per_worker, task_retries, budget_limits) = pool_settings
+                resource_budget = None
+                if budget_limits is not None:
+                    resource_budget = self.__resource_budgets.get(budget_limits)
+                    if resource_budget is None:
+                        resource_budget = ResourceBudget(*budget_limits)
+                        self.__resource_budgets = {budget_limits: resource_budget}  # A budget of older settings is dropped with the pools using it
+                        WorkerPoolService.__logger.info("Conversion budget: %s threads, %sMB", resource_budget.thread_count, resource_budget.memory_mb)
+                stop_event = Event()
+                pool = PyProcessPool(pool_name=lane_name, process_count=process_count, log_queue=self.__log_queue, target=WorkerPoolService.execute_job,
+                                     initializer=WorkerPoolService.init_worker,
+                                     initializer_args=(path_exiftool, stop_event, resource_budget),
+                                     terminator=WorkerPoolService.destroy_worker, stop_event=stop_event, queue_size=queue_size, chunk_size=chunk_size,
+                                     max_tasks_per_worker=max_tasks_per_worker, task_retries=task_retries, message_handler=self.__db_writer.queue.put)
+                self.__pools[lane_name] = (pool_settings, pool, stop_event)
+            return (pool, stop_event)
+
+    def warm_up(self, settings: Settings):
+        for lane_name in (WorkerPoolService.INDEXING_LANE, WorkerPoolService.CPU_CONVERSION_LANE, WorkerPoolService.GPU_CONVERSION_LANE):
+            if WorkerPoolService.get_process_count(lane_name, settings) > 0:
+                self.__get_pool(lane_name, settings)[0].wait_until_ready()
+        WorkerPoolService.__logger.info("Worker pools warm. Startup seconds: %s", self.get_startup_stats())
+
+    def get_startup_stats(self) -> Dict[str, float]:
+        """Seconds taken by each pool until all of its workers were ready for tasks. Pools still starting are left out."""
+        with self.__lock:
+            pools = [(lane_name, pool) for (lane_name, (_, pool, _)) in self.__pools.items()]
+        startup_stats = {}
+        for (lane_name, pool) in pools:
+            startup_seconds = pool.wait_until_ready(0)
+            if startup_seconds is not None:
+                startup_stats[lane_name] = round(startup_seconds, 2)
+        return startup_stats
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Worker and task counts of each pool, including the workers that died, were recycled or replaced and the tasks requeued or given up on."""
+        with self.__lock:
+            pools = [(lane_name, pool) for (lane_name, (_, pool, _)) in self.__pools.items()]
+        return {lane_name: pool.get_stats() for (lane_name, pool) in pools}
+
+    def flush_writes(self) -> int:
+        """Waits for the writes of the workers to be committed. Returns the number of writes that failed since the last flush."""
+        if self.__db_writer is not None:
+            return self.__db_writer.flush()
+        return 0
+
+    def shutdown(self):
+        with self.__lock:
+            for (_, pool, _) in self.__pools.values():
+                WorkerPoolService.__stop_pool(pool)
+            self.__pools = {}
+            self.__resource_budgets = {}
+            if self.__db_writer is not None:
+                self.__db_writer.stop()
+                self.__db_writer = None
+
+    @staticmethod
+    def __stop_pool(pool: PyProcessPool):
+        pool.cancel_pending_tasks()
+        pool.close()
+        pool.wait_and_get_results()  # Results of the tasks that were running are dropped
+
+    @staticmethod
+    def init_worker(path_exiftool: str = None, stop_event: Event = None, resource_budget: ResourceBudget = None) -> IndexDB:
+        SubprocessSupervisor.set_stop_event(stop_event)
+        ResourceBudget.set_worker_budget(resource_budget, stop_event)
+        if path_exiftool is not None:
+            ExifHelper.start_exiftool_daemon(path_exiftool)
+        return IndexDB.create_instance(ParentQueue())  # Writes are sent to the IndexDBWriter through the pool
+
+    @staticmethod
+    def destroy_worker(indexDB: IndexDB):
+        WorkerPoolService.__logger.info("Subprocess stats: %s", SubprocessSupervisor.get_stats())
+        ExifHelper.stop_exiftool_daemon()
+        IndexDB.destroy_instance(indexDB)
+
+    @staticmethod
+    def execute_job(job_handler: Callable, job_args: Tuple, indexDB: IndexDB, task_id: str):
+        try:
+            return job_handler(*job_args, indexDB, task_id)
+        finally:
+            # The session lives as long as the worker. Its writes go through the IndexDBWriter, so it never commits, and the rows it loaded
+            # would otherwise be returned to later jobs as they were, after the parent or the IndexDBWriter changed them.
+            indexDB.reset_session()
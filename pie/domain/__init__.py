@@ -1 +1 @@
-from pie.domain.file_model import IndexingTask, MediaFile, ScannedFile, ScannedFileType, Settings
+from pie.domain.file_model import FileHash, IndexingTask, MediaFile, MediaFileSummary, ScannedDir, ScannedDirFile, ScannedFile, ScannedFileType, Settings
@@ -1,7 +1,7 @@
 import hashlib
 import multiprocessing
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 from typing import Set
 
@@ -30,12 +30,19 @@ class ScannedFileType(Enum):
 
 
 class ScannedFile:
+    """A file found by a scan. A scan keeps one for every file in the library, so they are kept compact: slots instead of a __dict__,
+    interned directory and extension strings, and stat times as integer microseconds that are converted to datetimes when read.
+    The extension is not coded as an integer: a slot holds a reference either way, and all files share the interned string."""
+    __slots__ = ("parent_dir_path", "file_path", "extension", "file_type", "is_raw", "creation_time_us", "last_modification_time_us", "hash",
+                 "already_indexed", "needs_reindex", "size")
+    __EPOCH = datetime(1970, 1, 1)
+    __MICROSECOND = timedelta(microseconds=1)
 
     def __init__(self, parent_dir_path, file_path, extension, file_type, is_raw, creation_time, last_modification_time, hash,
-                 already_indexed=False, needs_reindex=False):
-        self.parent_dir_path = parent_dir_path
+                 already_indexed=False, needs_reindex=False, size=None):
+        self.parent_dir_path = sys.intern(parent_dir_path)
         self.file_path = file_path
-        self.extension = extension
+        self.extension = sys.intern(extension)
         self.file_type = file_type
         self.is_raw = is_raw
         self.creation_time = creation_time
@@ -43,6 +50,43 @@ class ScannedFile:
         self.hash = hash
         self.already_indexed = already_indexed
         self.needs_reindex = needs_reindex
+        self.size = size
+
+    # Times are the naive local datetimes stored in the IndexDB, counted from 1970-01-01 so that the conversion is exact both ways
+    @property
+    def creation_time(self) -> datetime:
+        return ScannedFile.__to_datetime(self.creation_time_us)
+
+    @creation_time.setter
+    def creation_time(self, creation_time: datetime):
+        self.creation_time_us = ScannedFile.__to_microseconds(creation_time)
+
+    @property
+    def last_modification_time(self) -> datetime:
+        return ScannedFile.__to_datetime(self.last_modification_time_us)
+
+    @last_modification_time.setter
+    def last_modification_time(self, last_modification_time: datetime):
+        self.last_modification_time_us = ScannedFile.__to_microseconds(last_modification_time)
+
+    # Scanned files are sent to the indexing workers by the thousand, so they are pickled as a plain tuple instead of a dict of slots
+    def __getstate__(self):
+        return (self.parent_dir_path, self.file_path, self.extension, self.file_type, self.is_raw, self.creation_time_us, self.last_modification_time_us, self.hash,
+                self.already_indexed, self.needs_reindex, self.size)
+
+    def __setstate__(self, state):
+        (parent_dir_path, self.file_path, extension, self.file_type, self.is_raw, self.creation_time_us, self.last_modification_time_us, self.hash,
+         self.already_indexed, self.needs_reindex, self.size) = state
+        self.parent_dir_path = sys.intern(parent_dir_path)
+        self.extension = sys.intern(extension)
+
+    @staticmethod
+    def __to_microseconds(time: datetime) -> int:
+        return None if time is None else (time - ScannedFile.__EPOCH) // ScannedFile.__MICROSECOND
+
+    @staticmethod
+    def __to_datetime(time_us: int) -> datetime:
+        return None if time_us is None else ScannedFile.__EPOCH + timedelta(microseconds=time_us)
 
 
 class MediaFile(DB_BASE):
@@ -56,13 +100,17 @@ class MediaFile(DB_BASE):
     original_size = Column(Integer)
     creation_time = Column(DateTime)
     last_modification_time = Column(DateTime)
-    original_file_hash = Column(String)
+    original_file_hash = Column(String, index=True)
+    original_file_hash_algorithm = Column(String)  # None for hashes created before the algorithm was recorded, which are SHA-1
     converted_file_hash = Column(String)
+    converted_file_hash_algorithm = Column(String)
+    converted_file_size = Column(Integer)
+    converted_file_mtime_ns = Column(Integer)
     conversion_settings_hash = Column(String)
     index_time = Column(DateTime)
     height = Column(Integer)
     width = Column(Integer)
-    capture_date = Column(DateTime)
+    capture_date = Column(DateTime, index=True)
     camera_make = Column(String)
     camera_model = Column(String)
     lens_model = Column(String)
@@ -73,7 +121,60 @@ class MediaFile(DB_BASE):
     image_orientation = Column(String)
     video_duration = Column(Integer)
     video_rotation = Column(String)
-    output_rel_file_path = Column(String)
+    output_rel_file_path = Column(String, index=True)
+    scan_generation = Column(Integer, index=True)  # Generation of the last scan that found the file, older entries are stale
+
+    def to_dict(self) -> dict:
+        return {column.name: getattr(self, column.name) for column in MediaFile.__table__.columns}
+
+    @staticmethod
+    def from_dict(values: dict) -> 'MediaFile':
+        return MediaFile(**values)
+
+
+class MediaFileSummary:
+    """The MediaFile columns needed for change detection, stale removal and conversion dispatch, loaded without the ORM."""
+    __slots__ = ("file_path", "file_type", "creation_time", "last_modification_time", "original_file_hash", "original_file_hash_algorithm",
+                 "capture_date", "output_rel_file_path", "original_size", "video_duration")
+
+    def __init__(self, *values):
+        for (name, value) in zip(MediaFileSummary.__slots__, values):
+            setattr(self, name, value)
+
+    @staticmethod
+    def from_dict(values: dict) -> 'MediaFileSummary':
+        return MediaFileSummary(*[values.get(name) for name in MediaFileSummary.__slots__])
+
+
+class ScannedDir(DB_BASE):
+    __tablename__ = 'scanned_dirs'
+    dir_path = Column(String, primary_key=True)
+    modification_time_ns = Column(Integer)
+    entry_count = Column(Integer)
+    scan_settings_hash = Column(String)
+
+
+class ScannedDirFile(DB_BASE):
+    __tablename__ = 'scanned_dir_files'
+    file_path = Column(String, primary_key=True)
+    parent_dir_path = Column(String, index=True)
+    extension = Column(String)
+    file_type = Column(String)
+    is_raw = Column(Boolean)
+    creation_time = Column(DateTime)
+    last_modification_time = Column(DateTime)
+    size = Column(Integer)
+
+
+class FileHash(DB_BASE):
+    __tablename__ = 'file_hashes'
+    device = Column(Integer, primary_key=True)
+    inode = Column(Integer, primary_key=True)
+    size = Column(Integer, primary_key=True)
+    modification_time_ns = Column(Integer, primary_key=True)
+    hash_algorithm = Column(String, primary_key=True)
+    file_path = Column(String, index=True)
+    hash = Column(String)
 
 
 class Settings:
@@ -91,6 +192,20 @@ class Settings:
         self.overwrite_output_files: bool = False
         self.indexing_workers: int = Settings.get_default_worker_count()
         self.conversion_workers: int = Settings.get_default_worker_count()
+        self.indexing_batch_size: int = 25
+        self.scan_threads: int = 8
+        self.hashing_threads: int = 4
+        self.use_scan_journal: bool = False  # Files changed in place are not picked up while it is on, see the README
+        self.watch_debounce_seconds: int = 5
+        self.streaming_pipeline: bool = True
+        self.pipeline_queue_size: int = 64
+        self.dispatch_chunk_size: int = 0
+        self.worker_max_tasks: int = 0
+        self.worker_task_retries: int = 1
+        self.subprocess_timeout_factor: float = 1.0
+        self.conversion_thread_budget: int = 0
+        self.conversion_memory_budget_mb: int = 0
+        self.conversion_order: str = "Capture Date"
         self.gpu_workers: int = 1
         self.gpu_count: int = 0
         self.image_compression_quality: int = 75
@@ -102,6 +217,10 @@ class Settings:
         self.path_ffmpeg: str = "/usr/local/bin/ffmpeg" if not Settings.is_platform_win() else "ffmpeg"
         self.path_magick: str = "/usr/local/bin/magick" if not Settings.is_platform_win() else "magick"
         self.path_exiftool: str = "/usr/local/bin/exiftool" if not Settings.is_platform_win() else "exiftool"
+        self.exiftool_fast_scan: bool = False
+        self.native_exif_reader: bool = True
+        self.verify_file_hashes: bool = False
+        self.hash_algorithm: str = "sha1"
         self.auto_update_check: bool = True
         self.auto_show_log_window: bool = True
         self.image_extensions: str = "JPEG, JPG, TIF, TIFF, PNG, BMP, HEIC"
@@ -6,6 +6,7 @@ from PySide2 import QtCore, QtUiTools, QtWidgets
 
 from pie.core import IndexDB
 from pie.util.misc_utils import MiscUtils
+from pie.util.subprocess_supervisor import SubprocessSupervisor
 
 
 class PreferencesWindow:
@@ -13,6 +14,7 @@ class PreferencesWindow:
     __UI_FILE = "assets/mainwindow.ui"
     __QLINEEDIT_VALID_VALUE_STYLESHEET = "QLineEdit { background: rgba(0, 255, 0, 0.2); }"
     __QLINEEDIT_INVALID_VALUE_STYLESHEET = "QLineEdit { background: rgba(255, 0, 0, 0.2); }"
+    __PATH_CHECK_TIMEOUT_SECONDS = 10
 
     def __init__(self, apply_process_changed_setting: Callable[[], None]):
         self.apply_process_changed_setting = apply_process_changed_setting
@@ -58,6 +60,24 @@ class PreferencesWindow:
         self.spinConversionWorkers: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinConversionWorkers')
         self.spinGpuWorkers: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinGpuWorkers')
         self.spinGpuCount: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinGpuCount')
+        self.spinIndexingBatchSize: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinIndexingBatchSize')
+        self.chkExiftoolFastScan: QtWidgets.QCheckBox = self.window.findChild(QtWidgets.QCheckBox, 'chkExiftoolFastScan')
+        self.chkNativeExifReader: QtWidgets.QCheckBox = self.window.findChild(QtWidgets.QCheckBox, 'chkNativeExifReader')
+        self.spinScanThreads: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinScanThreads')
+        self.chkUseScanJournal: QtWidgets.QCheckBox = self.window.findChild(QtWidgets.QCheckBox, 'chkUseScanJournal')
+        self.spinWatchDebounceSeconds: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinWatchDebounceSeconds')
+        self.chkStreamingPipeline: QtWidgets.QCheckBox = self.window.findChild(QtWidgets.QCheckBox, 'chkStreamingPipeline')
+        self.spinPipelineQueueSize: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinPipelineQueueSize')
+        self.chkVerifyFileHashes: QtWidgets.QCheckBox = self.window.findChild(QtWidgets.QCheckBox, 'chkVerifyFileHashes')
+        self.cbHashAlgorithm: QtWidgets.QComboBox = self.window.findChild(QtWidgets.QComboBox, 'cbHashAlgorithm')
+        self.spinHashingThreads: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinHashingThreads')
+        self.spinDispatchChunkSize: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinDispatchChunkSize')
+        self.spinWorkerMaxTasks: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinWorkerMaxTasks')
+        self.spinWorkerTaskRetries: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinWorkerTaskRetries')
+        self.spinSubprocessTimeoutFactor: QtWidgets.QDoubleSpinBox = self.window.findChild(QtWidgets.QDoubleSpinBox, 'spinSubprocessTimeoutFactor')
+        self.spinConversionThreadBudget: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinConversionThreadBudget')
+        self.spinConversionMemoryBudgetMb: QtWidgets.QSpinBox = self.window.findChild(QtWidgets.QSpinBox, 'spinConversionMemoryBudgetMb')
+        self.cbConversionOrder: QtWidgets.QComboBox = self.window.findChild(QtWidgets.QComboBox, 'cbConversionOrder')
 
         self.txtPathFfmpeg: QtWidgets.QLineEdit = self.window.findChild(QtWidgets.QLineEdit, 'txtPathFfmpeg')
         self.txtPathMagick: QtWidgets.QLineEdit = self.window.findChild(QtWidgets.QLineEdit, 'txtPathMagick')
@@ -93,6 +113,24 @@ class PreferencesWindow:
         self.spinConversionWorkers.valueChanged.connect(self.spinConversionWorkers_valueChanged)
         self.spinGpuWorkers.valueChanged.connect(self.spinGpuWorkers_valueChanged)
         self.spinGpuCount.valueChanged.connect(self.spinGpuCount_valueChanged)
+        self.spinIndexingBatchSize.valueChanged.connect(self.spinIndexingBatchSize_valueChanged)
+        self.chkExiftoolFastScan.stateChanged.connect(self.chkExiftoolFastScan_stateChanged)
+        self.chkNativeExifReader.stateChanged.connect(self.chkNativeExifReader_stateChanged)
+        self.spinScanThreads.valueChanged.connect(self.spinScanThreads_valueChanged)
+        self.chkUseScanJournal.stateChanged.connect(self.chkUseScanJournal_stateChanged)
+        self.spinWatchDebounceSeconds.valueChanged.connect(self.spinWatchDebounceSeconds_valueChanged)
+        self.chkStreamingPipeline.stateChanged.connect(self.chkStreamingPipeline_stateChanged)
+        self.spinPipelineQueueSize.valueChanged.connect(self.spinPipelineQueueSize_valueChanged)
+        self.chkVerifyFileHashes.stateChanged.connect(self.chkVerifyFileHashes_stateChanged)
+        self.cbHashAlgorithm.currentTextChanged.connect(self.cbHashAlgorithm_currentTextChanged)
+        self.spinHashingThreads.valueChanged.connect(self.spinHashingThreads_valueChanged)
+        self.spinDispatchChunkSize.valueChanged.connect(self.spinDispatchChunkSize_valueChanged)
+        self.spinWorkerMaxTasks.valueChanged.connect(self.spinWorkerMaxTasks_valueChanged)
+        self.spinWorkerTaskRetries.valueChanged.connect(self.spinWorkerTaskRetries_valueChanged)
+        self.spinSubprocessTimeoutFactor.valueChanged.connect(self.spinSubprocessTimeoutFactor_valueChanged)
+        self.spinConversionThreadBudget.valueChanged.connect(self.spinConversionThreadBudget_valueChanged)
+        self.spinConversionMemoryBudgetMb.valueChanged.connect(self.spinConversionMemoryBudgetMb_valueChanged)
+        self.cbConversionOrder.currentTextChanged.connect(self.cbConversionOrder_currentTextChanged)
 
         self.txtPathFfmpeg.textChanged.connect(self.txtPathFfmpeg_textChanged)
         self.txtPathMagick.textChanged.connect(self.txtPathMagick_textChanged)
@@ -191,6 +229,24 @@ class PreferencesWindow:
         self.spinConversionWorkers.setValue(self.settings.conversion_workers)
         self.spinGpuWorkers.setValue(self.settings.gpu_workers)
         self.spinGpuCount.setValue(self.settings.gpu_count)
+        self.spinIndexingBatchSize.setValue(self.settings.indexing_batch_size)
+        self.chkExiftoolFastScan.setChecked(self.settings.exiftool_fast_scan)
+        self.chkNativeExifReader.setChecked(self.settings.native_exif_reader)
+        self.spinScanThreads.setValue(self.settings.scan_threads)
+        self.chkUseScanJournal.setChecked(self.settings.use_scan_journal)
+        self.spinWatchDebounceSeconds.setValue(self.settings.watch_debounce_seconds)
+        self.chkStreamingPipeline.setChecked(self.settings.streaming_pipeline)
+        self.spinPipelineQueueSize.setValue(self.settings.pipeline_queue_size)
+        self.chkVerifyFileHashes.setChecked(self.settings.verify_file_hashes)
+        self.cbHashAlgorithm.setCurrentIndex(self.cbHashAlgorithm.findText(self.settings.hash_algorithm))
+        self.spinHashingThreads.setValue(self.settings.hashing_threads)
+        self.spinDispatchChunkSize.setValue(self.settings.dispatch_chunk_size)
+        self.spinWorkerMaxTasks.setValue(self.settings.worker_max_tasks)
+        self.spinWorkerTaskRetries.setValue(self.settings.worker_task_retries)
+        self.spinSubprocessTimeoutFactor.setValue(self.settings.subprocess_timeout_factor)
+        self.spinConversionThreadBudget.setValue(self.settings.conversion_thread_budget)
+        self.spinConversionMemoryBudgetMb.setValue(self.settings.conversion_memory_budget_mb)
+        self.cbConversionOrder.setCurrentIndex(self.cbConversionOrder.findText(self.settings.conversion_order))
         self.txtPathFfmpeg.setText(self.settings.path_ffmpeg)
         self.txtPathMagick.setText(self.settings.path_magick)
         self.txtPathExiftool.setText(self.settings.path_exiftool)
@@ -269,9 +325,81 @@ class PreferencesWindow:
         self.settings.gpu_count = new_value
         self.__indexDB.save_settings(self.settings)
 
+    def spinIndexingBatchSize_valueChanged(self, new_value: int):
+        self.settings.indexing_batch_size = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def chkExiftoolFastScan_stateChanged(self):
+        self.settings.exiftool_fast_scan = self.chkExiftoolFastScan.isChecked()
+        self.__indexDB.save_settings(self.settings)
+
+    def chkNativeExifReader_stateChanged(self):
+        self.settings.native_exif_reader = self.chkNativeExifReader.isChecked()
+        self.__indexDB.save_settings(self.settings)
+
+    def spinScanThreads_valueChanged(self, new_value: int):
+        self.settings.scan_threads = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def chkUseScanJournal_stateChanged(self):
+        self.settings.use_scan_journal = self.chkUseScanJournal.isChecked()
+        self.__indexDB.save_settings(self.settings)
+
+    def spinWatchDebounceSeconds_valueChanged(self, new_value: int):
+        self.settings.watch_debounce_seconds = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def chkStreamingPipeline_stateChanged(self):
+        self.settings.streaming_pipeline = self.chkStreamingPipeline.isChecked()
+        self.__indexDB.save_settings(self.settings)
+
+    def spinPipelineQueueSize_valueChanged(self, new_value: int):
+        self.settings.pipeline_queue_size = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def chkVerifyFileHashes_stateChanged(self):
+        self.settings.verify_file_hashes = self.chkVerifyFileHashes.isChecked()
+        self.__indexDB.save_settings(self.settings)
+
+    def cbHashAlgorithm_currentTextChanged(self, new_text: str):
+        self.settings.hash_algorithm = new_text
+        self.__indexDB.save_settings(self.settings)
+
+    def spinHashingThreads_valueChanged(self, new_value: int):
+        self.settings.hashing_threads = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinDispatchChunkSize_valueChanged(self, new_value: int):
+        self.settings.dispatch_chunk_size = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinWorkerMaxTasks_valueChanged(self, new_value: int):
+        self.settings.worker_max_tasks = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinWorkerTaskRetries_valueChanged(self, new_value: int):
+        self.settings.worker_task_retries = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinSubprocessTimeoutFactor_valueChanged(self, new_value: float):
+        self.settings.subprocess_timeout_factor = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinConversionThreadBudget_valueChanged(self, new_value: int):
+        self.settings.conversion_thread_budget = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def spinConversionMemoryBudgetMb_valueChanged(self, new_value: int):
+        self.settings.conversion_memory_budget_mb = new_value
+        self.__indexDB.save_settings(self.settings)
+
+    def cbConversionOrder_currentTextChanged(self, new_text: str):
+        self.settings.conversion_order = new_text
+        self.__indexDB.save_settings(self.settings)
+
     def txtPathFfmpeg_textChanged(self, new_text: str):
         try:
-            MiscUtils.exec_subprocess([new_text, "-h"], "Wrong path")
+            SubprocessSupervisor.run(SubprocessSupervisor.FFMPEG, [new_text, "-h"], "Wrong path", PreferencesWindow.__PATH_CHECK_TIMEOUT_SECONDS)
             self.txtPathFfmpeg.setStyleSheet(PreferencesWindow.__QLINEEDIT_VALID_VALUE_STYLESHEET)
             self.settings.path_ffmpeg = new_text
             self.__indexDB.save_settings(self.settings)
@@ -280,7 +408,7 @@ class PreferencesWindow:
 
     def txtPathMagick_textChanged(self, new_text: str):
         try:
-            MiscUtils.exec_subprocess([new_text, "-help"], "Wrong path")
+            SubprocessSupervisor.run(SubprocessSupervisor.MAGICK, [new_text, "-help"], "Wrong path", PreferencesWindow.__PATH_CHECK_TIMEOUT_SECONDS)
             self.txtPathMagick.setStyleSheet(PreferencesWindow.__QLINEEDIT_VALID_VALUE_STYLESHEET)
             self.settings.path_magick = new_text
             self.__indexDB.save_settings(self.settings)
@@ -289,7 +417,7 @@ class PreferencesWindow:
 
     def txtPathExiftool_textChanged(self, new_text: str):
         try:
-            MiscUtils.exec_subprocess([new_text, "-ver"], "Wrong path")
+            SubprocessSupervisor.run(SubprocessSupervisor.EXIFTOOL, [new_text, "-ver"], "Wrong path", PreferencesWindow.__PATH_CHECK_TIMEOUT_SECONDS)
             self.txtPathExiftool.setStyleSheet(PreferencesWindow.__QLINEEDIT_VALID_VALUE_STYLESHEET)
             self.settings.path_exiftool = new_text
             self.__indexDB.save_settings(self.settings)
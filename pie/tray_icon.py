@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import ssl
+import threading
 import webbrowser
 from multiprocessing import Event, Queue
 from urllib.request import urlopen
@@ -10,16 +11,17 @@ import certifi
 from PySide2 import QtCore, QtGui, QtWidgets
 
 from packaging import version
-from pie.core import IndexDB, IndexingHelper, MediaProcessor
+from pie.core import IndexDB, IndexingHelper, IndexingPipeline, MediaProcessor, WorkerPoolService
 from pie.domain import IndexingTask, Settings
 from pie.log_window import LogWindow
 from pie.preferences_window import PreferencesWindow
-from pie.util import MiscUtils, QWorker
+from pie.util import InotifyWatcher, MiscUtils, QWorker
 
 
 class TrayIcon(QtWidgets.QSystemTrayIcon):
     __APP_VER = "1.0.2"
     __logger = logging.getLogger('TrayIcon')
+    __WATCH_LOCK_POLL_SECONDS = 1
 
     def __init__(self, log_queue: Queue):
         super().__init__(QtGui.QIcon(MiscUtils.get_app_icon_path()))
@@ -27,8 +29,11 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
         self.preferences_window: PreferencesWindow = None
         self.log_window: LogWindow = None
         self.indexing_stop_event: Event = None
-        self.observer = None
+        self.watch_stop_event: Event = None
+        self.observer: InotifyWatcher = None
+        self.processing_lock = threading.Lock()
         self.indexDB = IndexDB()
+        self.worker_pool_service = WorkerPoolService(log_queue)
         self.threadpool: QtCore.QThreadPool = QtCore.QThreadPool()
         self.__logger.debug("QT multithreading with thread pool size: %s", self.threadpool.maxThreadCount())
 
@@ -39,6 +44,10 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
         self.startIndexAction = tray_menu.addAction('Start Processing', self.startIndexAction_triggered)
         self.stopIndexAction = tray_menu.addAction('Stop Processing', self.stopIndexAction_triggered)
         self.stopIndexAction.setEnabled(False)
+        self.watchAction = tray_menu.addAction('Watch for Changes', self.watchAction_triggered)
+        self.watchAction.setCheckable(True)
+        self.watchAction.setEnabled(InotifyWatcher.is_supported())
+        self.verifyOutputAction = tray_menu.addAction('Verify Output Files', self.verifyOutputAction_triggered)
         tray_menu.addSeparator()
         self.clearIndexAction = tray_menu.addAction('Clear Indexed Files', self.clearIndexAction_triggered)
         self.clearOutputDirsAction = tray_menu.addAction('Clear Ouput Directories', self.clearOutputDirsAction_triggered)
@@ -56,6 +65,8 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
         if self.indexDB.get_settings().auto_update_check:
             self.update_check_worker = QWorker(self.auto_update_check)
             self.threadpool.start(self.update_check_worker)
+        self.warm_up_worker = QWorker(self.warm_up_worker_pools)
+        self.threadpool.start(self.warm_up_worker)
 
     def trayIcon_activated(self, reason):
         pass
@@ -79,6 +90,79 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
             self.stopIndexAction.setEnabled(False)
             self.stop_async_tasks()
 
+    def watchAction_triggered(self):
+        if self.watchAction.isChecked():
+            self.start_watching()
+        else:
+            self.stop_watching()
+
+    def start_watching(self):
+        settings: Settings = self.indexDB.get_settings()
+        if not self.settings_valid(settings):
+            self.watchAction.setChecked(False)
+            return
+        watch_stop_event = self.watch_stop_event = Event()  # Kept by the callback, so that a later watcher does not replace it
+        self.observer = InotifyWatcher(settings.monitored_dir, lambda changed_paths: self.process_watched_changes(changed_paths, watch_stop_event), settings.watch_debounce_seconds,
+                                       ignored_dirs=[settings.output_dir, settings.unknown_output_dir])
+        try:
+            self.observer.start()
+        except:
+            self.__logger.exception("Failed to start watching %s", settings.monitored_dir)
+            self.observer = None
+            self.watchAction.setChecked(False)
+
+    def stop_watching(self, wait: bool = False):
+        # Called on the GUI thread, which is not blocked while the changes being processed are stopped, unless quitting
+        if self.observer is not None:
+            self.watch_stop_event.set()
+            self.observer.stop(wait)
+            self.observer = None
+
+    def process_watched_changes(self, changed_paths, watch_stop_event: Event):
+        MiscUtils.debug_this_thread()
+        # Waits for a run started from the menu, giving up once watching is stopped
+        while not self.processing_lock.acquire(timeout=TrayIcon.__WATCH_LOCK_POLL_SECONDS):
+            if watch_stop_event.is_set():
+                return
+        try:
+            with IndexDB() as indexDB:
+                indexing_task = IndexingTask()
+                indexing_task.settings = indexDB.get_settings()
+                if not self.settings_valid(indexing_task.settings) or watch_stop_event.is_set():
+                    return
+                indexing_helper = IndexingHelper(indexing_task, self.log_queue, watch_stop_event, self.worker_pool_service)
+                file_paths = indexing_helper.expand_changed_paths(indexDB, changed_paths)
+                (scanned_files, deleted_files) = indexing_helper.scan_files(file_paths)
+                indexing_helper.remove_deleted_files(indexDB, deleted_files)
+                if scanned_files and not watch_stop_event.is_set():
+                    indexing_helper.lookup_already_indexed_files(indexDB, scanned_files)
+                    if not watch_stop_event.is_set():
+                        indexing_helper.create_media_files(scanned_files)
+                    if not watch_stop_event.is_set():
+                        media_processor = MediaProcessor(indexing_task, self.log_queue, watch_stop_event, self.worker_pool_service)
+                        media_processor.save_processed_files(indexDB, [scanned_file.file_path for scanned_file in scanned_files])
+        finally:
+            self.processing_lock.release()
+
+    def verifyOutputAction_triggered(self):
+        if self.indexDB.get_settings().auto_show_log_window:
+            self.show_view_logs_window()
+        self.background_processing_started()
+        self.indexing_stop_event = Event()
+        self.verification_worker = QWorker(self.start_verification)
+        self.verification_worker.signals.finished.connect(self.background_processing_finished)
+        self.threadpool.start(self.verification_worker)
+        self.stopIndexAction.setEnabled(True)
+
+    def start_verification(self):
+        MiscUtils.debug_this_thread()
+        with self.processing_lock, IndexDB() as indexDB:
+            indexing_task = IndexingTask()
+            indexing_task.settings = indexDB.get_settings()
+            if self.settings_valid(indexing_task.settings):
+                media_processor = MediaProcessor(indexing_task, self.log_queue, self.indexing_stop_event)
+                media_processor.verify_converted_files(indexDB)
+
     def clearIndexAction_triggered(self):
         response: QtWidgets.QMessageBox.StandardButton = QtWidgets.QMessageBox.question(
             None, "Confirm Action", "Forget indexed files and delete all output files?",
@@ -103,7 +187,7 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
 
     def start_deletion(self, clearIndex: bool):
         MiscUtils.debug_this_thread()
-        with IndexDB() as indexDB:
+        with self.processing_lock, IndexDB() as indexDB:
             if clearIndex:
                 indexDB.clear_indexed_files()
                 self.__logger.info("Index cleared")
@@ -167,23 +251,33 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
     def quitMenuAction_triggered(self):
         QtWidgets.QApplication.quit()
 
+    def warm_up_worker_pools(self):
+        MiscUtils.debug_this_thread()
+        try:
+            self.worker_pool_service.warm_up(self.indexDB.get_settings())
+        except:
+            self.__logger.exception("Failed to start worker pools, they will be started on the next run")
+
     def start_indexing(self):
         MiscUtils.debug_this_thread()
-        with IndexDB() as indexDB:
+        with self.processing_lock, IndexDB() as indexDB:
             indexing_task = IndexingTask()
             indexing_task.settings = indexDB.get_settings()
             if self.settings_valid(indexing_task.settings):
                 misc_utils = MiscUtils(indexing_task)
                 misc_utils.create_root_marker()
-                indexing_helper = IndexingHelper(indexing_task, self.log_queue, self.indexing_stop_event)
-                (scanned_files, _) = indexing_helper.scan_dirs()
-                indexing_helper.remove_slate_files(indexDB, scanned_files)
-                indexing_helper.lookup_already_indexed_files(indexDB, scanned_files)
-                if not self.indexing_stop_event.is_set():
-                    indexing_helper.create_media_files(scanned_files)
-                if not self.indexing_stop_event.is_set():
-                    media_processor = MediaProcessor(indexing_task, self.log_queue, self.indexing_stop_event)
-                    media_processor.save_processed_files(indexDB)
+                if indexing_task.settings.streaming_pipeline:
+                    IndexingPipeline(indexing_task, self.log_queue, self.indexing_stop_event, self.worker_pool_service).run(indexDB)
+                else:
+                    indexing_helper = IndexingHelper(indexing_task, self.log_queue, self.indexing_stop_event, self.worker_pool_service)
+                    (scanned_files, _) = indexing_helper.scan_dirs(indexDB)
+                    indexing_helper.remove_slate_files(indexDB, scanned_files)
+                    indexing_helper.lookup_already_indexed_files(indexDB, scanned_files)
+                    if not self.indexing_stop_event.is_set():
+                        indexing_helper.create_media_files(scanned_files)
+                    if not self.indexing_stop_event.is_set():
+                        media_processor = MediaProcessor(indexing_task, self.log_queue, self.indexing_stop_event, self.worker_pool_service)
+                        media_processor.save_processed_files(indexDB)
                 if not self.indexing_stop_event.is_set():
                     misc_utils.cleanEmptyOutputDirs()
 
@@ -210,6 +304,7 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
 
     def background_processing_started(self):
         self.startIndexAction.setEnabled(False)
+        self.verifyOutputAction.setEnabled(False)
         self.clearIndexAction.setEnabled(False)
         self.clearOutputDirsAction.setEnabled(False)
         self.editPrefAction.setEnabled(False)
@@ -218,6 +313,7 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
 
     def background_processing_finished(self):
         self.startIndexAction.setEnabled(True)
+        self.verifyOutputAction.setEnabled(True)
         self.stopIndexAction.setEnabled(False)
         self.clearIndexAction.setEnabled(True)
         self.clearOutputDirsAction.setEnabled(True)
@@ -228,10 +324,12 @@ class TrayIcon(QtWidgets.QSystemTrayIcon):
             self.indexing_stop_event.set()
 
     def cleanup(self):
+        self.stop_watching(True)  # The changes being processed stop before the worker pools are shut down
         if self.preferences_window is not None:
             self.preferences_window.cleanup()
         if self.log_window is not None:
             self.log_window.cleanup()
+        self.worker_pool_service.shutdown()
         self.indexDB.disconnect_db()
 
     def apply_process_changed_setting(self):
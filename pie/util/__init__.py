@@ -1,3 +1,5 @@
+from pie.util.inotify_watcher import InotifyWatcher
 from pie.util.misc_utils import MiscUtils
-from pie.util.py_process import PyProcess, PyProcessPool
+from pie.util.py_process import ParentQueue, PyProcess, PyProcessPool
 from pie.util.q_worker import QWorker, QWorkerSignals
+from pie.util.subprocess_supervisor import SubprocessSupervisor
@@ -0,0 +1,157 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from logging import Logger
+from typing import Callable, Dict, List, Set
+
+
+class InotifyWatcher:
+    """Recursively watches a directory tree using Linux inotify.
+
+    Paths of created, modified, moved and deleted entries are collected, debounced and handed to the callback in
+    batches from a dedicated thread. Events that arrive while the callback runs are coalesced into the next batch.
+    """
+    __logger: Logger = logging.getLogger('InotifyWatcher')
+
+    __IN_CLOSE_WRITE = 0x00000008
+    __IN_MOVED_FROM = 0x00000040
+    __IN_MOVED_TO = 0x00000080
+    __IN_CREATE = 0x00000100
+    __IN_DELETE = 0x00000200
+    __IN_Q_OVERFLOW = 0x00004000
+    __IN_IGNORED = 0x00008000
+    __IN_ONLYDIR = 0x01000000
+    __IN_ISDIR = 0x40000000
+    __IN_NONBLOCK = 0o4000
+    __IN_CLOEXEC = 0o2000000
+    __WATCH_MASK = __IN_CLOSE_WRITE | __IN_MOVED_FROM | __IN_MOVED_TO | __IN_CREATE | __IN_DELETE | __IN_ONLYDIR
+    __EVENT_HEADER = struct.Struct("iIII")
+    __POLL_INTERVAL_SECONDS = 0.5
+
+    def __init__(self, root_dir: str, on_changes: Callable[[Set[str]], None], debounce_seconds: float = 5, max_delay_seconds: float = 60, ignored_dirs: List[str] = ()):
+        self.__root_dir = root_dir
+        self.__on_changes = on_changes
+        self.__debounce_seconds = debounce_seconds
+        self.__max_delay_seconds = max_delay_seconds
+        self.__ignored_dirs = [os.path.join(ignored_dir, "") for ignored_dir in ignored_dirs if ignored_dir]
+        self.__libc = None
+        self.__inotify_fd = -1
+        self.__watched_dirs: Dict[int, str] = {}
+        self.__pending_paths: Set[str] = set()
+        self.__first_event_time = 0.0
+        self.__last_event_time = 0.0
+        self.__pending_lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__threads: List[threading.Thread] = []
+
+    @staticmethod
+    def is_supported() -> bool:
+        return sys.platform.startswith("linux")
+
+    def start(self):
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.__inotify_fd = self.__libc.inotify_init1(InotifyWatcher.__IN_NONBLOCK | InotifyWatcher.__IN_CLOEXEC)
+        if self.__inotify_fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "inotify_init1 failed: {}".format(os.strerror(errno)))
+        self.__add_watches_recursive(self.__root_dir)
+        self.__threads = [threading.Thread(target=self.__read_events, name="InotifyReader", daemon=True),
+                          threading.Thread(target=self.__dispatch_changes, name="InotifyDispatcher", daemon=True)]
+        for thread in self.__threads:
+            thread.start()
+        InotifyWatcher.__logger.info("Watching %s directories under %s", len(self.__watched_dirs), self.__root_dir)
+
+    def stop(self, wait: bool = True):
+        """Stops watching. Without wait, returns at once and the threads exit on their own, after the callback being run returns."""
+        self.__stop_event.set()
+        if not self.__threads and self.__inotify_fd >= 0:  # Failed to start, the reader thread would otherwise close it
+            os.close(self.__inotify_fd)
+            self.__inotify_fd = -1
+        if wait:
+            for thread in self.__threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+        InotifyWatcher.__logger.info("Stopped watching %s", self.__root_dir)
+
+    def __add_watches_recursive(self, dir_path: str):
+        for (watch_dir_path, _, _) in os.walk(dir_path):
+            if self.__is_ignored(watch_dir_path):
+                continue
+            watch_descriptor = self.__libc.inotify_add_watch(self.__inotify_fd, os.fsencode(watch_dir_path), InotifyWatcher.__WATCH_MASK)
+            if watch_descriptor < 0:
+                errno = ctypes.get_errno()
+                InotifyWatcher.__logger.error("Unable to watch %s: %s (consider raising fs.inotify.max_user_watches)", watch_dir_path, os.strerror(errno))
+            else:
+                self.__watched_dirs[watch_descriptor] = watch_dir_path
+
+    def __is_ignored(self, path: str) -> bool:
+        path_with_sep = os.path.join(path, "")
+        return any(path_with_sep.startswith(ignored_dir) for ignored_dir in self.__ignored_dirs)
+
+    def __read_events(self):
+        try:
+            self.__read_events_until_stopped()
+        finally:
+            # Closed by this thread, so that it is never closed while select() waits on it
+            os.close(self.__inotify_fd)
+            self.__inotify_fd = -1
+
+    def __read_events_until_stopped(self):
+        while not self.__stop_event.is_set():
+            (readable, _, _) = select.select([self.__inotify_fd], [], [], InotifyWatcher.__POLL_INTERVAL_SECONDS)
+            if not readable:
+                continue
+            try:
+                buffer = os.read(self.__inotify_fd, 65536)
+            except BlockingIOError:
+                continue
+            changed_paths: Set[str] = set()
+            offset = 0
+            while offset < len(buffer):
+                (watch_descriptor, mask, _, name_length) = InotifyWatcher.__EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + InotifyWatcher.__EVENT_HEADER.size:offset + InotifyWatcher.__EVENT_HEADER.size + name_length].rstrip(b"\0")
+                offset += InotifyWatcher.__EVENT_HEADER.size + name_length
+                if mask & InotifyWatcher.__IN_Q_OVERFLOW:
+                    InotifyWatcher.__logger.warning("inotify event queue overflowed, treating %s as changed", self.__root_dir)
+                    changed_paths.add(self.__root_dir)
+                    continue
+                if mask & InotifyWatcher.__IN_IGNORED:
+                    self.__watched_dirs.pop(watch_descriptor, None)
+                    continue
+                if watch_descriptor not in self.__watched_dirs or not name:
+                    continue
+                path = os.path.join(self.__watched_dirs[watch_descriptor], os.fsdecode(name))
+                if self.__is_ignored(path):
+                    continue
+                if (mask & InotifyWatcher.__IN_ISDIR) and (mask & (InotifyWatcher.__IN_CREATE | InotifyWatcher.__IN_MOVED_TO)):
+                    self.__add_watches_recursive(path)
+                elif (mask & InotifyWatcher.__IN_CREATE) and not (mask & InotifyWatcher.__IN_ISDIR):
+                    continue  # Wait for IN_CLOSE_WRITE so that partially written files are not picked up
+                changed_paths.add(path)
+            if changed_paths:
+                with self.__pending_lock:
+                    now = time.monotonic()
+                    if not self.__pending_paths:
+                        self.__first_event_time = now
+                    self.__last_event_time = now
+                    self.__pending_paths.update(changed_paths)
+
+    def __dispatch_changes(self):
+        while not self.__stop_event.wait(InotifyWatcher.__POLL_INTERVAL_SECONDS):
+            with self.__pending_lock:
+                now = time.monotonic()
+                if (not self.__pending_paths or (now - self.__last_event_time < self.__debounce_seconds and now - self.__first_event_time < self.__max_delay_seconds)):
+                    continue
+                changed_paths = self.__pending_paths
+                self.__pending_paths = set()
+            InotifyWatcher.__logger.info("Processing %s changed paths", len(changed_paths))
+            try:
+                self.__on_changes(changed_paths)
+            except:
+                InotifyWatcher.__logger.exception("Failed to process changed paths")
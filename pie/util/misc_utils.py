@@ -1,5 +1,6 @@
 import hashlib
 import logging
+import mmap
 import multiprocessing
 import os
 import shutil
@@ -7,15 +8,25 @@ import subprocess
 import sys
 from logging.handlers import QueueHandler, TimedRotatingFileHandler
 from multiprocessing import Queue
-from typing import List
 
 from appdirs import user_data_dir
 
 from pie.domain import IndexingTask
 
+try:
+    import xxhash
+except ImportError:  # Optional, only needed for the xxh3 hash algorithm
+    xxhash = None
+
 
 class MiscUtils:
     __APP_LOG_FILE_NAME = "application.log"
+    HASH_ALGORITHM_SHA1 = "sha1"  # Used for all hashes stored before the algorithm was recorded
+    HASH_ALGORITHM_BLAKE2B = "blake2b"
+    HASH_ALGORITHM_XXH3 = "xxh3"
+    HASH_ALGORITHM_SAMPLED = "sampled"
+    __HASH_CHUNK_SIZE = 1048576  # 1MB in bytes
+    __HASH_SAMPLE_SIZE = 1048576
 
     __logger = logging.getLogger('MiscUtils')
 
@@ -142,13 +153,42 @@ class MiscUtils:
         os.makedirs(self.__indexing_task.settings.unknown_output_dir, exist_ok=True)
 
     @staticmethod
-    def generate_hash(file_path: str) -> str:
+    def generate_hash(file_path: str, algorithm: str = HASH_ALGORITHM_SHA1) -> str:
         with open(file_path, "rb") as file:
-            file_hash = hashlib.sha1()
-            while chunk := file.read(1048576): # 1MB in bytes
-                file_hash.update(chunk)
+            if algorithm == MiscUtils.HASH_ALGORITHM_SHA1:
+                file_hash = hashlib.sha1()
+                while chunk := file.read(MiscUtils.__HASH_CHUNK_SIZE):
+                    file_hash.update(chunk)
+            elif algorithm == MiscUtils.HASH_ALGORITHM_BLAKE2B or algorithm == MiscUtils.HASH_ALGORITHM_XXH3:
+                file_hash = hashlib.blake2b() if algorithm == MiscUtils.HASH_ALGORITHM_BLAKE2B else xxhash.xxh3_128()
+                if os.fstat(file.fileno()).st_size > 0:  # Empty files cannot be mapped
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                        file_hash.update(file_map)
+            elif algorithm == MiscUtils.HASH_ALGORITHM_SAMPLED:
+                # Size plus head, middle and tail blocks. Detects appended, truncated and most rewritten files without reading everything.
+                file_size = os.fstat(file.fileno()).st_size
+                file_hash = hashlib.blake2b(file_size.to_bytes(8, "little"))
+                sample_size = MiscUtils.__HASH_SAMPLE_SIZE
+                if file_size <= 3 * sample_size:
+                    file_hash.update(file.read())
+                else:
+                    for offset in (0, (file_size - sample_size) // 2, file_size - sample_size):
+                        file.seek(offset)
+                        file_hash.update(file.read(sample_size))
+            else:
+                raise ValueError("Unknown hash algorithm: {}".format(algorithm))
         return file_hash.hexdigest()
 
+    @staticmethod
+    def get_hash_algorithm(configured_algorithm: str) -> str:
+        if configured_algorithm == MiscUtils.HASH_ALGORITHM_XXH3 and xxhash is None:
+            MiscUtils.__logger.warning("xxhash is not installed, using %s instead of %s", MiscUtils.HASH_ALGORITHM_BLAKE2B, MiscUtils.HASH_ALGORITHM_XXH3)
+            return MiscUtils.HASH_ALGORITHM_BLAKE2B
+        if configured_algorithm not in (MiscUtils.HASH_ALGORITHM_SHA1, MiscUtils.HASH_ALGORITHM_BLAKE2B, MiscUtils.HASH_ALGORITHM_XXH3, MiscUtils.HASH_ALGORITHM_SAMPLED):
+            MiscUtils.__logger.warning("Unknown hash algorithm %s, using %s", configured_algorithm, MiscUtils.HASH_ALGORITHM_SHA1)
+            return MiscUtils.HASH_ALGORITHM_SHA1
+        return configured_algorithm
+
     @staticmethod
     def get_abs_resource_path(rel_path: str) -> str:
         base_dir = getattr(sys, '_MEIPASS', os.getcwd())
@@ -212,9 +252,3 @@ class MiscUtils:
             'close_fds': True,
         })
         return ret
-
-    @staticmethod
-    def exec_subprocess(popenargs: List[str], errorMsg: str):
-        results = subprocess.run(popenargs, **MiscUtils.subprocess_args())
-        if results.returncode != 0:
-            raise RuntimeError("{}: CommandLine: {}, Output: {}".format(errorMsg, subprocess.list2cmdline(popenargs), str(results.stderr)))
@@ -1,27 +1,120 @@
+import itertools
 import logging
+import queue
+import sys
+import threading
+import time
+from collections import deque
 from logging import Logger
-from multiprocessing import Event, JoinableQueue, Process, Queue
-from typing import Callable, List
+from multiprocessing import Event, Pipe, Process, Queue, connection
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from pie.util import MiscUtils
 
 
 class PyProcessPool():
+    """Runs tasks in worker processes. Tasks are sent to the workers in chunks and their results come back one message per chunk.
+
+    With chunk_size 0 the chunk size follows the observed task time: slow tasks are sent one by one, while tiny tasks are grouped so
+    that a chunk takes about __TARGET_CHUNK_SECONDS. Only truthy results are sent back, the other tasks are just counted.
+
+    Each worker has its own task pipe and result pipe, and no lock is shared between workers, so a worker killed at any point cannot
+    block the others. Chunks wait in the parent and are sent to workers that are ready and idle. Workers forward messages to the
+    message_handler of the pool, through their result pipe, with ParentQueue.
+
+    Workers are checked while results are waited for. A worker that died is replaced and the chunk it was running is sent again task
+    by task, until its tasks ran out of task_retries. With max_tasks_per_worker, workers are also replaced after running that many
+    tasks, to cap the memory a long lived worker can grow to.
+
+    Workers skip their remaining tasks once stop_event is set. cancel_pending_tasks sets it too, so that the owner of the event can
+    also stop the task being run (clearing it again before the next tasks).
+    """
     __logger: Logger = logging.getLogger('PyProcessPool')
+    __POLL_SECONDS = 0.5
+    __TARGET_CHUNK_SECONDS = 0.1
+    __MAX_CHUNK_SIZE = 256
+    __MAX_CHUNK_DELAY_SECONDS = 0.2  # A partial chunk is sent with the next put once its first task waited that long
 
     def __init__(self, pool_name: str, process_count: int, log_queue: Queue, target: Callable, initializer: Callable = None, initializer_args: List = (),
-                 terminator: Callable = None, terminator_args: List = (), stop_event: Event = None):
-        self.__task_queue = JoinableQueue()
-        self.__result_queue = Queue()
+                 terminator: Callable = None, terminator_args: List = (), stop_event: Event = None, queue_size: int = 0, chunk_size: int = 0,
+                 max_tasks_per_worker: int = 0, task_retries: int = 1, message_handler: Callable = None):
+        self.__pool_name = pool_name
+        self.__queue_size = queue_size  # put() blocks once queue_size chunks are waiting for a worker, 0 means unbounded
+        self.__pending_chunks = deque()
+        self.__dispatch_lock = threading.Lock()
+        self.__dispatch_condition = threading.Condition(self.__dispatch_lock)
+        self.__result_readers: Dict[connection.Connection, _Worker] = {}
+        self.__result_read_lock = threading.Lock()
+        self.__readers_lock = threading.Lock()  # Guards the result readers only, so that workers can be started while results are read
+        self.__message_handler = message_handler
+        self.__put_task_count = 0
+        self.__fixed_chunk_size = chunk_size
+        self.__task_seconds: Optional[float] = None  # Moving average of the time taken by one task
+        self.__chunk_lock = threading.Lock()
+        self.__chunk = []
+        self.__chunk_start_time = 0.0
+        self.__chunk_ids = itertools.count(1)
+        self.__results = deque()
+        # Every task is acknowledged through the result pipes, so that the pool can be waited on without stopping the workers
+        self.__task_count_lock = threading.Lock()
+        self.__submitted_task_count = 0
+        self.__acknowledged_task_count = 0
+        self.__chunks_in_flight: Dict[int, Tuple[List, int]] = {}  # Chunks not acknowledged yet, waiting or sent, with their attempt number
+        self.__task_retries = task_retries
+        self.__stop_event = stop_event
+        self.__closed = False
+        self.__poison_pills_sent = False
+        self.__workers_lock = threading.RLock()
+        self.__last_worker_check_time = 0.0
+        self.__stats = {"crashed_workers": 0, "recycled_workers": 0, "respawned_workers": 0, "requeued_tasks": 0, "failed_tasks": 0}
+        self.__ready_times: List[float] = []
+        self.__startup_seconds: Optional[float] = None
         self.__logger.debug("Initializing worker processes")
-        self.__processes = []
-        for process_num in range(1, process_count + 1):
-            process = PyProcess("{} {}".format(pool_name, process_num), log_queue, target, self.__task_queue, initializer, initializer_args,
-                                terminator, terminator_args, stop_event, self.__result_queue)
-            process.start()
-            self.__processes.append(process)
+        self.__start_time = time.time()
+        self.__process_args = (log_queue, target, initializer, initializer_args, terminator, terminator_args, stop_event)
+        self.__max_tasks_per_worker = max_tasks_per_worker
+        self.__process_nums = itertools.count(1)
+        self.__initial_process_count = process_count
+        self.__workers: List[_Worker] = [self.__start_worker() for _ in range(process_count)]
         self.__logger.info("PyProcessPool initialized")
 
+    def __start_worker(self) -> '_Worker':
+        (task_reader, task_writer) = Pipe(duplex=False)
+        (result_reader, result_writer) = Pipe(duplex=False)
+        process = PyProcess("{} {}".format(self.__pool_name, next(self.__process_nums)), *self.__process_args, task_connection=task_reader,
+                            result_connection=result_writer, max_tasks=self.__max_tasks_per_worker)
+        process.start()
+        task_reader.close()  # Only the worker keeps these ends, so that its pipes break when it exits
+        result_writer.close()
+        worker = _Worker(process, task_writer, result_reader)
+        with self.__readers_lock:
+            self.__result_readers[result_reader] = worker
+        return worker
+
+    @property
+    def process_count(self) -> int:
+        return len(self.__workers)
+
+    @property
+    def pending_task_count(self) -> int:
+        with self.__task_count_lock:
+            return self.__submitted_task_count - self.__acknowledged_task_count
+
+    @property
+    def chunk_size(self) -> int:
+        if self.__fixed_chunk_size > 0:
+            return self.__fixed_chunk_size
+        if self.__task_seconds is None:
+            return 1  # Tasks are sent one by one until their time is known
+        return max(1, min(PyProcessPool.__MAX_CHUNK_SIZE, int(PyProcessPool.__TARGET_CHUNK_SECONDS / max(self.__task_seconds, 1e-6))))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.__task_count_lock:
+            stats = dict(self.__stats)
+            stats.update({"workers": len(self.__workers), "submitted_tasks": self.__submitted_task_count,
+                          "pending_tasks": self.__submitted_task_count - self.__acknowledged_task_count})
+        return stats
+
     def submit_and_wait(self, tasks: List):
         self.submit(tasks)
         return self.wait_and_get_results()
@@ -29,62 +122,401 @@ class PyProcessPool():
     def submit(self, tasks: List):
         total_tasks = len(tasks)
         for task_num, args in enumerate(tasks, start=1):
-            task = (args, "{}/{}".format(task_num, total_tasks))
-            self.__task_queue.put(task)
-        for _ in range(len(self.__processes)):  # Each process will pick up only one poison pill
-            self.__task_queue.put(None)
-
-    def wait_and_get_results(self):
-        self.__task_queue.join()
-        for process in self.__processes:
-            process.terminate()
+            self.put(args, "{}/{}".format(task_num, total_tasks))
+        self.close()
+
+    def put(self, args, task_id: str = None):
+        with self.__chunk_lock:
+            self.__put_task_count += 1
+            if not self.__chunk:
+                self.__chunk_start_time = time.time()
+            self.__chunk.append((args, task_id if task_id is not None else "#{}".format(self.__put_task_count)))
+            with self.__task_count_lock:
+                self.__submitted_task_count += 1
+            if len(self.__chunk) < self.chunk_size and time.time() - self.__chunk_start_time < PyProcessPool.__MAX_CHUNK_DELAY_SECONDS:
+                return
+            chunk = self.__take_chunk()
+        self.__send_chunk(chunk)
+        self.__receive_available_results()  # Keeps the task time current while tasks are being put
+
+    def flush(self):
+        """Sends the tasks waiting for their chunk to fill up."""
+        with self.__chunk_lock:
+            chunk = self.__take_chunk()
+        if chunk:
+            self.__send_chunk(chunk)
+
+    def __take_chunk(self) -> List:
+        chunk = self.__chunk
+        self.__chunk = []
+        return chunk
+
+    def __send_chunk(self, chunk: List, attempt: int = 1, wait: bool = True):
+        chunk_id = next(self.__chunk_ids)
+        with self.__task_count_lock:
+            self.__chunks_in_flight[chunk_id] = (chunk, attempt)
+        with self.__dispatch_condition:
+            self.__pending_chunks.append(chunk_id)
+        self.__dispatch()
+        while wait and self.__queue_size > 0:  # Outside of the locks, as it blocks while too many chunks are waiting for a worker
+            with self.__dispatch_condition:
+                if len(self.__pending_chunks) <= self.__queue_size:
+                    return
+            # Workers only get their next chunk once their results are read, by this thread unless another one is reading them
+            if self.__result_read_lock.acquire(blocking=False):
+                try:
+                    self.__read_results(PyProcessPool.__POLL_SECONDS)
+                finally:
+                    self.__result_read_lock.release()
+            else:
+                with self.__dispatch_condition:
+                    self.__dispatch_condition.wait(PyProcessPool.__POLL_SECONDS)
+            if time.time() - self.__last_worker_check_time >= PyProcessPool.__POLL_SECONDS:
+                self.check_workers()
+
+    def __dispatch(self):
+        # Sends the waiting chunks to the idle workers, one chunk per worker until it acknowledges it
+        with self.__workers_lock, self.__dispatch_condition:
+            for worker in self.__workers:
+                if not self.__pending_chunks:
+                    break
+                if (worker.chunk_id is not None or worker.poison_pill_sent or worker.task_pipe_broken or worker.exited
+                        or (self.__max_tasks_per_worker > 0 and worker.task_count >= self.__max_tasks_per_worker)):
+                    continue  # Busy, exiting or about to be recycled
+                chunk_id = self.__pending_chunks.popleft()
+                with self.__task_count_lock:
+                    (chunk, _) = self.__chunks_in_flight.get(chunk_id, (None, 0))
+                if chunk is None:
+                    continue  # Cancelled, or acknowledged by a worker taken for dead
+                try:
+                    worker.task_pipe.send((chunk_id, chunk))
+                    worker.chunk_id = chunk_id
+                except OSError:  # The worker exited, check_workers replaces it
+                    worker.task_pipe_broken = True
+                    self.__pending_chunks.appendleft(chunk_id)
+            self.__dispatch_condition.notify_all()
+
+    def close(self):
+        """No more tasks will be put. The workers are sent their poison pills by join(), so that chunks sent again still run before them."""
+        self.flush()
+        self.__closed = True
+
+    def get_result(self, timeout: float = None):
+        """Returns the next truthy task result. Raises queue.Empty if none arrives within the timeout, after sending any partial chunk."""
+        while not self.__results:
+            try:
+                self.__receive_results(timeout)
+            except queue.Empty:
+                self.flush()  # Nothing is coming back, so the workers are not kept waiting for a chunk to fill up
+                self.check_workers()
+                raise
+        return self.__results.popleft()
+
+    def __receive_results(self, timeout: float = None):
+        with self.__result_read_lock:
+            if not self.__read_results(timeout):
+                raise queue.Empty
+        if time.time() - self.__last_worker_check_time >= PyProcessPool.__POLL_SECONDS:
+            self.check_workers()
+
+    def __receive_available_results(self):
+        if self.__result_read_lock.acquire(blocking=False):  # Otherwise another thread is reading them
+            try:
+                while self.__read_results(0):
+                    pass
+            finally:
+                self.__result_read_lock.release()
+
+    def __read_results(self, timeout: float = None) -> bool:
+        with self.__readers_lock:
+            result_readers = list(self.__result_readers)
+        if not result_readers:  # Every worker exited and all they sent was read
+            time.sleep(min(timeout, PyProcessPool.__POLL_SECONDS) if timeout is not None else PyProcessPool.__POLL_SECONDS)
+            return False
+        ready_readers = connection.wait(result_readers, timeout)
+        for result_reader in ready_readers:
+            self.__read_message(result_reader)
+        return len(ready_readers) > 0
+
+    def __read_message(self, result_reader: connection.Connection) -> bool:
+        worker = self.__result_readers[result_reader]
+        try:
+            message = result_reader.recv()
+        except (EOFError, OSError):  # The worker exited, messages it sent before were read already
+            with self.__readers_lock:
+                del self.__result_readers[result_reader]
+            result_reader.close()
+            return False
+        message_type = message[0]
+        if message_type == PyProcess.MESSAGE:
+            if self.__message_handler is not None:
+                self.__message_handler(message[1])
+            else:
+                self.__logger.warning("%s sent a message without a handler: %s", worker.process.name, message[1])
+            return True
+        if message_type == PyProcess.READY:
+            worker.ready = True
+            self.__ready_times.append(message[1])
+        elif message_type == PyProcess.RESULT:
+            (_, chunk_id, task_count, chunk_seconds, results) = message
+            with self.__workers_lock:
+                worker.chunk_id = None
+                worker.task_count += task_count
+            self.__add_results(chunk_id, task_count, chunk_seconds, results)
+        self.__dispatch()
+        return True
+
+    def __add_results(self, chunk_id: int, task_count: int, chunk_seconds: float, results: List):
+        with self.__task_count_lock:
+            if self.__chunks_in_flight.pop(chunk_id, None) is None:
+                return  # Sent again after its worker was taken for dead, the first acknowledgement counts
+            self.__acknowledged_task_count += task_count
+        if task_count > 0:
+            task_seconds = chunk_seconds / task_count
+            self.__task_seconds = task_seconds if self.__task_seconds is None else 0.8 * self.__task_seconds + 0.2 * task_seconds
+        self.__results.extend(results)
+
+    def check_workers(self):
+        """Replaces the workers that died or were recycled, and sends the chunk a dead worker was running again."""
+        with self.__workers_lock:
+            self.__last_worker_check_time = time.time()
+            dead_workers = [worker for worker in self.__workers if not worker.exited and worker.process.exitcode is not None]
+            if not dead_workers:
+                return
+            if not self.__result_read_lock.acquire(blocking=False):
+                return  # Another thread is reading, the dead workers are handled by a later check
+            try:
+                for worker in dead_workers:
+                    # Everything the worker sent before exiting is read first, as the chunk it was running may have been acknowledged
+                    while worker.result_reader in self.__result_readers and self.__read_message(worker.result_reader):
+                        pass
+            finally:
+                self.__result_read_lock.release()
+            for worker in dead_workers:
+                worker.exited = True
+                worker.task_pipe.close()
+                process = worker.process
+                if worker.poison_pill_sent and process.exitcode == 0:
+                    continue  # Exited on its poison pill
+                if process.exitcode == PyProcess.RECYCLED_EXIT_CODE:
+                    self.__stats["recycled_workers"] += 1
+                    self.__logger.debug("%s recycled", process.name)
+                else:
+                    self.__stats["crashed_workers"] += 1
+                    self.__logger.error("%s died with exit code %s", process.name, process.exitcode)
+                if not self.__poison_pills_sent:  # Otherwise the other workers are exiting too
+                    self.__workers[self.__workers.index(worker)] = self.__start_worker()
+                    self.__stats["respawned_workers"] += 1
+                if worker.chunk_id is not None:
+                    self.__recover_chunk(worker.chunk_id)
+            self.__dispatch()
+
+    def __recover_chunk(self, chunk_id: int):
+        with self.__task_count_lock:
+            (chunk, attempt) = self.__chunks_in_flight.pop(chunk_id, (None, 0))
+        if chunk is None:
+            return
+        task_ids = [task_id for (_, task_id) in chunk]
+        if attempt > self.__task_retries:
+            self.__logger.error("Giving up on %s %s tasks after %s attempts: %s", len(chunk), self.__pool_name, attempt, task_ids)
+            with self.__task_count_lock:
+                self.__acknowledged_task_count += len(chunk)
+                self.__stats["failed_tasks"] += len(chunk)
+            return
+        self.__logger.warning("Requeueing %s %s tasks: %s", len(chunk), self.__pool_name, task_ids)
+        with self.__task_count_lock:
+            self.__stats["requeued_tasks"] += len(chunk)
+        for task in chunk:  # One by one, so that only the task that kills its worker runs out of retries
+            self.__send_chunk([task], attempt + 1, wait=False)
+
+    def iter_results(self, stop_event: Event = None) -> Iterator:
+        """Yields the truthy results of the tasks submitted so far as their chunks complete, until every task was acknowledged.
+        Workers keep running for later tasks. Once the stop event is set, tasks that did not start yet are cancelled."""
+        # Completion is decided by counting acknowledgements, not by checking if the result pipes are empty. Results are read while
+        # waiting, so a worker never blocks on a full result pipe and nothing in transit is missed.
+        self.flush()
+        while True:
+            while self.__results:
+                yield self.__results.popleft()
+            if self.pending_task_count <= 0:
+                return
+            if stop_event is not None and stop_event.is_set():
+                self.cancel_pending_tasks()
+            try:
+                self.__receive_results(PyProcessPool.__POLL_SECONDS)
+            except queue.Empty:
+                self.check_workers()
+                if not self.is_alive():
+                    self.__logger.error("%s workers exited with %s tasks pending", self.__pool_name, self.pending_task_count)
+                    return
+
+    def wait_for_tasks(self, stop_event: Event = None) -> List:
+        """Waits for all tasks submitted so far and returns their truthy results."""
+        return list(self.iter_results(stop_event))
+
+    def cancel_pending_tasks(self) -> int:
+        # Takes back the tasks that were not sent to a worker yet
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+        cancelled_task_count = 0
+        with self.__dispatch_condition:
+            while self.__pending_chunks:
+                with self.__task_count_lock:
+                    (chunk, _) = self.__chunks_in_flight.pop(self.__pending_chunks.popleft(), (None, 0))
+                cancelled_task_count += len(chunk) if chunk is not None else 0
+            self.__dispatch_condition.notify_all()
+        with self.__chunk_lock:
+            cancelled_task_count += len(self.__take_chunk())
+        with self.__task_count_lock:
+            self.__acknowledged_task_count += cancelled_task_count
+        if cancelled_task_count > 0:
+            self.__logger.info("Cancelled %s pending %s tasks", cancelled_task_count, self.__pool_name)
+        return cancelled_task_count
+
+    def wait_until_ready(self, timeout: float = None) -> Optional[float]:
+        """Waits for every worker to finish its initializer and returns the seconds taken by the slowest, or None on timeout."""
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.__startup_seconds is None:
+            self.__receive_available_results()
+            with self.__workers_lock:
+                workers_ready = all(worker.ready for worker in self.__workers)
+            if workers_ready:
+                self.__startup_seconds = max(self.__ready_times, default=self.__start_time) - self.__start_time
+                self.__logger.info("%s workers ready in %.2fs", self.__pool_name, self.__startup_seconds)
+                break
+            poll_seconds = PyProcessPool.__POLL_SECONDS if deadline is None else min(PyProcessPool.__POLL_SECONDS, deadline - time.time())
+            if poll_seconds <= 0 or not self.is_alive():
+                return None
+            try:
+                self.__receive_results(poll_seconds)
+            except queue.Empty:
+                self.check_workers()
+        return self.__startup_seconds
+
+    def is_alive(self) -> bool:
+        return any(worker.process.is_alive() for worker in self.__workers)
+
+    def join(self, timeout: Optional[float] = None):
+        # Only after close() and once all results were read, otherwise a worker may still be running a chunk
+        if self.__closed and not self.__poison_pills_sent:
+            with self.__workers_lock:
+                self.__poison_pills_sent = True
+                for worker in self.__workers:
+                    try:
+                        worker.task_pipe.send(None)
+                        worker.poison_pill_sent = True
+                    except OSError:
+                        pass  # Exited already
+        for worker in self.__workers:
+            worker.process.join(timeout)
+        self.__receive_available_results()  # Messages sent by the terminators
+        self.__logger.info("PyProcessPool workers exited")
+
+    def wait_and_get_results(self) -> List:
+        # Workers are not terminated, they exit on their poison pill after running the terminator
+        results = self.wait_for_tasks()
+        self.join()
         self.__logger.info("PyProcessPool tasks completed")
-        return MiscUtils.get_all_from_queue(self.__result_queue)
+        return results
+
+
+class _Worker:
+    """What the pool knows about one of its worker processes."""
+
+    def __init__(self, process: 'PyProcess', task_pipe: connection.Connection, result_reader: connection.Connection):
+        self.process = process
+        self.task_pipe = task_pipe
+        self.result_reader = result_reader
+        self.chunk_id: Optional[int] = None  # Sent to the worker and not acknowledged yet
+        self.task_count = 0
+        self.ready = False
+        self.poison_pill_sent = False
+        self.task_pipe_broken = False
+        self.exited = False  # Handled by check_workers
+
+
+class ParentQueue:
+    """Takes the place of a queue of the parent process in a worker. Items put are sent through the result pipe of the worker and
+    handed to the message_handler of its pool, in order with the results of the worker."""
+
+    def put(self, item):
+        PyProcess.send_to_parent(PyProcess.MESSAGE, item)
 
 
 class PyProcess(Process):
     __logger: Logger = logging.getLogger("PyProcess")
+    RECYCLED_EXIT_CODE = 3
+    READY = "ready"
+    RESULT = "result"
+    MESSAGE = "message"
+    __parent_connection: connection.Connection = None
+    __parent_connection_lock = threading.Lock()
 
-    def __init__(self, process_name: str, log_queue: Queue, target: Callable, task_queue: JoinableQueue,
-                 initializer: Callable = None, initializer_args: List = (), terminator: Callable = None, terminator_args: List = (),
-                 stop_event: Event = None, result_queue: Queue = None):
+    def __init__(self, process_name: str, log_queue: Queue, target: Callable, initializer: Callable = None, initializer_args: List = (),
+                 terminator: Callable = None, terminator_args: List = (), stop_event: Event = None, task_connection: connection.Connection = None,
+                 result_connection: connection.Connection = None, max_tasks: int = 0):
         Process.__init__(self, name=process_name)
         self.__process_name = process_name
         self.__log_queue = log_queue
         self.__target = target
-        self.__task_queue = task_queue
         self.__initializer = initializer
         self.__initializer_args = initializer_args
         self.__terminator = terminator
         self.__terminator_args = terminator_args
         self.__stop_event = stop_event
-        self.__result_queue = result_queue
+        self.__task_connection = task_connection
+        self.__result_connection = result_connection
+        self.__max_tasks = max_tasks
+
+    @staticmethod
+    def send_to_parent(*message):
+        with PyProcess.__parent_connection_lock:
+            if PyProcess.__parent_connection is None:
+                raise RuntimeError("Not running in a worker process")
+            PyProcess.__parent_connection.send(message)
 
     def run(self):
         MiscUtils.configure_worker_logger(self.__log_queue)
+        PyProcess.__parent_connection = self.__result_connection
         if self.__initializer:
             initialization_result = self.__initializer(*self.__initializer_args)
         else:
             initialization_result = None
+        PyProcess.send_to_parent(PyProcess.READY, time.time())
 
         self.__logger.debug("Starting task execution loop")
+        task_count = 0
+        recycled = False
         while True:
-            next_task = self.__task_queue.get()
-            if next_task is None:
+            try:
+                next_chunk = self.__task_connection.recv()
+            except EOFError:
+                self.__logger.debug("Task pipe closed by the pool")
+                break
+            if next_chunk is None:
                 self.__logger.debug("Poison pill received")
-                self.__task_queue.task_done()
                 break
-            if (self.__stop_event is None or not self.__stop_event.is_set()):
-                try:
-                    args = next_task[0]
-                    task_id = next_task[1]
-                    result = self.__target(*args, initialization_result, task_id)
-                    if (result and self.__result_queue is not None):
-                        self.__result_queue.put(result)
-                except:
-                    self.__logger.exception("Uncaught exception while executing target")
-            self.__task_queue.task_done()
+            (chunk_id, chunk) = next_chunk
+            chunk_start_time = time.time()
+            results = []
+            for (args, task_id) in chunk:
+                if (self.__stop_event is None or not self.__stop_event.is_set()):
+                    try:
+                        result = self.__target(*args, initialization_result, task_id)
+                        if result:
+                            results.append(result)
+                    except:
+                        self.__logger.exception("Uncaught exception while executing target")
+            # One message acknowledges the whole chunk, falsy results are only counted. Messages sent by its tasks came before it.
+            PyProcess.send_to_parent(PyProcess.RESULT, chunk_id, len(chunk), time.time() - chunk_start_time, results)
+            task_count += len(chunk)
+            if self.__max_tasks > 0 and task_count >= self.__max_tasks:
+                self.__logger.debug("Recycling after %s tasks", task_count)
+                recycled = True
+                break
         self.__logger.debug("Exited task execution loop")
 
         if self.__terminator:
             self.__terminator(*self.__terminator_args, initialization_result)
+        if recycled:
+            sys.exit(PyProcess.RECYCLED_EXIT_CODE)  # Tells the pool to start a replacement
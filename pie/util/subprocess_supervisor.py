@@ -0,0 +1,116 @@
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from logging import Logger
+from multiprocessing import Event
+from typing import Dict, List
+
+from pie.domain import Settings
+
+from .misc_utils import MiscUtils
+
+
+class SubprocessSupervisor:
+    """Runs the external tools (magick, ffmpeg, exiftool) with a timeout and kills them as soon as the stop event is set.
+
+    Each tool runs in its own process group, so that helper processes it starts are killed with it. Output is read while the tool
+    runs, so a tool writing a lot to stderr never blocks on a full pipe. The time taken by every invocation is recorded per tool.
+    """
+    __logger: Logger = logging.getLogger('SubprocessSupervisor')
+    __POLL_SECONDS = 0.2
+    __MAX_ERROR_OUTPUT_LENGTH = 4000
+    MAGICK = "magick"
+    FFMPEG = "ffmpeg"
+    EXIFTOOL = "exiftool"
+    # (Base seconds, seconds per MB of input) of each tool, scaled by Settings.subprocess_timeout_factor
+    __TIMEOUTS = {
+        MAGICK: (120, 10),
+        FFMPEG: (300, 20),
+        EXIFTOOL: (60, 1),
+    }
+    __stop_event: Event = None
+    __stats_lock = threading.Lock()
+    __stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def set_stop_event(stop_event: Event):
+        """Sets the event that kills the running tools of this process. Workers set the stop event of their pool."""
+        SubprocessSupervisor.__stop_event = stop_event
+
+    @staticmethod
+    def is_stopped() -> bool:
+        stop_event = SubprocessSupervisor.__stop_event
+        return stop_event is not None and stop_event.is_set()
+
+    @staticmethod
+    def get_timeout(tool: str, input_size: int = 0, timeout_factor: float = 1.0) -> float:
+        """Returns the seconds a tool may take for an input of input_size bytes, or None if timeouts are disabled by a factor of 0."""
+        if timeout_factor is None or timeout_factor <= 0:
+            return None
+        (base_seconds, seconds_per_mb) = SubprocessSupervisor.__TIMEOUTS[tool]
+        return (base_seconds + seconds_per_mb * (input_size or 0) / 1048576) * timeout_factor
+
+    @staticmethod
+    def run(tool: str, popenargs: List[str], errorMsg: str, timeout: float = None, check: bool = True) -> subprocess.CompletedProcess:
+        """Runs the command and returns its result. Raises RuntimeError if it fails (when check is set), times out or is stopped."""
+        popen_kwargs = MiscUtils.subprocess_args()
+        if Settings.is_platform_win():
+            popen_kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_kwargs['start_new_session'] = True
+        start_time = time.time()
+        deadline = start_time + timeout if timeout is not None else None
+        error = None
+        with subprocess.Popen(popenargs, **popen_kwargs) as process:
+            while True:
+                try:
+                    (stdout, stderr) = process.communicate(timeout=SubprocessSupervisor.__POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    if SubprocessSupervisor.is_stopped():
+                        error = "{}: Stopped".format(errorMsg)
+                    elif deadline is not None and time.time() > deadline:
+                        error = "{}: Timed out after {:.0f}s".format(errorMsg, timeout)
+                    else:
+                        continue
+                    SubprocessSupervisor.__kill_process_group(process)
+                    (stdout, stderr) = process.communicate()
+                    break
+        duration = time.time() - start_time
+        SubprocessSupervisor.record(tool, duration, error is not None)
+        SubprocessSupervisor.__logger.debug("%s exited with %s in %.2fs", tool, process.returncode, duration)
+        if error is None and check and process.returncode != 0:
+            error = errorMsg
+        if error is not None:
+            raise RuntimeError("{}: CommandLine: {}, Output: {}".format(error, subprocess.list2cmdline(popenargs), str(stderr[-SubprocessSupervisor.__MAX_ERROR_OUTPUT_LENGTH:])))
+        return subprocess.CompletedProcess(popenargs, process.returncode, stdout, stderr)
+
+    @staticmethod
+    def __kill_process_group(process: subprocess.Popen):
+        try:
+            if Settings.is_platform_win():
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], **MiscUtils.subprocess_args())
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except (OSError, subprocess.SubprocessError):
+            SubprocessSupervisor.__logger.debug("Failed to kill the process group of %s", process.pid)
+        process.kill()  # In case the process group could not be killed
+
+    @staticmethod
+    def record(tool: str, duration: float, killed: bool):
+        """Adds an invocation to the stats of the tool, also for the tools run outside of run(), like the exiftool daemon."""
+        with SubprocessSupervisor.__stats_lock:
+            tool_stats = SubprocessSupervisor.__stats.setdefault(tool, {'count': 0, 'killed': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            tool_stats['count'] += 1
+            tool_stats['killed'] += 1 if killed else 0
+            tool_stats['total_seconds'] += duration
+            tool_stats['max_seconds'] = max(tool_stats['max_seconds'], duration)
+
+    @staticmethod
+    def get_stats() -> Dict[str, Dict[str, float]]:
+        """Invocation count, kill count, total and max seconds of each tool run by this process."""
+        with SubprocessSupervisor.__stats_lock:
+            return {tool: {key: round(value, 2) for (key, value) in tool_stats.items()} for (tool, tool_stats) in SubprocessSupervisor.__stats.items()}
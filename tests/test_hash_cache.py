@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pie.core import HashCache
+from pie.util import MiscUtils
+
+
+class HashCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__temp_dir = tempfile.mkdtemp()
+        self.__file_path = os.path.join(self.__temp_dir, "img.jpg")
+        with open(self.__file_path, "wb") as file:
+            file.write(b"original")
+
+    def tearDown(self):
+        shutil.rmtree(self.__temp_dir, ignore_errors=True)
+
+    def test_hash_is_cached_under_the_fingerprint_taken_around_the_read(self):
+        (file_hash, new_file_hash) = HashCache.hash_file(self.__file_path, MiscUtils.HASH_ALGORITHM_SHA1)
+        self.assertEqual(MiscUtils.generate_hash(self.__file_path, MiscUtils.HASH_ALGORITHM_SHA1), file_hash)
+        file_stat = os.stat(self.__file_path)
+        self.assertEqual((file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, file_hash),
+                         (new_file_hash.device, new_file_hash.inode, new_file_hash.size, new_file_hash.modification_time_ns, new_file_hash.hash))
+
+    def test_hash_of_a_file_rewritten_while_hashing_is_not_cached(self):
+        generate_hash = MiscUtils.generate_hash
+
+        def generate_hash_then_rewrite(file_path: str, hash_algorithm: str) -> str:
+            file_hash = generate_hash(file_path, hash_algorithm)
+            with open(file_path, "wb") as file:
+                file.write(b"rewritten after the read")
+            return file_hash
+
+        with mock.patch.object(MiscUtils, "generate_hash", side_effect=generate_hash_then_rewrite):
+            (file_hash, new_file_hash) = HashCache.hash_file(self.__file_path, MiscUtils.HASH_ALGORITHM_SHA1)
+        self.assertIsNotNone(file_hash)
+        self.assertIsNone(new_file_hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
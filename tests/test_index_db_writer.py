@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from pie.core import IndexDB, IndexDBWriter
+from pie.domain import MediaFile, ScannedFileType
+
+
+def create_media_file_write(file_path: str) -> tuple:
+    media_file = MediaFile()
+    media_file.file_path = file_path
+    media_file.file_type = ScannedFileType.IMAGE.name
+    media_file.index_time = datetime.now()
+    return (IndexDB.UPSERT_MEDIA_FILE, media_file.to_dict())
+
+
+class IndexDBWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__app_dir = tempfile.mkdtemp()
+        os.chdir(self.__app_dir)  # The IndexDB is kept under app_data in the working directory
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        shutil.rmtree(self.__app_dir, ignore_errors=True)
+
+    def test_failed_write_does_not_drop_the_other_writes_of_its_batch(self):
+        with IndexDBWriter() as db_writer:
+            db_writer.queue.put(create_media_file_write("/library/img1.jpg"))
+            db_writer.queue.put((IndexDB.UPSERT_MEDIA_FILE, {"file_path": "/library/bad.jpg", "no_such_column": 1}))
+            db_writer.queue.put(create_media_file_write("/library/img2.jpg"))
+            self.assertEqual(1, db_writer.flush())
+            self.assertEqual(0, db_writer.flush())  # Failures are only counted by the first flush after them
+        with IndexDB() as indexDB:
+            self.assertEqual(["/library/img1.jpg", "/library/img2.jpg"], sorted(indexDB.get_media_file_summaries_by_path()))
+
+
+if __name__ == "__main__":
+    unittest.main()
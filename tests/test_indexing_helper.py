@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from pie.core import IndexDB, IndexingHelper
+from pie.domain import IndexingTask, MediaFile, ScannedFileType, Settings
+
+
+class IndexingHelperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__app_dir = tempfile.mkdtemp()
+        os.chdir(self.__app_dir)  # The IndexDB is kept under app_data in the working directory
+        self.__library_dir = os.path.join(self.__app_dir, "library")
+        settings = Settings()
+        settings.monitored_dir = self.__library_dir
+        settings.scan_threads = 1
+        settings.use_scan_journal = False
+        self.__indexing_task = IndexingTask()
+        self.__indexing_task.settings = settings
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        shutil.rmtree(self.__app_dir, ignore_errors=True)
+
+    def __create_files(self, *rel_file_paths: str):
+        for rel_file_path in rel_file_paths:
+            file_path = os.path.join(self.__library_dir, rel_file_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as file:
+                file.write(b"image")
+
+    def __create_indexing_helper(self) -> IndexingHelper:
+        return IndexingHelper(self.__indexing_task, multiprocessing.Queue(), multiprocessing.Event())
+
+    def test_files_under_a_directory_that_cannot_be_listed_are_not_swept(self):
+        self.__create_files(os.path.join("a", "img1.jpg"), os.path.join("b", "img2.jpg"), os.path.join("b", "c", "img3.jpg"))
+        unlisted_dir_path = os.path.join(self.__library_dir, "b")
+        scandir = os.scandir
+
+        def scandir_failing_for_unlisted_dir(dir_path):
+            if dir_path == unlisted_dir_path:
+                raise PermissionError(13, "Permission denied", dir_path)
+            return scandir(dir_path)
+
+        with IndexDB() as indexDB:
+            for rel_file_path in (os.path.join("a", "img1.jpg"), os.path.join("a", "deleted.jpg"), os.path.join("b", "img2.jpg"), os.path.join("b", "c", "img3.jpg")):
+                media_file = MediaFile()
+                media_file.file_path = os.path.join(self.__library_dir, rel_file_path)
+                media_file.file_type = ScannedFileType.IMAGE.name
+                media_file.index_time = datetime.now()
+                indexDB.insert_media_file(media_file)
+            indexing_helper = self.__create_indexing_helper()
+            with mock.patch("os.scandir", side_effect=scandir_failing_for_unlisted_dir):
+                (scanned_files, _) = indexing_helper.scan_dirs(indexDB)
+            self.assertEqual([os.path.join(self.__library_dir, "a", "img1.jpg")], [scanned_file.file_path for scanned_file in scanned_files])
+            indexing_helper.remove_slate_files(indexDB, scanned_files)
+            self.assertEqual(sorted(os.path.join(self.__library_dir, rel_file_path) for rel_file_path in (os.path.join("a", "img1.jpg"), os.path.join("b", "img2.jpg"),
+                                                                                                            os.path.join("b", "c", "img3.jpg"))),
+                             sorted(indexDB.get_media_file_summaries_by_path()))
+
+    def test_closing_the_scan_early_does_not_list_the_whole_tree(self):
+        self.__create_files(*[os.path.join("dir{:03d}".format(dir_num), "img.jpg") for dir_num in range(200)])
+        scandir = os.scandir
+        listed_dir_paths = []
+
+        def scandir_recording_dir(dir_path):
+            listed_dir_paths.append(dir_path)
+            return scandir(dir_path)
+
+        with mock.patch("os.scandir", side_effect=scandir_recording_dir):
+            scanned_files = self.__create_indexing_helper().iter_scanned_files()
+            next(scanned_files)
+            scanned_files.close()
+        self.assertLessEqual(len(listed_dir_paths), 1 + 4 * self.__indexing_task.settings.scan_threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from typing import Dict, List
+
+from pie.core import ConversionScheduler, IndexDB, MediaProcessor
+from pie.domain import IndexingTask, MediaFileSummary, ScannedFileType, Settings
+
+
+class RecordingLane:
+    # Records the conversions instead of sending them to workers
+
+    def __init__(self):
+        self.output_rel_file_paths: Dict[str, str] = {}
+
+    def put(self, args, task_id: str = None):
+        (media_file_path, _, output_rel_file_path, _) = args
+        self.output_rel_file_paths[media_file_path] = output_rel_file_path
+
+    def flush(self):
+        pass
+
+    def wait_for_tasks(self, stop_event=None) -> list:
+        return []
+
+
+class RecordingWorkerPoolService:
+
+    def __init__(self):
+        self.lane = RecordingLane()
+
+    def get_lane(self, lane_name: str, job_handler, settings: Settings) -> RecordingLane:
+        return self.lane
+
+    def flush_writes(self) -> int:
+        return 0
+
+
+class MediaProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__app_dir = tempfile.mkdtemp()
+        os.chdir(self.__app_dir)  # The IndexDB is kept under app_data in the working directory
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        shutil.rmtree(self.__app_dir, ignore_errors=True)
+
+    def __convert_streaming(self, media_files: List[MediaFileSummary], run_dir: str) -> Dict[str, str]:
+        # Queues the conversions in the given order, as the streaming pipeline does when the files finish indexing, on a new IndexDB and output directory
+        os.makedirs(run_dir)
+        os.chdir(run_dir)
+        settings = Settings()
+        settings.monitored_dir = "/library"
+        settings.output_dir = os.path.join(run_dir, "output")
+        settings.unknown_output_dir = os.path.join(run_dir, "unknown")
+        settings.output_dir_path_type = "Sort by Date"  # The files captured in the same second collide
+        settings.gpu_count = 0
+        settings.conversion_order = ConversionScheduler.LONGEST_FIRST
+        indexing_task = IndexingTask()
+        indexing_task.settings = settings
+        worker_pool_service = RecordingWorkerPoolService()
+        media_processor = MediaProcessor(indexing_task, multiprocessing.Queue(), multiprocessing.Event(), worker_pool_service)
+        with IndexDB() as indexDB:
+            media_processor.start_conversion(indexDB)
+            for media_file in media_files:
+                media_processor.queue_conversion(MediaFileSummary(*[getattr(media_file, name) for name in MediaFileSummary.__slots__]))
+            media_processor.finish_conversion()
+        return worker_pool_service.lane.output_rel_file_paths
+
+    def test_streaming_output_names_do_not_depend_on_the_indexing_order(self):
+        capture_date = datetime(2020, 1, 2, 3, 4, 5)
+        media_files = [MediaFileSummary("/library/{}/img{}.jpg".format(dir_name, file_num), ScannedFileType.IMAGE.name, None, None, None, None, capture_date, None,
+                                        1000 * file_num, None) for dir_name in ("a", "b") for file_num in range(1, 4)]
+        reversed_media_files = list(reversed(media_files))
+        shuffled_media_files = list(media_files)
+        random.Random(1).shuffle(shuffled_media_files)
+
+        output_rel_file_paths = self.__convert_streaming(media_files, os.path.join(self.__app_dir, "run1"))
+        self.assertEqual(6, len(set(output_rel_file_paths.values())))
+        self.assertEqual(os.path.join("2020", "1", "2", "030405.JPG"), output_rel_file_paths["/library/a/img1.jpg"])
+        self.assertEqual(output_rel_file_paths, self.__convert_streaming(reversed_media_files, os.path.join(self.__app_dir, "run2")))
+        self.assertEqual(output_rel_file_paths, self.__convert_streaming(shuffled_media_files, os.path.join(self.__app_dir, "run3")))
+
+
+if __name__ == "__main__":
+    unittest.main()
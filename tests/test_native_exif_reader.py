@@ -0,0 +1,151 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+
+from pie.core import ExifHelper, NativeExifReader
+from pie.domain import ScannedFile, ScannedFileType
+
+BYTE = 1
+ASCII = 2
+SHORT = 3
+LONG = 4
+RATIONAL = 5
+
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+
+
+def build_tiff(byte_order: str, ifd0: list, exif_ifd: list, gps_ifd: list = None) -> bytes:
+    """Returns a TIFF header with IFD0, the Exif IFD and the GPS IFD. Entries are (tag, type, values), rationals as (numerator, denominator)."""
+    sub_ifds = [(TAG_EXIF_IFD, exif_ifd)] + ([(TAG_GPS_IFD, gps_ifd)] if gps_ifd is not None else [])
+    ifd_offset = 8 + 2 + 12 * (len(ifd0) + len(sub_ifds)) + 4
+    ifd0 = list(ifd0)
+    for (tag, sub_ifd) in sub_ifds:
+        ifd0.append((tag, LONG, [ifd_offset]))
+        ifd_offset += 2 + 12 * len(sub_ifd) + 4
+    data_offset = ifd_offset
+
+    header = (b"II*\x00" if byte_order == "<" else b"MM\x00*") + struct.pack(byte_order + "I", 8)
+    ifd_data = b""
+    value_data = b""
+    for ifd in [ifd0] + [sub_ifd for (_, sub_ifd) in sub_ifds]:
+        ifd_data += struct.pack(byte_order + "H", len(ifd))
+        for (tag, value_type, values) in sorted(ifd):
+            if value_type == ASCII:
+                value = values.encode() + b"\x00"
+                count = len(value)
+            elif value_type == RATIONAL:
+                value = b"".join(struct.pack(byte_order + "II", numerator, denominator) for (numerator, denominator) in values)
+                count = len(values)
+            else:
+                value = struct.pack(byte_order + {BYTE: "B", SHORT: "H", LONG: "I"}[value_type] * len(values), *values)
+                count = len(values)
+            if len(value) <= 4:
+                value_field = value.ljust(4, b"\x00")
+            else:
+                value_field = struct.pack(byte_order + "I", data_offset + len(value_data))
+                value_data += value + (b"\x00" if len(value) % 2 else b"")
+            ifd_data += struct.pack(byte_order + "HHI", tag, value_type, count) + value_field
+        ifd_data += struct.pack(byte_order + "I", 0)
+    return header + ifd_data + value_data
+
+
+def build_jpeg(tiff: bytes, width: int, height: int) -> bytes:
+    app1 = b"Exif\x00\x00" + tiff
+    sof0 = struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    return b"\xFF\xD8" + b"\xFF\xE1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xFF\xC0" + struct.pack(">H", len(sof0) + 2) + sof0 + b"\xFF\xD9"
+
+
+def camera_ifd0(make: str, model: str, orientation: int) -> list:
+    return [(0x010F, ASCII, make), (0x0110, ASCII, model), (0x0112, SHORT, [orientation])]
+
+
+def camera_exif_ifd(lens_info: list, lens_model: str = None, exif_size: tuple = (4000, 3000)) -> list:
+    exif_ifd = [(0x9003, ASCII, "2021:06:15 10:20:30"), (0xA002, LONG, [exif_size[0]]), (0xA003, LONG, [exif_size[1]]), (0xA432, RATIONAL, lens_info)]
+    if lens_model is not None:
+        exif_ifd.append((0xA434, ASCII, lens_model))
+    return exif_ifd
+
+
+def gps_ifd(latitude: list, latitude_ref: str, longitude: list, longitude_ref: str, altitude: tuple = None, altitude_ref: int = None) -> list:
+    entries = [(0x0001, ASCII, latitude_ref), (0x0002, RATIONAL, latitude), (0x0003, ASCII, longitude_ref), (0x0004, RATIONAL, longitude)]
+    if altitude is not None:
+        entries.append((0x0006, RATIONAL, [altitude]))
+    if altitude_ref is not None:
+        entries.append((0x0005, BYTE, [altitude_ref]))
+    return entries
+
+
+# Each fixture covers different GPS coordinate, altitude and LensInfo formats, in both byte orders
+FIXTURES = {
+    "zoom_north_west.jpg": build_jpeg(build_tiff("<", camera_ifd0("Canon", "Canon EOS R5", 6),
+                                                 camera_exif_ifd([(24, 1), (70, 1), (28, 10), (28, 10)], "RF24-70mm F2.8 L IS USM"),
+                                                 gps_ifd([(47, 1), (36, 1), (2790, 100)], "N", [(122, 1), (19, 1), (5712, 100)], "W", (1234, 100), 0)), 4000, 3000),
+    "prime_south_east.jpg": build_jpeg(build_tiff(">", camera_ifd0("NIKON CORPORATION", "NIKON Z 6", 1),
+                                                  camera_exif_ifd([(50, 1), (50, 1), (18, 10), (18, 10)], "NIKKOR Z 50mm f/1.8 S", (6048, 4024)),
+                                                  gps_ifd([(33, 1), (5210, 100), (0, 1)], "S", [(151, 1), (1250, 100), (0, 1)], "E", (35, 10), 1)), 6048, 4024),
+    "decimal_degrees.jpg": build_jpeg(build_tiff("<", camera_ifd0("Apple", "iPhone 12", 1),
+                                                 camera_exif_ifd([(42, 10), (42, 10), (16, 10), (16, 10)], "iPhone 12 back camera 4.2mm f/1.6"),
+                                                 gps_ifd([(476075, 10000), (0, 1), (0, 1)], "N", [(1223321, 10000), (0, 1), (0, 1)], "W", (100, 1), None)), 4032, 3024),
+    "undefined_lens_values.jpg": build_jpeg(build_tiff(">", camera_ifd0("SONY", "ILCE-7M3", 8),
+                                                       camera_exif_ifd([(18, 1), (55, 1), (35, 10), (0, 0)], "E 18-55mm F3.5-5.6 OSS"),
+                                                       gps_ifd([(0, 1), (30, 1), (1, 2)], "N", [(0, 1), (0, 1), (1, 3)], "E", (123456, 1000), 1)), 6000, 4000),
+    "zero_max_focal_length.jpg": build_jpeg(build_tiff("<", camera_ifd0("PENTAX", "PENTAX Q", 3),
+                                                       camera_exif_ifd([(85, 10), (0, 1), (19, 10), (19, 10)], "01 STANDARD PRIME"),
+                                                       gps_ifd([(64, 1), (8, 1), (4567, 1000)], "N", [(21, 1), (56, 1), (1, 1)], "W", (0, 1), 0)), 4000, 3000),
+    "variable_aperture.tif": build_tiff("<", [(0x0100, SHORT, [640]), (0x0101, SHORT, [480])] + camera_ifd0("FUJIFILM", "X-T4", 1),
+                                        camera_exif_ifd([(16, 1), (80, 1), (4, 1), (4, 1)], "XF16-80mmF4 R OIS WR", (640, 480)),
+                                        gps_ifd([(51, 1), (30, 1), (2612, 100)], "N", [(0, 1), (7, 1), (3984, 100)], "W", (2150, 100), 0)),
+}
+
+# Laid out as phones write HEIC files: ftyp, then meta with the item infos, an iloc pointing to the Exif item in mdat and an ispe
+# property with the size of the primary image. Checked in, so that it does not depend on the builders above.
+HEIC_FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "iphone_13_pro.heic")
+
+
+class NativeExifReaderTest(unittest.TestCase):
+
+    def test_heic_fixture(self):
+        self.assertEqual({"FileType": "HEIC", "MIMEType": "image/heic", "ImageWidth": 4032, "ImageHeight": 3024, "ExifImageWidth": 4032, "ExifImageHeight": 3024,
+                          "DateTimeOriginal": "2022:08:20 14:05:09", "Make": "Apple", "Model": "iPhone 13 Pro", "Orientation": "Rotate 90 CW",
+                          "LensModel": "iPhone 13 Pro back triple camera 5.7mm f/1.5", "LensInfo": "1.57-9mm f/1.5-2.8", "GPSLatitude": "48 deg 51' 29.88\" N",
+                          "GPSLongitude": "2 deg 17' 40.20\" E", "GPSAltitude": "35.1 m Above Sea Level", "GPSAltitudeRef": "Above Sea Level"},
+                         NativeExifReader.read_exif(HEIC_FIXTURE_PATH))
+
+
+@unittest.skipIf(shutil.which("exiftool") is None, "exiftool is not installed")
+class NativeExifReaderConformanceTest(unittest.TestCase):
+    """Reads the fixtures with NativeExifReader and with exiftool, which the native reader has to match for every tag read by ExifHelper."""
+    __COMPARED_TAGS = ["FileType", "MIMEType", "ImageWidth", "ImageHeight", "ExifImageWidth", "ExifImageHeight", "DateTimeOriginal", "Make", "Model",
+                       "LensModel", "LensInfo", "GPSAltitude", "GPSAltitudeRef", "GPSLatitude", "GPSLongitude", "Orientation"]
+
+    def setUp(self):
+        self.__fixture_dir = tempfile.mkdtemp()
+        for (file_name, data) in FIXTURES.items():
+            with open(os.path.join(self.__fixture_dir, file_name), "wb") as fixture_file:
+                fixture_file.write(data)
+        shutil.copy(HEIC_FIXTURE_PATH, self.__fixture_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.__fixture_dir, ignore_errors=True)
+
+    def test_native_reader_matches_exiftool(self):
+        file_names = sorted(FIXTURES) + [os.path.basename(HEIC_FIXTURE_PATH)]
+        scanned_files = []
+        for file_name in file_names:
+            extension = os.path.splitext(file_name)[1][1:].upper()
+            scanned_files.append(ScannedFile(self.__fixture_dir, os.path.join(self.__fixture_dir, file_name), extension, ScannedFileType.IMAGE, False, datetime.now(), datetime.now(), None))
+        exiftool_exifs = ExifHelper.get_exif_dicts(shutil.which("exiftool"), scanned_files)
+        for (file_name, scanned_file, exiftool_exif) in zip(file_names, scanned_files, exiftool_exifs):
+            with self.subTest(file_name):
+                native_exif = NativeExifReader.read_exif(scanned_file.file_path)
+                self.assertIsNotNone(native_exif)
+                for tag in NativeExifReaderConformanceTest.__COMPARED_TAGS:
+                    self.assertEqual(exiftool_exif.get(tag), native_exif.get(tag), tag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+
+from pie.util import ParentQueue, PyProcessPool
+
+
+def init_worker(pid_queue: multiprocessing.Queue):
+    pid_queue.put(os.getpid())
+    return ParentQueue()
+
+
+def square_task(number: int, parent_queue: ParentQueue, task_id: str):
+    parent_queue.put(number)
+    return number * number
+
+
+def slow_square_task(number: int, marker_dir: str, parent_queue: ParentQueue, task_id: str):
+    # Leaves a marker when it starts, so that the test knows how far its chunk got
+    open(os.path.join(marker_dir, str(number)), "w").close()
+    time.sleep(0.5)
+    return number * number
+
+
+def setUpModule():
+    # As in main.py, so that workers start from a fresh interpreter like in the app
+    multiprocessing.set_start_method("spawn", force=True)
+
+
+class PyProcessPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__log_queue = multiprocessing.Queue()
+        self.__pid_queue = multiprocessing.Queue()
+        self.__messages = []
+        self.__pool = PyProcessPool(pool_name="TestWorker", process_count=2, log_queue=self.__log_queue, target=square_task, initializer=init_worker,
+                                    initializer_args=(self.__pid_queue,), message_handler=self.__messages.append)
+
+    def tearDown(self):
+        self.__pool.cancel_pending_tasks()
+        self.__pool.close()
+        self.__pool.join(10)
+
+    def test_messages_arrive_before_the_results_of_their_tasks(self):
+        self.__pool.put((3,))
+        self.__pool.put((4,))
+        self.assertEqual([9, 16], sorted(self.__pool.wait_for_tasks()))
+        self.assertEqual([3, 4], sorted(self.__messages))
+
+    def test_pool_completes_after_an_idle_worker_is_killed(self):
+        self.assertIsNotNone(self.__pool.wait_until_ready(30))
+        # Killed while waiting for its next chunk, where a worker of a shared task queue would hold the read lock of the queue
+        os.kill(self.__pid_queue.get(timeout=10), getattr(signal, "SIGKILL", signal.SIGTERM))
+        time.sleep(0.5)
+        for number in range(1, 21):
+            self.__pool.put((number,))
+        self.assertEqual([number * number for number in range(1, 21)], sorted(self.__pool.wait_for_tasks()))
+        stats = self.__pool.get_stats()
+        self.assertEqual(1, stats["crashed_workers"])
+        self.assertEqual(0, stats["failed_tasks"])
+        self.assertEqual(0, stats["pending_tasks"])
+
+    def test_every_task_of_a_chunk_completes_once_after_its_worker_is_killed_while_running_it(self):
+        marker_dir = tempfile.mkdtemp()
+        pid_queue = multiprocessing.Queue()
+        pool = PyProcessPool(pool_name="SlowTestWorker", process_count=1, log_queue=self.__log_queue, target=slow_square_task, initializer=init_worker,
+                             initializer_args=(pid_queue,), chunk_size=5)
+        try:
+            self.assertIsNotNone(pool.wait_until_ready(30))
+            worker_pid = pid_queue.get(timeout=10)
+            for number in range(1, 6):
+                pool.put((number, marker_dir))
+            deadline = time.time() + 30
+            while not os.path.exists(os.path.join(marker_dir, "2")) and time.time() < deadline:
+                time.sleep(0.05)
+            # Killed during the second task of the chunk, after the first one completed without its result being sent yet
+            os.kill(worker_pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            self.assertEqual([number * number for number in range(1, 6)], sorted(pool.wait_for_tasks()))
+            stats = pool.get_stats()
+            self.assertEqual(1, stats["crashed_workers"])
+            self.assertEqual(5, stats["requeued_tasks"])
+            self.assertEqual(0, stats["failed_tasks"])
+            self.assertEqual(0, stats["pending_tasks"])
+        finally:
+            pool.cancel_pending_tasks()
+            pool.close()
+            pool.join(10)
+            shutil.rmtree(marker_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
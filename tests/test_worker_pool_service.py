@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from pie.core import IndexDB, WorkerPoolService
+from pie.domain import MediaFile, ScannedFileType, Settings
+
+
+def convert_job(file_path: str, converted_file_hash: str, indexDB: IndexDB, task_id: str):
+    # Reads the media file like a conversion does, then records a new converted hash through the IndexDBWriter
+    media_file = indexDB.get_by_file_path(file_path)
+    read_hash = media_file.converted_file_hash
+    media_file.converted_file_hash = converted_file_hash
+    indexDB.update_media_file(media_file, ["converted_file_hash"])
+    return (file_path, read_hash)
+
+
+def setUpModule():
+    # As in main.py. Forked workers would inherit the SQLite connections and the IndexDBWriter thread of the test process.
+    multiprocessing.set_start_method("spawn", force=True)
+
+
+class WorkerPoolServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__app_dir = tempfile.mkdtemp()
+        os.chdir(self.__app_dir)  # The IndexDB and the settings are kept under app_data in the working directory
+        self.__log_queue = multiprocessing.Queue()
+        self.__worker_pool_service = WorkerPoolService(self.__log_queue)
+
+    def tearDown(self):
+        self.__worker_pool_service.shutdown()
+        os.chdir(self.__cwd)
+        shutil.rmtree(self.__app_dir, ignore_errors=True)
+
+    def test_warm_worker_reads_rows_changed_since_its_last_job(self):
+        settings = Settings()
+        settings.conversion_workers = 1
+        settings.gpu_count = 0
+        with IndexDB() as indexDB:
+            media_file = MediaFile()
+            media_file.file_path = "/library/img.jpg"
+            media_file.file_type = ScannedFileType.IMAGE.name
+            media_file.index_time = datetime.now()
+            indexDB.insert_media_file(media_file)
+
+            lane = self.__worker_pool_service.get_lane(WorkerPoolService.CPU_CONVERSION_LANE, convert_job, settings)
+            lane.put(("/library/img.jpg", "first"))
+            self.assertEqual([("/library/img.jpg", None)], lane.wait_for_tasks())
+            self.__worker_pool_service.flush_writes()
+
+            # Cleared by the parent, as "Verify Output Files" does for a changed output
+            media_file = indexDB.get_by_file_path("/library/img.jpg")
+            self.assertEqual("first", media_file.converted_file_hash)
+            media_file.converted_file_hash = None
+            indexDB.update_media_file(media_file, ["converted_file_hash"])
+
+            # The same warm worker runs the next job
+            lane = self.__worker_pool_service.get_lane(WorkerPoolService.CPU_CONVERSION_LANE, convert_job, settings)
+            lane.put(("/library/img.jpg", "second"))
+            self.assertEqual([("/library/img.jpg", None)], lane.wait_for_tasks())
+            self.assertEqual(1, self.__worker_pool_service.get_pool_stats()[WorkerPoolService.CPU_CONVERSION_LANE]["workers"])
+
+
+if __name__ == "__main__":
+    unittest.main()